@@ -5,10 +5,11 @@ This file contains basic error handling methods use within my API. The methods a
 """
 from flask import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
+from API_Files import metrics
 
-def error_response(status_code, message=None):
+def error_payload(status_code, message=None):
   """
-  Returns an HTTP status error and an error message, formatted in JSON
+  Returns the body of an HTTP status error as a dictionary, so it can be sent by applications other than Flask
 
   Parameters
   ----------
@@ -20,7 +21,22 @@ def error_response(status_code, message=None):
   payload = {'error': str(status_code)+" : "+HTTP_STATUS_CODES.get(status_code, "Unknown Error")}
   if message:
     payload['message'] = message
-  response = jsonify(payload)
+  return payload
+
+
+def error_response(status_code, message=None):
+  """
+  Returns an HTTP status error and an error message, formatted in JSON, and counts it in the error metrics
+
+  Parameters
+  ----------
+  status_code: int
+    HTTP status code to indicate type of error
+  message: str
+    The error message to be displayed (default is None)
+  """
+  metrics.registry.observeError(status_code)
+  response = jsonify(error_payload(status_code, message))
   response.status_code = status_code
   return response
 
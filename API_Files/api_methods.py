@@ -3,44 +3,123 @@
 This file contains the API methods used to retieve, create, update, and delete contact objects stored in Elastic Search.
 The methods in this file allow users to get all contacts, create new contacts with the specified attributes/values,
 update an existing contact, get a single contacts information, or delete a contact.
+Contacts are read and written through a storage.ContactStore. Methods also accept an Elasticsearch instance, which is
+used through a storage.ElasticStore.
 
 '''
 
 from API_Files.api_errors import bad_request, error_response
-from API_Files import contact
+from API_Files.contact import formatError, missingFieldError
+from API_Files import cache, contact, etags, pagination, projection, reservations, stats, storage, suggest
 
-def getAllContacts(page_size, page, query, es_object):
+# Number of times an update is attempted when the contact is changed by another request at the same time
+max_update_attempts = 3
+
+# Largest number of names that can be looked up at once by getContacts
+max_lookup_names = 1000
+
+# Read-through cache used by getContact. Replace it to change the size, time to live, or shared backend
+contact_cache = cache.ContactCache()
+# Cache of search result pages used by getAllContacts, invalidated by the write generation of each address book
+search_cache = cache.SearchCache()
+# In-memory name index used by suggestContacts for small address books
+name_index = suggest.PrefixIndex()
+# Counters of contacts by email domain and last name initial used by getStats, kept up to date by the writes below
+contact_stats = stats.ContactStats()
+
+def getAllContacts(page_size, page, query, es_object, cursor=None, fields=None, slim=False):
   """
   Retrieve multiple Contact from the AddressBook
 
-  Takes in the number of results to display per page, the specified page to view, and the resulting retrieved contacts based on the provided query
+  Takes in the number of results to display per page, the specified page to view, and the resulting retrieved contacts based on the provided query.
+  Pages are served from search_cache until a contact of the address book is written, and concurrent searches for the same page run once.
+  Every response includes a next cursor when more results are available. Passing it back as cursor continues from the last
+  contact returned, in constant time per page and without the max_result_window limit of page based searches.
+  fields limits the contact fields read and returned, and slim returns a plain list of contacts instead of the Elasticsearch hits.
 
   Parameters
   ----------
   page_size: int
     Number of contacts to display per page
   page: int
-    Results page number to be viewed
+    Results page number to be viewed, starting at 1
   query: str
     keyword or phrase to search through the contacts for. If left empty, defaults to displaying all contacts.
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  cursor: str
+    next value from a previous response. When provided, page_size, page, and query are taken from the cursor (default is None)
+  fields: tuple
+    Included and excluded fields from projection.parseProjection (default is every field)
+  slim: bool
+    Whether to return the results in the slim shape described in projection.py (default is False)
+
+  Raises
+  ------
+  400 Bad Request Error
+    If the cursor is invalid
+    If the requested page is past the max_result_window of the index
 
   Returns
   -------
-  list
-    Returns a list of all query results on the specified page
+  dict
+    Returns the query results on the specified page, and the cursor for the next page under next
   """
-  results = es_object.search(index='addressbook', body=
-    {'from': page, 'size': page_size, "query": {"query_string": {'default_field': '*', 'query': query}}})
+  store = storage.getStore(es_object)
+  if not cursor:
+    return getTaggedContacts(page_size, page, query, store, fields, slim)[0]
+  key = ('cursor', cursor, fields, slim)
+  return search_cache.get(store.bookKey(), key, lambda: _searchContacts(page_size, page, query, store, cursor, fields, slim))
 
-  return results['hits']
+
+def normalizeQuery(query):
+  """
+  Returns the form of a search query used in search cache keys, without surrounding or repeated whitespace
+
+  Parameters
+  ----------
+  query: str
+    keyword or phrase entered by the user
+
+  Returns
+  -------
+  str
+    The query, or * for an empty query, which matches every contact the same way
+  """
+  return ' '.join((query or '').split()) or '*'
+
+
+def contactsWritten(store):
+  """Invalidates the cached search pages of a store's address book, after any of its contacts is created, changed, or deleted"""
+  search_cache.bump(store.bookKey())
+
+
+def _searchContacts(page_size, page, query, store, cursor, fields, slim):
+  # Runs the search of getAllContacts when the page is not cached
+  if cursor:
+    try:
+      state = pagination.decodeCursor(cursor)
+    except ValueError as error:
+      return bad_request(str(error))
+    hits = _searchPage(state['page_size'], state['query'], store, state['search_after'], state['pit_id'], state['use_pit'], fields, slim)
+    return projection.slim(hits) if slim else hits
+
+  offset = (max(page, 1) - 1) * page_size
+  if offset + page_size > pagination.max_result_window:
+    return bad_request("Page "+str(page)+" is past the first "+str(pagination.max_result_window)+" results. Please use the next cursor to page further.")
+
+  hits, _ = store.search(query, page_size, offset, fields=fields, metadata=not slim)
+  hits = _withCursor(hits, query, page_size, None, True, store)
+  return projection.slim(hits) if slim else hits
 
 
 def createContact(fullname, firstname, lastname, phone, email, es_object):
   """
   Creates a new Contact in the AddressBook
 
-  Performs checks on fullname, phone, and email to ensure the parameters were entered correctly, validates
-  that the specified fullname is unique, and creates the JSON formatted contact in Elasticsearch
+  Performs checks on fullname, phone, and email to ensure the parameters were entered correctly, and creates the contact in the store
+  with create-only semantics. In Elasticsearch the contact and the reservations for its phone number and email address are written in a single request,
+  so the fullname, phone number, and email address are checked for uniqueness as part of the write
 
   Parameters
   ----------
@@ -54,14 +133,15 @@ def createContact(fullname, firstname, lastname, phone, email, es_object):
     Phone number for the new contact
   email: str
     Email address for the new contact
-  es_object: Elasticsearch instance
-    Current Elasticsearch instance
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
 
   Raises
   ------
   400 Bad Request Error
     If user does not provide values for fullname, phone, or email
     If inputted fullname is not unique
+    If inputted phone number or email address is already in use by another contact
 
   Returns
   -------
@@ -69,36 +149,62 @@ def createContact(fullname, firstname, lastname, phone, email, es_object):
     Returns a string telling the user that the Contact has been created
   """
   # Check that name, phone, and email are not empty
-  if not fullname:
-    return bad_request("Please provide a unique name for the new Contact.")
-  if not phone:
-    return bad_request("Please provide a phone number for the new Contact.")
-  if not email:
-    return bad_request("Please provide an email for the new Contact.")
-
-  # Validate whether name is unique
-  search = es_object.search(index='addressbook', body={'query': {'match_phrase': {'fullname':fullname}}})
-  if search["hits"]["total"]["value"]>0:
-    return bad_request("Name "+fullname+" is not unique. Please enter a unique name.")
+  error = missingFieldError(fullname, phone, email)
+  if error:
+    return bad_request(error)
 
   # Check that the phone number and email are properly formatted
-  if not contact.formatPhone(phone):
-    return "Phone number not properly formatted. Ensure that the entered phone number contains only numbers and is 10 digits long"
-  if not contact.formatEmail(email):
-    return "Email address not properly formatted. Ensure the entered email follows the format: example@email.com"
-
-  contact_json = contact.toJSON(fullname, firstname, lastname, phone, email) # return contacts data in JSON format
-  es_object.index(index='addressbook', doc_type='contact', id=fullname, body=contact_json)
+  error = formatError(phone, email)
+  if error:
+    return error
+
+  # Create the contact, failing if the name, phone, or email is already in use
+  source = contact.toDict(fullname, firstname, lastname, phone, email)
+  store = storage.getStore(es_object)
+  status, detail = store.create([source])[0]
+  if status == 409:
+    return bad_request(uniquenessError(detail, fullname))
+  if status != 201:
+    return error_response(status, detail)
+  contactsWritten(store)
+  contact_stats.created(store, source)
+  if usesNameIndex(store):
+    name_index.add(source)
   return 'Contact for '+fullname+' has been successfully created.'
 
 
-def updateContact(fullname, firstname, lastname, phone, email, es_object):
+def uniquenessError(field, fullname):
+  """
+  Returns the message shown when a contact field is already in use
+
+  Parameters
+  ----------
+  field: str
+    The field that is not unique, either fullname, phone, or email
+  fullname: str
+    Name of the contact being created or updated
+
+  Returns
+  -------
+  str
+    The error message for the field
+  """
+  if field == 'phone':
+    return "Entered phone number is already in use. Please enter a different phone number"
+  if field == 'email':
+    return "Entered email address is already in use. Please enter a different email address"
+  return "Name "+fullname+" is not unique. Please enter a unique name."
+
+
+def updateContact(fullname, firstname, lastname, phone, email, es_object, if_match=None):
   """
   Updates an existing Contact in the AddressBook
 
   Takes in the fullname of the contact to be updated, a firstname, a lastname, a phone number, and an email address. If the firstname, lastname, phone number, and email address are
-  not provided by the user, then they default to empty strings. Retrieves the original JSON from Elasticsearch, changes the necessary values,
-  then updates the JSON stored in Elasticsearch
+  not provided by the user, then they default to empty strings. Retrieves the original JSON from the store together with its sequence number,
+  then writes only the changed fields, conditioned on the sequence number. A new phone number or email address is checked for uniqueness as part of the write.
+  If another request changed the contact in between, the update is retried up to max_update_attempts times.
+  When if_match is provided, the update is instead only made if the contact still has one of the listed ETags, and is never retried
 
   Parameters
   ----------
@@ -112,60 +218,88 @@ def updateContact(fullname, firstname, lastname, phone, email, es_object):
     New phone number for the contact (default is an empty string)
   email: str
     New email address for the contact (default is an empty string)
-  es_object: Elasticsearch instance
-    Current Elasticsearch instance
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  if_match: str
+    Value of the If-Match header, listing the ETags the contact must have (default is None)
 
   Raises
   ------
   400 Bad Request Error
     If contact cannot be found (fullname does not exist)
     If user provides a phone number or email address already in use by another contact
+  409 Conflict Error
+    If the contact kept changing through every attempt
+  412 Precondition Failed Error
+    If if_match is provided and the contact no longer has one of its ETags
 
   Returns
   -------
   str
     Returns a string telling the user that the Contact has been updated
   """
-  # Check if specified contact exists
-  try:
-    current_json = es_object.get(index='addressbook', doc_type='contact', id=fullname)['_source']
-  except:
-    return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
-
-  # Check if inputted phone number is already in use
-  if phone and phone != current_json['phone'] and es_object.search(index='addressbook', body={'query': {'match_phrase': {"phone":phone}}})['hits']['total']['value']>0:
-    return bad_request("Entered phone number is already in use. Please enter a different phone number")
-  # Check if inputted email address is already in use
-  if email and email != current_json['email'] and es_object.search(index='addressbook', body={'query': {'match_phrase': {"email":email}}})['hits']['total']['value']>0:
-    return bad_request("Entered email address is already in use. Please enter a different email address")
-
   updates = {'firstname': firstname, 'lastname': lastname, 'phone': phone, 'email': email}
-  contact_json = contact.updateJSON(current_json, updates)
-
-  # For elasticsearch in python, the function index() is used to both create new data entries and update existing ones
-  es_object.index(index='addressbook', doc_type='contact', id=fullname, body=contact_json)
+  store = storage.getStore(es_object)
+  for attempt in range(max_update_attempts):
+    # Check if specified contact exists
+    current = store.get(fullname)
+    if current is None:
+      return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+    if if_match is not None and not etags.matches(if_match, etags.contactTag(current), weak=False):
+      return preconditionFailed(fullname)
+
+    changes = contact.changedFields(current['_source'], updates)
+    if not changes:
+      break
+
+    # Only write the changed fields, and only if the contact is unchanged since it was read
+    status, detail = store.update(current, changes)
+    if status == 409 and detail == 'version':
+      if if_match is not None:
+        return preconditionFailed(fullname)
+      continue
+    if status == 404:
+      return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+    if status == 409:
+      return bad_request(uniquenessError(detail, fullname))
+    if status != 200:
+      return error_response(status, detail)
+    contact_cache.invalidate(store.cacheKey(fullname))
+    contactsWritten(store)
+    contact_stats.updated(store, current['_source'], dict(current['_source'], **changes))
+    if ('firstname' in changes or 'lastname' in changes) and usesNameIndex(store):
+      name_index.add(dict(current['_source'], **changes))
+    break
+  else:
+    return error_response(409, "Contact "+fullname+" was changed by another request while being updated. Please try again.")
 
   return "Contact "+fullname+" has been successfully updated."
 
 
-def deleteContact(fullname, es_object):
+def deleteContact(fullname, es_object, if_match=None):
   """
   Delete a Contact from the AddressBook
 
   Takes in the fullname of the contact to be deleted and returns an error if the contact cannot be found.
-  Notifies the user if the the deletion was successful or not.
+  Notifies the user if the the deletion was successful or not. When if_match is provided, the contact is only deleted if it still has one of the listed ETags
 
   Parameters
   ----------
   fullname: str
     Unique fullname of the contact to be deleted
-  es_object: Elasticsearch instance
-    Current Elasticsearch instance
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  if_match: str
+    Value of the If-Match header, listing the ETags the contact must have (default is None)
 
   Raises
   ------
   400 Bad Request Error
     If contact cannot be found (fullname does not exist)
+  409 Conflict Error
+    If the contact kept changing through every attempt
+  412 Precondition Failed Error
+    If if_match is provided and the contact no longer has one of its ETags
 
   Returns
   -------
@@ -173,14 +307,37 @@ def deleteContact(fullname, es_object):
     Returns a string telling the user that the Contact has been deleted
     or returns a string telling the user that the Contact failed to be deleted
   """
+  store = storage.getStore(es_object)
+  current = None
+  if if_match is not None:
+    current = store.get(fullname)
+    if current is None:
+      return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+    if not etags.matches(if_match, etags.contactTag(current), weak=False):
+      return preconditionFailed(fullname)
+  # The statistics counters need the contact to know which counts to lower
+  deleted = current
+  if deleted is None and contact_stats.tracking(store):
+    deleted = store.get(fullname)
 
   try:
-    res = es_object.delete(index="addressbook", doc_type="contact", id=fullname)
-  except:
+    status, detail = store.delete(fullname, current)
+  finally:
+    contact_cache.invalidate(store.cacheKey(fullname))
+    contactsWritten(store)
+    if usesNameIndex(store):
+      name_index.remove(fullname)
+  if status == 409 and detail == 'version':
+    if if_match is not None:
+      return preconditionFailed(fullname)
+    return error_response(409, "Contact "+fullname+" was changed by another request while being deleted. Please try again.")
+  if status == 404:
     return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
 
   # Check to ensure that the contact was properly deleted
-  if res['result'] == 'deleted':
+  if status == 200:
+    if deleted is not None:
+      contact_stats.deleted(store, deleted['_source'])
     return "Contact information for "+fullname+" has successfully been deleted."
   else:
     return "Error: The contact "+fullname+" could not be deleted."
@@ -190,14 +347,24 @@ def getContact(fullname, es_object):
   """
   Retrieve a Contact from the AddressBook
 
-  Takes in the fullname of the contact to be retrieved, gets the contacts information from Elasticsearch and returns it
+  Same as getTaggedContact, without the ETag
+  """
+  return getTaggedContact(fullname, es_object)[0]
+
+
+def getTaggedContact(fullname, es_object):
+  """
+  Retrieve a Contact from the AddressBook
+
+  Takes in the fullname of the contact to be retrieved, gets the contacts information from the store and returns it with its ETag.
+  Contacts are read through contact_cache together with their version, so repeated lookups of the same contact are served without calling the store
 
   Parameters
   ----------
   fullname: str
     Unique fullname of the contact to be deleted
-  es_object: Elasticsearch instance
-    Current Elasticsearch instance
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
 
   Raises
   ------
@@ -206,10 +373,247 @@ def getContact(fullname, es_object):
 
   Returns
   -------
-  str
-    Returns the specified contacts information in JSON format
+  tuple
+    Returns the specified contacts information in JSON format, and its ETag, which is None when the contact cannot be found
+  """
+  store = storage.getStore(es_object)
+  document = contact_cache.get(store.cacheKey(fullname), lambda: cacheEntry(store.get(fullname)))
+  if document is None:
+    return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name."), None
+  return dict(document['_source']), etags.contactTag(document)
+
+
+def getContacts(fullnames, fields, es_object):
+  """
+  Retrieve several Contacts from the AddressBook in one request
+
+  Contacts found in contact_cache are returned from it, and the rest are read from the store with a single call, which for
+  Elasticsearch is one mget. A name that cannot be found is reported in its own result rather than failing the whole request.
+
+  Parameters
+  ----------
+  fullnames: list
+    Unique fullnames of the contacts to retrieve, in the order the results are returned
+  fields: list
+    Contact fields to include in each result, or None for every field
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+
+  Raises
+  ------
+  400 Bad Request Error
+    If no names are provided, a name is not a string, or more than max_lookup_names names are provided
+
+  Returns
+  -------
+  dict
+    Returns a result for each name under docs, with the contact under contact if it was found, and the number of contacts found and missing
+  """
+  if not fullnames or not isinstance(fullnames, list) or not all(isinstance(fullname, str) for fullname in fullnames):
+    return bad_request("Please provide a list of contact names.")
+  if len(fullnames) > max_lookup_names:
+    return bad_request("Please provide at most "+str(max_lookup_names)+" contact names per request.")
+
+  store = storage.getStore(es_object)
+  found = {}
+  for fullname in dict.fromkeys(fullnames):
+    document = contact_cache.get(store.cacheKey(fullname))
+    if document is not None:
+      found[fullname] = document['_source']
+  missing = [fullname for fullname in dict.fromkeys(fullnames) if fullname not in found]
+  for fullname, document in zip(missing, store.getMany(missing, fields)):
+    if document is not None:
+      found[fullname] = document['_source']
+      if not fields:
+        contact_cache.set(store.cacheKey(fullname), cacheEntry(document))
+
+  docs = []
+  for fullname in fullnames:
+    if fullname in found:
+      source = found[fullname]
+      docs.append({'fullname': fullname, 'found': True, 'contact': {field: source[field] for field in (fields or source) if field in source}})
+    else:
+      docs.append({'fullname': fullname, 'found': False,
+        'error': "Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name."})
+  count = sum(1 for doc in docs if doc['found'])
+  return {'docs': docs, 'found': count, 'missing': len(docs) - count}
+
+
+def suggestContacts(prefix, limit, es_object):
   """
+  Suggests Contacts whose names start with the text typed by the user
+
+  Small address books are answered from name_index without calling the store. Larger ones are searched by the store,
+  which for Elasticsearch uses the prefix subfields of fullname, firstname, and lastname. Only names and ids are returned.
+
+  Parameters
+  ----------
+  prefix: str
+    Start of the name typed by the user. Each word must match the start of a word in the contacts names
+  limit: int
+    Maximum number of suggestions
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+
+  Raises
+  ------
+  400 Bad Request Error
+    If prefix is empty
+
+  Returns
+  -------
+  dict
+    Returns the suggested contacts names and ids under suggestions
+  """
+  if not prefix.strip():
+    return bad_request("Please provide the start of a name to complete.")
+
+  store = storage.getStore(es_object)
+  if not usesNameIndex(store):
+    return {'suggestions': store.suggest(prefix, limit)}
+  if name_index.stale():
+    try:
+      name_index.load(store)
+    except Exception:
+      name_index.reset([], enabled=False)
+  if name_index.enabled:
+    return {'suggestions': name_index.search(prefix, limit)}
+  return {'suggestions': store.suggest(prefix, limit)}
+
+
+def getStats(limit, es_object, exact=False):
+  """
+  Counts the Contacts in the AddressBook by email domain and by last name initial
+
+  Answered from contact_stats, whose counters are loaded with an aggregation over the whole address book and changed by
+  createContact, updateContact, and deleteContact. The counters are reconciled with the aggregation once they are older
+  than contact_stats.reconcile_interval, or straight away when exact is set
+
+  Parameters
+  ----------
+  limit: int
+    Number of email domains returned, the most used first
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  exact: bool
+    Whether the counts are read from the store instead of the counters (default is False)
+
+  Returns
+  -------
+  dict
+    Returns the number of contacts under total, the most used email domains under domains with the number of contacts at any
+    other domain under other_domains, the counts of each last name initial under initials, and the age of the counts in seconds under reconciled
+  """
+  return contact_stats.summary(storage.getStore(es_object), limit, exact)
+
+
+def getTaggedContacts(page_size, page, query, es_object, fields=None, slim=False):
+  """
+  Retrieve a page of contacts as getAllContacts, with its ETag
+
+  The tag is made from the store's write marker, read just before the search and cached with the page, so a page served
+  from search_cache costs no request to the store, and its tag never describes contacts newer than the page holds
+
+  Parameters
+  ----------
+  page_size: int
+    Number of contacts to display per page
+  page: int
+    Results page number to be viewed, starting at 1
+  query: str
+    keyword or phrase to search through the contacts for
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  fields: tuple
+    Included and excluded fields from projection.parseProjection (default is every field)
+  slim: bool
+    Whether the results are in the slim shape (default is False)
+
+  Returns
+  -------
+  tuple
+    The page, or an error response, and its weak ETag, which changes whenever a contact is written, or None if the store cannot provide one
+  """
+  store = storage.getStore(es_object)
+  query = normalizeQuery(query)
+  key = ('page', query, page_size, page, fields, slim)
+  entry = search_cache.get(store.bookKey(), key, lambda: _taggedSearch(page_size, page, query, store, fields, slim))
+  if not isinstance(entry, dict):
+    return entry, None
+  return entry['page'], entry['tag']
+
+
+def _taggedSearch(page_size, page, query, store, fields, slim):
+  # Runs the search of getTaggedContacts when the page is not cached. Error responses are returned as they are, so they are not cached
   try:
-    return es_object.get(index='addressbook', doc_type='contact', id=fullname)['_source']
-  except:
-    return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+    tag = etags.searchTag(store.generation(), query, page_size, page, fields, slim)
+  except Exception:
+    tag = None
+  result = _searchContacts(page_size, page, query, store, None, fields, slim)
+  return {'page': result, 'tag': tag} if isinstance(result, dict) else result
+
+
+def usesNameIndex(store):
+  """Checks whether a store's contacts are kept in name_index, which only holds the names of the default address book"""
+  return store.space is reservations.default_space
+
+
+def cacheEntry(document):
+  """
+  Returns the part of a contact document kept in contact_cache: its source and the version its ETag is made from
+
+  Parameters
+  ----------
+  document: dict
+    The contact as returned by ContactStore.get, or None
+
+  Returns
+  -------
+  dict
+    The _source, _seq_no, and _primary_term of the document, or None if document is None
+  """
+  if document is None:
+    return None
+  return {'_source': document['_source'], '_seq_no': document.get('_seq_no'), '_primary_term': document.get('_primary_term')}
+
+
+def preconditionFailed(fullname):
+  """
+  Returns the 412 Precondition Failed error sent when a contact no longer has the ETag given in If-Match
+
+  Parameters
+  ----------
+  fullname: str
+    Name of the contact being changed
+  """
+  return error_response(412, "Contact "+fullname+" has changed since it was read. Please get it again and retry.")
+
+
+def _searchPage(page_size, query, store, search_after, pit_id, use_pit, fields=None, slim=False):
+  # Continue a search from the sort values stored in a cursor, inside a point in time when available
+  store = storage.getStore(store)
+  if not pit_id and use_pit:
+    pit_id = store.openPointInTime()
+    use_pit = pit_id is not None
+
+  if pit_id:
+    try:
+      hits, pit_id = store.search(query, page_size, search_after=search_after, pit_id=pit_id, fields=fields, metadata=not slim)
+      return _withCursor(hits, query, page_size, pit_id, use_pit, store)
+    except Exception:
+      # The point in time has expired, so continue from the same sort values without one
+      pit_id, use_pit = None, False
+
+  hits, _ = store.search(query, page_size, search_after=search_after, fields=fields, metadata=not slim)
+  return _withCursor(hits, query, page_size, None, use_pit, store)
+
+
+def _withCursor(hits, query, page_size, pit_id, use_pit, store):
+  # A full page means there may be more results, so return a cursor starting after its last contact
+  if hits['hits'] and len(hits['hits']) == page_size:
+    hits['next'] = pagination.encodeCursor(query, page_size, hits['hits'][-1]['sort'], pit_id, use_pit)
+  else:
+    hits['next'] = None
+    if pit_id:
+      store.closePointInTime(pit_id)
+  return hits
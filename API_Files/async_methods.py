@@ -0,0 +1,243 @@
+'''Async API Methods
+
+This file contains versions of the API methods in api_methods.py that use an AsyncElasticsearch instance. They are used by
+Address_Book_Async.py, and take the same parameters and return the same messages and error payloads as the methods they mirror.
+Elasticsearch calls that do not depend on each other are made concurrently.
+
+Writes keep the same books as api_methods: the contact cache, search cache, statistics counters, and name index of the app
+process are updated after each create, update, and delete. Like the caches of any other process, those of Address_Book.py
+processes serving the same address book see these writes once their entries expire, after cache_local_ttl, search_cache_ttl,
+and stats_reconcile_interval seconds.
+
+'''
+
+import asyncio
+from elasticsearch.exceptions import ConflictError, NotFoundError
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from API_Files.api_errors import error_payload
+from API_Files import api_methods, contact, pagination, reservations, storage
+
+
+def error_response(status_code, message=None):
+  """
+  Returns an HTTP status error and an error message, formatted in JSON, matching api_errors.error_response
+  """
+  return JSONResponse(error_payload(status_code, message), status_code=status_code)
+
+
+def bad_request(message):
+  """
+  Returns a 400 Bad Request error, accompanied by the provided message, matching api_errors.bad_request
+  """
+  return error_response(400, message)
+
+
+def toResponse(result):
+  """
+  Converts the result of an async API method into a response, the same way Flask converts the result of a view
+
+  Parameters
+  ----------
+  result: str, dict, or Response
+    Value returned by an async API method
+
+  Returns
+  -------
+  Response
+    Strings are returned as text, dictionaries as JSON, and responses unchanged
+  """
+  if isinstance(result, str):
+    return PlainTextResponse(result)
+  if isinstance(result, dict):
+    return Response(contact.dumps(result), media_type='application/json')
+  return result
+
+
+async def getAllContacts(page_size, page, query, es_object, cursor=None):
+  """
+  Retrieve multiple Contact from the AddressBook, as api_methods.getAllContacts
+  """
+  if cursor:
+    try:
+      state = pagination.decodeCursor(cursor)
+    except ValueError as error:
+      return bad_request(str(error))
+    return await _searchPage(state['page_size'], state['query'], es_object, state['search_after'], state['pit_id'], state['use_pit'])
+
+  offset = (max(page, 1) - 1) * page_size
+  if offset + page_size > pagination.max_result_window:
+    return bad_request("Page "+str(page)+" is past the first "+str(pagination.max_result_window)+" results. Please use the next cursor to page further.")
+
+  body = {'from': offset, 'size': page_size, 'sort': pagination.sort, 'query': storage.searchQuery(query)}
+  results = await es_object.search(index='addressbook', body=body)
+  return _withCursor(results['hits'], query, page_size, None, True, es_object)
+
+
+async def createContact(fullname, firstname, lastname, phone, email, es_object):
+  """
+  Creates a new Contact in the AddressBook, as api_methods.createContact
+  """
+  error = api_methods.missingFieldError(fullname, phone, email)
+  if error:
+    return bad_request(error)
+  error = api_methods.formatError(phone, email)
+  if error:
+    return error
+
+  source = contact.toDict(fullname, firstname, lastname, phone, email)
+  status, detail = (await reservations.createContactsAsync([source], es_object))[0]
+  if status == 409:
+    return bad_request(api_methods.uniquenessError(detail, fullname))
+  if status != 201:
+    return error_response(status, detail)
+  store = _bookkeeping(es_object)
+  api_methods.contactsWritten(store)
+  api_methods.contact_stats.created(store, source)
+  api_methods.name_index.add(source)
+  return 'Contact for '+fullname+' has been successfully created.'
+
+
+async def updateContact(fullname, firstname, lastname, phone, email, es_object):
+  """
+  Updates an existing Contact in the AddressBook, as api_methods.updateContact
+
+  The new phone number and email address are reserved concurrently, and the reservation of one is released again if the other is already in use
+  """
+  updates = {'firstname': firstname, 'lastname': lastname, 'phone': phone, 'email': email}
+  claimed = {}
+  for attempt in range(api_methods.max_update_attempts):
+    try:
+      current = await es_object.get(index='addressbook', id=fullname)
+    except NotFoundError:
+      await reservations.releaseAsync(claimed, es_object, fullname=fullname)
+      return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+    current_json = current['_source']
+
+    changes = contact.changedFields(current_json, updates)
+    if not changes:
+      break
+
+    replaced = {field: current_json.get(field, '') for field in reservations.unique_fields
+      if field in changes and reservations.reservationId(field, changes[field]) != reservations.reservationId(field, current_json.get(field, ''))}
+    unclaimed = {field: changes[field] for field in replaced if claimed.get(field) != changes[field]}
+    statuses = await asyncio.gather(*(reservations.claimAsync(fullname, {field: value}, es_object) for field, value in unclaimed.items()))
+    claimed.update({field: unclaimed[field] for field, (status, _) in zip(unclaimed, statuses) if status == 201})
+    for status, detail in statuses:
+      if status != 201:
+        await reservations.releaseAsync(claimed, es_object, fullname=fullname)
+        if status == 409:
+          return bad_request(api_methods.uniquenessError(detail, fullname))
+        return error_response(status, detail)
+
+    try:
+      await es_object.update(index='addressbook', id=fullname, body={'doc': changes},
+        if_seq_no=current['_seq_no'], if_primary_term=current['_primary_term'])
+    except ConflictError:
+      continue
+    store = _bookkeeping(es_object)
+    api_methods.contact_cache.invalidate(store.cacheKey(fullname))
+    api_methods.contactsWritten(store)
+    api_methods.contact_stats.updated(store, current_json, dict(current_json, **changes))
+    await reservations.releaseAsync(replaced, es_object, fullname=fullname)
+    if 'firstname' in changes or 'lastname' in changes:
+      api_methods.name_index.add(dict(current_json, **changes))
+    break
+  else:
+    await reservations.releaseAsync(claimed, es_object, fullname=fullname)
+    return error_response(409, "Contact "+fullname+" was changed by another request while being updated. Please try again.")
+
+  return "Contact "+fullname+" has been successfully updated."
+
+
+async def deleteContact(fullname, es_object):
+  """
+  Delete a Contact from the AddressBook, as api_methods.deleteContact
+  """
+  store = _bookkeeping(es_object)
+  # The statistics counters need the contact to know which counts to lower
+  deleted = None
+  if api_methods.contact_stats.tracking(store):
+    try:
+      deleted = await es_object.get(index='addressbook', id=fullname)
+    except NotFoundError:
+      pass
+
+  try:
+    res = await es_object.delete(index="addressbook", id=fullname)
+  except NotFoundError:
+    return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+  finally:
+    api_methods.contact_cache.invalidate(store.cacheKey(fullname))
+    api_methods.contactsWritten(store)
+    api_methods.name_index.remove(fullname)
+
+  if res['result'] == 'deleted':
+    if deleted is not None:
+      api_methods.contact_stats.deleted(store, deleted['_source'])
+    return "Contact information for "+fullname+" has successfully been deleted."
+  else:
+    return "Error: The contact "+fullname+" could not be deleted."
+
+
+async def getContact(fullname, es_object):
+  """
+  Retrieve a Contact from the AddressBook, as api_methods.getContact
+  """
+  async def load():
+    try:
+      return api_methods.cacheEntry(await es_object.get(index='addressbook', id=fullname))
+    except NotFoundError:
+      return None
+
+  # Loaded through the cache, so a contact changed while it was read is not cached
+  document = await api_methods.contact_cache.getAsync(_bookkeeping(es_object).cacheKey(fullname), load)
+  if document is None:
+    return bad_request("Could not find contact with the name "+fullname+". Please check that the name is correct, or enter a different name.")
+  return dict(document['_source'])
+
+
+def _bookkeeping(es_object):
+  # Store of the default address book, only used for the keys of the caches and counters, so the async client is never called through it
+  return storage.getStore(es_object)
+
+
+async def _searchPage(page_size, query, es_object, search_after, pit_id, use_pit):
+  if not pit_id and use_pit:
+    try:
+      pit_id = (await es_object.open_point_in_time(index='addressbook', keep_alive=pagination.keep_alive))['id']
+    except Exception:
+      pit_id = None
+    use_pit = pit_id is not None
+
+  body = {'size': page_size, 'sort': pagination.sort, 'query': storage.searchQuery(query)}
+  if pit_id:
+    body['pit'] = {'id': pit_id, 'keep_alive': pagination.keep_alive}
+    body['search_after'] = pagination.searchAfter(search_after, pit_id)
+    try:
+      results = await es_object.search(body=body)
+      return _withCursor(results['hits'], query, page_size, results.get('pit_id', pit_id), use_pit, es_object)
+    except Exception:
+      del body['pit']
+      pit_id, use_pit = None, False
+
+  body['search_after'] = search_after[:len(pagination.sort)]
+  results = await es_object.search(index='addressbook', body=body)
+  return _withCursor(results['hits'], query, page_size, None, use_pit, es_object)
+
+
+def _withCursor(hits, query, page_size, pit_id, use_pit, es_object):
+  if hits['hits'] and len(hits['hits']) == page_size:
+    hits['next'] = pagination.encodeCursor(query, page_size, hits['hits'][-1]['sort'], pit_id, use_pit)
+  else:
+    hits['next'] = None
+    if pit_id:
+      # Close the point in time while the response is sent, rather than before it
+      asyncio.ensure_future(_closePointInTime(pit_id, es_object))
+  return hits
+
+
+async def _closePointInTime(pit_id, es_object):
+  try:
+    await es_object.close_point_in_time(body={'id': pit_id})
+  except Exception:
+    pass
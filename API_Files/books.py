@@ -0,0 +1,274 @@
+'''Address Books
+
+This file contains the methods used to host many separate address books on one Elasticsearch cluster.
+Each book has its own contacts, and its own fullnames, phone numbers, and email addresses to keep unique. Requests for a
+book are made under /books/<book>/, for example GET /books/acme/contact/John Doe, and requests without a book use the
+default address book stored in the addressbook index.
+
+Books are stored in one of two places:
+  shared: the book's documents are kept in the addressbook-books and addressbook-reservations-books indices, and read
+    through aliases filtered to the book and routed by its name, so every read, uniqueness check, and search of the book
+    only touches the one shard holding it. New books start here, so thousands of small books cost two indices.
+  dedicated: the book has its own indices. Books are moved here by promoteBook once they grow past a size threshold,
+    usually by running Index_Setup.py rebalance, so a large book stops sharing a shard with the small ones.
+
+Either way, a book is read and written through the aliases addressbook-book-<book> and addressbook-reservations-book-<book>,
+and its document ids are prefixed with <book>/, so moving a book between the two only moves its aliases.
+
+'''
+
+import re
+import threading
+from elasticsearch.exceptions import NotFoundError
+from API_Files import mappings, reservations
+
+# Book names are used in index and alias names, so they are limited to lowercase letters, digits, and underscores
+name_regex = re.compile(r'^[a-z0-9][a-z0-9_]{0,47}$')
+# Number of contacts above which Index_Setup.py rebalance moves a book to its own indices
+default_dedicated_size = 100000
+
+
+class Book(reservations.Space):
+  """
+  Indices and document ids of one address book
+
+  Parameters
+  ----------
+  name: str
+    Name of the book, made of lowercase letters, digits, and underscores
+
+  Raises
+  ------
+  ValueError
+    If the name is not a valid book name
+  """
+
+  def __init__(self, name):
+    if not isinstance(name, str) or not name_regex.match(name):
+      raise ValueError("Invalid address book name "+repr(name)+". Book names can only contain lowercase letters, digits, and underscores, and must be at most 48 characters long.")
+    super().__init__('addressbook-book-'+name, 'addressbook-reservations-book-'+name, name+'/', {'book': name})
+    self.name = name
+
+  def aliases(self):
+    """Returns each alias of the book, with the shared index alias it is created on"""
+    return ((self.contact_index, reservations.book_contact_index), (self.reservation_index, reservations.book_reservation_index))
+
+  def __repr__(self):
+    return 'Book('+repr(self.name)+')'
+
+
+class BookStores:
+  """
+  Contact store of every address book used by the app process, created the first time each book is used
+
+  Parameters
+  ----------
+  factory: function
+    Called with a Book, or None for the default address book, and returns its ContactStore
+  """
+
+  def __init__(self, factory):
+    self.factory = factory
+    self._stores = {}
+    self._lock = threading.Lock()
+
+  def get(self, name=None):
+    """
+    Returns the contact store of a book, creating the book's aliases the first time it is used
+
+    Parameters
+    ----------
+    name: str
+      Name of the book, or None for the default address book
+
+    Raises
+    ------
+    ValueError
+      If the name is not a valid book name
+
+    Returns
+    -------
+    ContactStore
+      The book's store
+    """
+    store = self._stores.get(name)
+    if store is None:
+      with self._lock:
+        store = self._stores.get(name)
+        if store is None:
+          store = self.factory(Book(name) if name is not None else None)
+          if name is not None:
+            store.setup()
+          self._stores[name] = store
+    return store
+
+  def stores(self):
+    """Returns the store of every book used so far"""
+    with self._lock:
+      return list(self._stores.values())
+
+
+def ensureBook(book, es_object):
+  """
+  Creates the aliases of a new book on the shared indices, leaving the aliases of existing books in place
+
+  Parameters
+  ----------
+  book: Book
+    The book
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+
+  Returns
+  -------
+  str
+    shared or dedicated, from placement
+  """
+  for alias, shared in book.aliases():
+    if not es_object.indices.exists_alias(name=alias):
+      index = mappings.currentIndex(shared, es_object) or mappings.ensureIndices(es_object)[shared]
+      es_object.indices.put_alias(index=index, name=alias, body=_sharedAlias(book))
+  return placement(book, es_object)
+
+
+def placement(book, es_object):
+  """
+  Returns where a book is stored
+
+  Parameters
+  ----------
+  book: Book
+    The book
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+
+  Returns
+  -------
+  str
+    shared, dedicated, or None if the book does not exist
+  """
+  index = mappings.currentIndex(book.contact_index, es_object)
+  if index is None:
+    return None
+  return 'shared' if index == mappings.currentIndex(reservations.book_contact_index, es_object) else 'dedicated'
+
+
+def listBooks(es_object):
+  """
+  Returns every book with its placement and number of contacts
+
+  Parameters
+  ----------
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+
+  Returns
+  -------
+  list
+    A dictionary with the name, placement, and contacts of each book, sorted by name
+  """
+  try:
+    aliases = es_object.indices.get_alias(name='addressbook-book-*')
+  except NotFoundError:
+    return []
+  shared = mappings.currentIndex(reservations.book_contact_index, es_object)
+  books = []
+  for index, definition in aliases.items():
+    for alias in definition.get('aliases', {}):
+      name = alias[len('addressbook-book-'):]
+      books.append({'book': name, 'placement': 'shared' if index == shared else 'dedicated',
+        'contacts': es_object.count(index=alias)['count']})
+  return sorted(books, key=lambda book: book['book'])
+
+
+def promoteBook(book, es_object, settings=None, poll_interval=1.0):
+  """
+  Moves a book from the shared indices to indices of its own
+
+  The book's documents are copied into the new indices twice while the book is still written to, the second time only
+  bringing over the changes made during the first. Writes to the shared indices are then blocked while the changes made
+  during the second copy are copied, contacts deleted meanwhile are removed, and the book's aliases are moved in a single
+  atomic update, so no write is lost. Every shared book has its writes rejected for that last step. The book's documents are
+  then removed from the shared indices. The copies are routed by their id rather than the book's name, so a dedicated book
+  is spread over every shard of its indices.
+
+  Parameters
+  ----------
+  book: Book
+    The book
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  settings: dict
+    Settings for the new indices (default is mappings.indexSettings())
+  poll_interval: float
+    Seconds between checks on the progress of the copy (default is 1)
+
+  Raises
+  ------
+  RuntimeError
+    If any copy fails, in which case the book is left in the shared indices and their writes are allowed again
+
+  Returns
+  -------
+  dict
+    The index behind each of the book's aliases
+  """
+  if placement(book, es_object) != 'shared':
+    return {alias: mappings.currentIndex(alias, es_object) for alias, _ in book.aliases()}
+  query = {'term': {'book': book.name}}
+  moves, actions = {}, []
+  for alias, shared in book.aliases():
+    source, target = mappings.currentIndex(shared, es_object), alias+'-v'+str(mappings.mapping_versions[shared])
+    mappings.createIndex(target, shared, es_object, settings)
+    mappings.reindex(alias, target, es_object, query, poll_interval, routing='discard')
+    mappings.reindex(alias, target, es_object, query, poll_interval, routing='discard')
+    moves[alias] = (source, target)
+    actions += [{'remove': {'index': source, 'alias': alias}}, {'add': {'index': target, 'alias': alias}}]
+
+  sources = sorted({source for source, _ in moves.values()})
+  for source in sources:
+    mappings.blockWrites(source, es_object)
+  try:
+    for alias, (_, target) in moves.items():
+      mappings.catchUp(alias, target, es_object, query, poll_interval, routing='discard', source_routing=book.name)
+    es_object.indices.update_aliases(body={'actions': actions})
+  finally:
+    for source in sources:
+      mappings.blockWrites(source, es_object, False)
+
+  # Nothing writes to the shared copies once the aliases are moved
+  for source, _ in moves.values():
+    task = es_object.delete_by_query(index=source, body={'query': query}, routing=book.name, conflicts='proceed', wait_for_completion=False)['task']
+    mappings.waitForTask(task, es_object, poll_interval)
+  return {alias: target for alias, (_, target) in moves.items()}
+
+
+def rebalance(es_object, threshold=default_dedicated_size, settings=None):
+  """
+  Moves every shared book with more than threshold contacts to indices of its own
+
+  Parameters
+  ----------
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  threshold: int
+    Number of contacts above which a book is moved (default is 100000)
+  settings: dict
+    Settings for the new indices (default is mappings.indexSettings())
+
+  Returns
+  -------
+  list
+    Names of the books that were moved
+  """
+  moved = []
+  for entry in listBooks(es_object):
+    if entry['placement'] == 'shared' and entry['contacts'] > threshold:
+      promoteBook(Book(entry['book']), es_object, settings)
+      moved.append(entry['book'])
+  return moved
+
+
+def _sharedAlias(book):
+  # Only the book's documents are visible through the alias, and all of them are kept on the shard chosen by its name
+  return {'filter': {'term': {'book': book.name}}, 'routing': book.name}
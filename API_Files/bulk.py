@@ -0,0 +1,315 @@
+'''Bulk Contact Ingestion
+
+This file contains the methods used to load many contacts into the AddressBook in a single request.
+Records are read lazily from an NDJSON or JSON array body, validated with the same rules used when
+creating a single contact, and written to the contact store in chunks, through the bulk API for Elasticsearch.
+
+'''
+
+import json
+from itertools import islice
+from API_Files import api_methods, contact, storage
+
+# Default number of contacts sent to Elasticsearch per bulk request
+default_chunk_size = 500
+# Upper bound on the chunk size a user can request
+max_chunk_size = 5000
+# Number of bytes read from the request stream at a time
+read_size = 65536
+# Error given for a record that is not valid JSON
+invalid_record = "Record is not valid JSON."
+
+
+class InvalidRecord:
+  """
+  Record of a request body that could not be read, yielded by readRecords in its place so the other records are still created
+
+  Parameters
+  ----------
+  error: str
+    Why the record could not be read
+  """
+
+  def __init__(self, error):
+    self.error = error
+
+  def __repr__(self):
+    return 'InvalidRecord('+repr(self.error)+')'
+
+
+def readRecords(stream, content_type=''):
+  """
+  Lazily reads contact records from a request body
+
+  NDJSON bodies are read one line at a time. JSON array bodies are decoded one element at a time, so
+  neither format requires the full body to be held in memory. If the content type does not say which
+  format is used, the first non-whitespace character of the body decides. A line or element that is not
+  valid JSON is yielded as an InvalidRecord, and reading carries on with the next one.
+
+  Parameters
+  ----------
+  stream: file-like object
+    Binary stream containing the request body
+  content_type: str
+    Content-Type header sent with the request (default is an empty string)
+
+  Raises
+  ------
+  ValueError
+    If the body is not valid UTF-8. The error is raised by the generator when it reaches the invalid bytes
+
+  Returns
+  -------
+  generator
+    Yields each record in the body as a python dictionary, None if a record is not a JSON object, or an InvalidRecord
+    if it is not valid JSON. An unterminated JSON array ends with an InvalidRecord
+  """
+  chunks = _decodeChunks(stream)
+  buffer = ''
+  for chunk in chunks:
+    buffer += chunk
+    if buffer.strip():
+      break
+  buffer = buffer.lstrip()
+
+  if buffer.startswith('[') and 'ndjson' not in content_type:
+    return _readArray(buffer, chunks)
+  return _readLines(buffer, chunks)
+
+
+def validateRecord(record):
+  """
+  Checks a single bulk record against the rules used when creating a single contact
+
+  Parameters
+  ----------
+  record: dict
+    Contact record read from the request body
+
+  Returns
+  -------
+  str
+    The error message for the record, or None if the record is valid
+  """
+  if isinstance(record, InvalidRecord):
+    return record.error
+  if not isinstance(record, dict):
+    return "Each record must be a JSON object."
+  fullname = record.get('fullname') if isinstance(record.get('fullname'), str) else ''
+  return (api_methods.missingFieldError(fullname, record.get('phone'), record.get('email'))
+    or api_methods.formatError(str(record['phone']), str(record['email'])))
+
+
+def bulkCreateContacts(records, es_object, chunk_size=default_chunk_size):
+  """
+  Creates many new Contacts in the AddressBook
+
+  Records are processed in chunks of chunk_size. Each chunk is validated, checked for names repeated
+  within the request, and written with a single call to the store using create-only operations, so
+  the store rejects any fullname, phone number, or email address that is already in use as part of
+  the same request. For Elasticsearch each chunk is one bulk request. A record that fails, including a record that is not
+  valid JSON, does not stop the rest of the batch from being created. If the body cannot be read any further, for example
+  because of invalid UTF-8, the last result holds the error and the records after it are not created.
+
+  Parameters
+  ----------
+  records: iterable
+    Contact records as python dictionaries, usually produced by readRecords
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  chunk_size: int
+    Number of contacts written per bulk request (default is 500)
+
+  Returns
+  -------
+  dict
+    Counts of created and failed contacts, and a per-record result list in request order
+  """
+  store = storage.getStore(es_object)
+  results = []
+  seen = set()
+  records = _readable(records)
+  while True:
+    chunk = list(islice(records, chunk_size))
+    if not chunk:
+      break
+
+    pending = []
+    for record in chunk:
+      item = {'fullname': record.get('fullname', '') if isinstance(record, dict) else ''}
+      results.append(item)
+      error = validateRecord(record)
+      if not error and record['fullname'] in seen:
+        error = "Name "+record['fullname']+" appears more than once in this request."
+      if error:
+        item.update({'status': 400, 'error': error})
+        continue
+      seen.add(record['fullname'])
+      pending.append((item, contact.toDict(record['fullname'], record.get('firstname', ''), record.get('lastname', ''), str(record['phone']), str(record['email']))))
+
+    if pending:
+      statuses = store.create([source for _, source in pending])
+      api_methods.contactsWritten(store)
+      for (item, source), (status, detail) in zip(pending, statuses):
+        _recordResult(item, status, detail)
+        if status == 201:
+          api_methods.contact_stats.created(store, source)
+        if status == 201 and api_methods.usesNameIndex(store):
+          api_methods.name_index.add(source)
+
+  created = sum(1 for item in results if item['status'] == 201)
+  return {'created': created, 'failed': len(results) - created, 'items': results}
+
+
+def parseChunkSize(value):
+  """
+  Clamps a user supplied chunk size to the allowed range
+
+  Parameters
+  ----------
+  value: int
+    Requested chunk size, or None if the user did not provide one
+
+  Returns
+  -------
+  int
+    Chunk size between 1 and max_chunk_size
+  """
+  if not value:
+    return default_chunk_size
+  return max(1, min(value, max_chunk_size))
+
+
+def _recordResult(item, status, detail):
+  if status == 201:
+    item.update({'status': 201, 'result': 'Contact for '+item['fullname']+' has been successfully created.'})
+  elif status == 409:
+    item.update({'status': 400, 'error': api_methods.uniquenessError(detail, item['fullname'])})
+  else:
+    item.update({'status': status, 'error': detail})
+
+
+def _decodeChunks(stream):
+  # Decode the body incrementally so multi-byte characters split across reads are handled
+  buffered = b''
+  while True:
+    data = stream.read(read_size)
+    if not data:
+      break
+    buffered += data
+    try:
+      text = buffered.decode('utf-8')
+      buffered = b''
+    except UnicodeDecodeError as error:
+      if error.start < len(buffered) - 3:
+        raise ValueError("Request body is not valid UTF-8.")
+      text = buffered[:error.start].decode('utf-8')
+      buffered = buffered[error.start:]
+    if text:
+      yield text
+  if buffered:
+    raise ValueError("Request body is not valid UTF-8.")
+
+
+def _readable(records):
+  # Ends the records with an InvalidRecord instead of an error once the body cannot be read any further,
+  # since the chunks before it are already written and the client needs their results
+  records = iter(records)
+  while True:
+    try:
+      record = next(records)
+    except StopIteration:
+      return
+    except ValueError as error:
+      yield InvalidRecord(str(error))
+      return
+    yield record
+
+
+def _readLines(buffer, chunks):
+  while True:
+    *lines, buffer = buffer.split('\n')
+    for line in lines:
+      if line.strip():
+        yield _loadRecord(line)
+    chunk = next(chunks, None)
+    if chunk is None:
+      break
+    buffer += chunk
+  if buffer.strip():
+    yield _loadRecord(buffer)
+
+
+def _readArray(buffer, chunks):
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  position = 1  # skip the opening bracket
+  while True:
+    # Skip whitespace and separators between elements
+    while True:
+      while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+      if position < len(buffer):
+        break
+      buffer, position = _extend(buffer, position, chunks)
+      if buffer is None:
+        yield InvalidRecord("JSON array in request body is not terminated.")
+        return
+    if buffer[position] == ']':
+      break
+    while True:
+      try:
+        record, end = decoder.raw_decode(buffer, position)
+        record = record if isinstance(record, dict) else None
+        break
+      except ValueError:
+        # An element that ends before the end of the buffer is invalid. Otherwise it may only be cut short by the read
+        end = _elementEnd(buffer, position)
+        if end is not None:
+          record = InvalidRecord(invalid_record)
+          break
+        buffer, position = _extend(buffer, position, chunks)
+        if buffer is None:
+          yield InvalidRecord("JSON array in request body is not terminated.")
+          return
+    yield record
+    position = end
+
+
+def _elementEnd(buffer, position):
+  # Returns the position of the comma or bracket ending the array element starting at position, or None if it is not in the buffer
+  depth, in_string, escaped = 0, False, False
+  for end in range(position, len(buffer)):
+    char = buffer[end]
+    if in_string:
+      if escaped:
+        escaped = False
+      elif char == '\\':
+        escaped = True
+      elif char == '"':
+        in_string = False
+    elif char == '"':
+      in_string = True
+    elif char in '[{':
+      depth += 1
+    elif char in ']}' and depth > 0:
+      depth -= 1
+    elif char in ',]' and depth == 0:
+      return end
+  return None
+
+
+def _extend(buffer, position, chunks):
+  # Drop consumed text and append the next chunk, returning None for the buffer once the body is exhausted
+  chunk = next(chunks, None)
+  if chunk is None:
+    return None, 0
+  return buffer[position:] + chunk, 0
+
+
+def _loadRecord(line):
+  try:
+    record = json.loads(line)
+  except ValueError:
+    return InvalidRecord(invalid_record)
+  return record if isinstance(record, dict) else None
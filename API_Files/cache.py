@@ -0,0 +1,466 @@
+'''Contact Cache
+
+This file contains the read-through cache used in front of single contact lookups. Contacts are kept in a bounded
+in-process LRU cache, with each entry expiring after a time to live. An optional shared backend can sit behind the
+local cache so that several application processes reuse each others lookups. MemoryBackend is a local stand-in for
+a shared backend, and RedisBackend stores entries in Redis when the redis package is installed.
+
+Writes to a contact must call invalidate so that later reads go back to Elasticsearch. A contact read while it is
+invalidated is not cached, so the old contact is never stored after the write. invalidate only reaches the local cache of
+the process making the write, so other processes serve the old contact from their local cache for up to local_ttl seconds.
+The shared backend is cleared by invalidate, but a read in another process that started before the write can still store
+the old contact in it, where it is served for up to ttl seconds.
+
+SearchCache holds pages of search results, bounded by the memory they take, and is invalidated by a write generation kept
+for each address book. Writes to any contact of a book must call bump so that later searches of the book go back to Elasticsearch.
+
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from API_Files import contact
+
+# Default maximum number of contacts held in the local cache
+default_max_size = 10000
+# Default number of seconds a cached contact is served before it is read again
+default_ttl = 60
+# Number of seconds contacts are kept in the local cache when a shared backend holds them for longer
+default_local_ttl = 1
+# Default memory, in bytes of serialized results, held by the search cache
+default_search_bytes = 16 * 1024 * 1024
+# Default number of seconds a cached search page is served, which bounds how long writes made by other app processes go unseen
+default_search_ttl = 10
+
+
+class LRUCache:
+  """
+  Bounded in-process cache that evicts the least recently used entry and expires entries after a time to live
+
+  Attributes
+  ----------
+  max_size: int
+    Maximum number of entries held
+  ttl: float
+    Number of seconds an entry is served for
+  hits, misses, evictions, expirations: int
+    Counters used to size the cache
+  """
+
+  def __init__(self, max_size=default_max_size, ttl=default_ttl, clock=time.monotonic):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.clock = clock
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """Returns the cached value for key, or None if it is missing or expired"""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      value, expires = entry
+      if expires <= self.clock():
+        del self._entries[key]
+        self.expirations += 1
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def set(self, key, value):
+    """Stores value under key, evicting the least recently used entries if the cache is full"""
+    if self.max_size <= 0:
+      return
+    with self._lock:
+      self._entries[key] = (value, self.clock() + self.ttl)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_size:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+
+  def delete(self, key):
+    """Removes key from the cache if it is present"""
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    """Removes every entry from the cache"""
+    with self._lock:
+      self._entries.clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+
+class MemoryBackend:
+  """
+  In-memory stand-in for a shared cache backend, with the same interface as RedisBackend
+  """
+
+  def __init__(self, clock=time.monotonic):
+    self.clock = clock
+    self._entries = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None or entry[1] <= self.clock():
+        self._entries.pop(key, None)
+        return None
+      return contact.loads(entry[0])
+
+  def set(self, key, value, ttl):
+    with self._lock:
+      self._entries[key] = (contact.dumps(value), self.clock() + ttl)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+
+class RedisBackend:
+  """
+  Shared cache backend storing entries in Redis
+
+  Parameters
+  ----------
+  url: str
+    Redis connection url, for example redis://localhost:6379/0
+  prefix: str
+    Prefix added to every key (default is addressbook:contact:)
+  """
+
+  def __init__(self, url, prefix='addressbook:contact:'):
+    try:
+      import redis
+    except ImportError:
+      raise ImportError("The redis package is required to use RedisBackend. Install it with pip install redis")
+    self.client = redis.Redis.from_url(url)
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix+key)
+    return contact.loads(value) if value is not None else None
+
+  def set(self, key, value, ttl):
+    self.client.set(self.prefix+key, contact.dumps(value), ex=max(int(ttl), 1))
+
+  def delete(self, key):
+    self.client.delete(self.prefix+key)
+
+
+class ContactCache:
+  """
+  Read-through cache for contacts, made of a local LRUCache and an optional shared backend
+
+  Parameters
+  ----------
+  max_size: int
+    Maximum number of contacts held in the local cache (default is 10000). A size of 0 disables the local cache
+  ttl: float
+    Number of seconds a contact is served from the cache (default is 60)
+  shared: MemoryBackend or RedisBackend
+    Shared backend checked when the local cache misses (default is None)
+  local_ttl: float
+    Number of seconds a contact is served from the local cache, which bounds how long writes made by other processes go
+    unseen (default is ttl without a shared backend, and 1 with one, so the shared backend is read again soon after a write)
+  """
+
+  def __init__(self, max_size=default_max_size, ttl=default_ttl, shared=None, clock=time.monotonic, local_ttl=None):
+    if local_ttl is None:
+      local_ttl = min(ttl, default_local_ttl) if shared is not None else ttl
+    self.local = LRUCache(max_size, min(ttl, local_ttl), clock)
+    self.ttl = ttl
+    self.shared = shared
+    self.shared_hits = 0
+    self.shared_misses = 0
+    # Count of invalidations, and the count when each key being loaded was last invalidated
+    self._generation = 0
+    self._invalidated = {}
+    self._loading = {}
+    self._lock = threading.Lock()
+
+  def get(self, key, loader=None):
+    """
+    Returns the contact cached under key, calling loader to read it when it is not cached
+
+    Parameters
+    ----------
+    key: str
+      The contacts fullname
+    loader: function
+      Called with no arguments on a miss. Returns the contact, or None if it does not exist (default is None)
+
+    Returns
+    -------
+    dict
+      The cached or loaded contact, or None
+    """
+    value = self.local.get(key)
+    if value is not None:
+      return value
+
+    if self.shared is not None:
+      value = self.shared.get(key)
+      if value is not None:
+        self.shared_hits += 1
+        self.local.set(key, value)
+        return value
+      self.shared_misses += 1
+
+    if loader is None:
+      return None
+    started = self._startLoad(key)
+    value = None
+    try:
+      value = loader()
+    finally:
+      self._finishLoad(key, started, value)
+    return value
+
+  async def getAsync(self, key, loader=None):
+    """
+    Returns the contact cached under key as get, awaiting loader to read it when it is not cached
+
+    Parameters
+    ----------
+    key: str
+      The contacts fullname
+    loader: function
+      Called with no arguments on a miss. Returns an awaitable of the contact, or of None if it does not exist (default is None)
+
+    Returns
+    -------
+    dict
+      The cached or loaded contact, or None
+    """
+    value = self.get(key)
+    if value is not None or loader is None:
+      return value
+    started = self._startLoad(key)
+    try:
+      value = await loader()
+    finally:
+      self._finishLoad(key, started, value)
+    return value
+
+  def set(self, key, value):
+    """Stores a contact in the local cache and the shared backend"""
+    with self._lock:
+      self._set(key, value)
+
+  def invalidate(self, key):
+    """Removes a contact from the local cache and the shared backend after it is changed or deleted"""
+    with self._lock:
+      self._generation += 1
+      if key in self._loading:
+        self._invalidated[key] = self._generation
+      self.local.delete(key)
+      if self.shared is not None:
+        self.shared.delete(key)
+
+  def stats(self):
+    """
+    Returns the cache counters
+
+    Returns
+    -------
+    dict
+      Current size, capacity, and hit, miss, eviction, and expiration counts
+    """
+    stats = {'size': len(self.local), 'max_size': self.local.max_size, 'ttl': self.ttl, 'local_ttl': self.local.ttl,
+      'hits': self.local.hits, 'misses': self.local.misses,
+      'evictions': self.local.evictions, 'expirations': self.local.expirations}
+    if self.shared is not None:
+      stats['shared_hits'] = self.shared_hits
+      stats['shared_misses'] = self.shared_misses
+    return stats
+
+  def _startLoad(self, key):
+    # Records a load of key, returning the invalidation count it started at
+    with self._lock:
+      self._loading[key] = self._loading.get(key, 0) + 1
+      return self._generation
+
+  def _finishLoad(self, key, started, value):
+    with self._lock:
+      # A contact invalidated while it was read may be the old one, so it is returned but not cached
+      fresh = self._invalidated.get(key, -1) < started
+      self._loading[key] -= 1
+      if not self._loading[key]:
+        del self._loading[key]
+        self._invalidated.pop(key, None)
+      if value is not None and fresh:
+        self._set(key, value)
+
+  def _set(self, key, value):
+    # Called with the lock held, so an invalidate cannot run between the check of a load and its store
+    self.local.set(key, value)
+    if self.shared is not None:
+      self.shared.set(key, value, self.ttl)
+
+
+class SearchCache:
+  """
+  Cache of search result pages with least recently used eviction, bounded by the size of the serialized results
+
+  Each page is cached under the write generation of its address book, so a bump makes every earlier page of the book miss,
+  and the stale pages are evicted as the least recently used. When several requests miss the same page at once, only
+  the first runs the search and the others wait for its result.
+
+  Parameters
+  ----------
+  max_bytes: int
+    Maximum size of the cached results in bytes (default is 16 MiB). A size of 0 disables the cache
+  ttl: float
+    Number of seconds a page is served from the cache (default is 10)
+
+  Attributes
+  ----------
+  hits, misses, collapsed, evictions, expirations: int
+    Counters used to size the cache. collapsed counts the misses that waited for another request's search
+  """
+
+  def __init__(self, max_bytes=default_search_bytes, ttl=default_search_ttl, clock=time.monotonic):
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self.clock = clock
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.collapsed = 0
+    self.evictions = 0
+    self.expirations = 0
+    self._entries = OrderedDict()
+    self._generations = {}
+    self._loading = {}
+    self._lock = threading.Lock()
+
+  def get(self, book, key, loader):
+    """
+    Returns the cached page for key, calling loader to search when it is not cached
+
+    Parameters
+    ----------
+    book: tuple
+      Address book searched, from ContactStore.bookKey
+    key: tuple
+      Normalized search parameters that select the page
+    loader: function
+      Called with no arguments on a miss. Returns the page, or an error response, which is not cached
+
+    Returns
+    -------
+    dict
+      A copy of the cached page, or the result of loader
+    """
+    if self.max_bytes <= 0:
+      return loader()
+    with self._lock:
+      generation = self._generations.get(book, 0)
+      key = (book, generation) + tuple(key)
+      entry = self._entries.get(key)
+      if entry is not None:
+        if entry[1] > self.clock():
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return contact.loads(entry[0])
+        self._remove(key)
+        self.expirations += 1
+      flight = self._loading.get(key)
+      if flight is None:
+        flight = self._loading[key] = _Flight()
+        self.misses += 1
+        leader = True
+      else:
+        self.collapsed += 1
+        leader = False
+
+    if not leader:
+      data = flight.wait()
+      return contact.loads(data) if data is not None else loader()
+
+    data = shared = None
+    try:
+      value = loader()
+      if isinstance(value, dict):
+        data = contact.dumps(value)
+      with self._lock:
+        # A page searched while the book was written may already be stale, so it is only returned to its own request,
+        # and the requests waiting for it, which may have arrived after the write, run their own search
+        if data is not None and self._generations.get(book, 0) == generation:
+          shared = data
+          if len(data) <= self.max_bytes:
+            self._store(key, data)
+      return value
+    finally:
+      with self._lock:
+        self._loading.pop(key, None)
+      flight.finish(shared)
+
+  def bump(self, book):
+    """Increases the write generation of an address book, after any of its contacts is created, changed, or deleted"""
+    with self._lock:
+      self._generations[book] = self._generations.get(book, 0) + 1
+
+  def generation(self, book):
+    """Returns the write generation of an address book"""
+    with self._lock:
+      return self._generations.get(book, 0)
+
+  def clear(self):
+    """Removes every page from the cache"""
+    with self._lock:
+      self._entries.clear()
+      self.bytes = 0
+
+  def stats(self):
+    """
+    Returns the cache counters
+
+    Returns
+    -------
+    dict
+      Current number of pages and bytes, capacity, and hit, miss, collapsed, eviction, and expiration counts
+    """
+    with self._lock:
+      return {'size': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'ttl': self.ttl,
+        'hits': self.hits, 'misses': self.misses, 'collapsed': self.collapsed,
+        'evictions': self.evictions, 'expirations': self.expirations}
+
+  def _store(self, key, data):
+    self._remove(key)
+    self._entries[key] = (data, self.clock() + self.ttl)
+    self.bytes += len(data)
+    while self.bytes > self.max_bytes:
+      self._remove(next(iter(self._entries)))
+      self.evictions += 1
+
+  def _remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self.bytes -= len(entry[0])
+
+
+class _Flight:
+  # Search in progress for a missed page, which requests missing the same page wait for
+  def __init__(self):
+    self._done = threading.Event()
+    self._data = None
+
+  def wait(self):
+    self._done.wait()
+    return self._data
+
+  def finish(self, data):
+    self._data = data
+    self._done.set()
@@ -0,0 +1,114 @@
+'''Response Compression
+
+This file contains the methods used to compress response bodies with the encoding the client prefers in its
+Accept-Encoding header. Brotli is used when the brotli package is installed and the client accepts it, and gzip otherwise.
+Bodies smaller than min_bytes, and streamed responses such as exports, are sent uncompressed. A compressed body has the
+encoding added to its strong ETag, as described in etags.py.
+
+'''
+
+import gzip
+from API_Files import etags
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+# Responses smaller than this many bytes are not worth compressing
+default_min_bytes = 1024
+# Compression levels, chosen for speed over size since responses are compressed on every request
+gzip_level = 5
+brotli_quality = 4
+
+# Content types that are compressed
+compressible_types = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+
+def chooseEncoding(accept_encoding):
+  """
+  Chooses the content encoding of a response from the request's Accept-Encoding header
+
+  Parameters
+  ----------
+  accept_encoding: str
+    Value of the Accept-Encoding header, such as gzip, deflate, br or br;q=1.0, gzip;q=0.5
+
+  Returns
+  -------
+  str
+    br or gzip, or None to send the body uncompressed
+  """
+  weights = {}
+  for part in (accept_encoding or '').split(','):
+    name, _, parameters = part.strip().partition(';')
+    weight = 1.0
+    parameters = parameters.strip()
+    if parameters.startswith('q='):
+      try:
+        weight = float(parameters[2:])
+      except ValueError:
+        weight = 0.0
+    if name:
+      weights[name.strip().lower()] = weight
+  candidates = [encoding for encoding in (('br',) if brotli is not None else ()) + ('gzip',)
+    if weights.get(encoding, weights.get('*', 0.0)) > 0]
+  if not candidates:
+    return None
+  return max(candidates, key=lambda encoding: weights.get(encoding, weights.get('*', 0.0)))
+
+
+def compress(data, encoding):
+  """
+  Compresses a response body
+
+  Parameters
+  ----------
+  data: bytes
+    The uncompressed body
+  encoding: str
+    br or gzip, from chooseEncoding
+
+  Returns
+  -------
+  bytes
+    The compressed body
+  """
+  if encoding == 'br':
+    return brotli.compress(data, quality=brotli_quality)
+  return gzip.compress(data, compresslevel=gzip_level)
+
+
+def compressResponse(response, accept_encoding, min_bytes=default_min_bytes):
+  """
+  Compresses a Flask response in place when the client accepts it and the body is large enough
+
+  Parameters
+  ----------
+  response: flask.Response
+    The response to send
+  accept_encoding: str
+    Value of the request's Accept-Encoding header
+  min_bytes: int
+    Smallest body that is compressed (default is 1024)
+
+  Returns
+  -------
+  flask.Response
+    The same response, with a compressed body, Content-Encoding header, and the ETag of that encoding when it was compressed
+  """
+  if response.mimetype not in compressible_types:
+    return response
+  response.vary.add('Accept-Encoding')
+  if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+      or 'Content-Encoding' in response.headers):
+    return response
+  encoding = chooseEncoding(accept_encoding)
+  data = response.get_data()
+  if encoding is None or len(data) < min_bytes:
+    return response
+  response.set_data(compress(data, encoding))
+  response.headers['Content-Encoding'] = encoding
+  if 'ETag' in response.headers:
+    response.headers['ETag'] = etags.encodedTag(response.headers['ETag'], encoding)
+  return response
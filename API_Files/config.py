@@ -0,0 +1,198 @@
+'''Address Book Configuration
+
+This file contains the settings used to create the Address Book app and its Elasticsearch client.
+Every setting has a default, which can be replaced by a JSON configuration file, then by environment variables,
+then by values passed to Address_Book.create_app. The configuration file is read from ADDRESSBOOK_CONFIG when it is set,
+and each setting can be set with an environment variable made of ADDRESSBOOK_ and its name in capitals, for example
+ADDRESSBOOK_HOSTS=es1:9200,es2:9200 or ADDRESSBOOK_REQUEST_TIMEOUT=5.
+
+Settings:
+  hosts: Elasticsearch nodes, as a comma separated string or a list of host:port or URLs
+  storage: elasticsearch, or memory to keep contacts in the app process
+  pool_maxsize: connections kept open to each node by each app process
+  request_timeout: seconds to wait for Elasticsearch to answer a request
+  connect_timeout: seconds to wait for a connection to a node to open
+  max_retries: times a failed request is retried on another node
+  retry_on_timeout: whether requests that time out are retried on another node
+  retry_on_status: comma separated HTTP statuses that are retried on another node
+  dead_timeout: seconds a failed node is left out before it is tried again
+  http_compress: whether request bodies are compressed with gzip
+  sniff_on_start: whether the nodes of the cluster are discovered when the client is created
+  sniff_on_connection_fail: whether the nodes are discovered again when a node fails
+  sniffer_timeout: seconds between node discovery, or 0 to only discover nodes on start or failure
+  cache_size: contacts held in the contact cache by each app process
+  cache_ttl: seconds contacts are cached for
+  cache_local_ttl: seconds contacts are cached for in the memory of each app process, which bounds how long a write made by another app process goes unseen
+  search_cache_bytes: memory, in bytes of serialized results, held by the search result cache of each app process, or 0 to disable it
+  search_cache_ttl: seconds search result pages are cached for, which bounds how long writes made by other app processes go unseen
+  stats_reconcile_interval: seconds the contact statistics of each app process are used before they are counted again, or 0 to count on every request
+  flask_port: port used when running Address_Book.py directly
+  slow_request_ms: requests slower than this many milliseconds are logged with their Elasticsearch calls, or 0 to log none
+  compress_responses: whether responses are compressed with gzip, or brotli when it is installed, for clients that accept it
+  compress_min_bytes: responses smaller than this many bytes are sent uncompressed
+  write_behind: whether creates, updates, and deletes are acknowledged once journaled, and written in the background
+  journal_path: file the pending writes are journaled to when write_behind is set. Each app process adds its process id to
+    the name, and moves in the writes left by processes that stopped
+  journal_fsync: whether each journaled write is synced to disk before it is acknowledged
+  flush_size: pending contacts that start a write-behind flush, and the most written per bulk request
+  flush_interval: seconds between write-behind flushes
+
+'''
+
+import json
+import os
+
+# Default value of every setting. The type of each default is the type the setting is read as
+defaults = {
+  'hosts': 'localhost:9200',
+  'storage': 'elasticsearch',
+  'pool_maxsize': 10,
+  'request_timeout': 10.0,
+  'connect_timeout': 2.0,
+  'max_retries': 3,
+  'retry_on_timeout': True,
+  'retry_on_status': '502,503,504',
+  'dead_timeout': 60.0,
+  'http_compress': False,
+  'sniff_on_start': False,
+  'sniff_on_connection_fail': False,
+  'sniffer_timeout': 0.0,
+  'cache_size': 10000,
+  'cache_ttl': 60.0,
+  'cache_local_ttl': 1.0,
+  'search_cache_bytes': 16777216,
+  'search_cache_ttl': 10.0,
+  'stats_reconcile_interval': 60.0,
+  'flask_port': 5000,
+  'slow_request_ms': 0.0,
+  'compress_responses': True,
+  'compress_min_bytes': 1024,
+  'write_behind': False,
+  'journal_path': 'addressbook.journal',
+  'journal_fsync': True,
+  'flush_size': 500,
+  'flush_interval': 1.0
+}
+
+_true = ('1', 'true', 'yes', 'on')
+
+
+def loadConfig(path=None, environ=None, **overrides):
+  """
+  Reads the settings from the defaults, a configuration file, the environment, and overrides, in that order
+
+  Parameters
+  ----------
+  path: str
+    JSON configuration file (default is ADDRESSBOOK_CONFIG, or no file)
+  environ: dict
+    Environment variables (default is os.environ)
+  overrides: dict
+    Settings that replace every other source
+
+  Raises
+  ------
+  ValueError
+    If a setting is unknown or cannot be read as the type of its default
+
+  Returns
+  -------
+  dict
+    Every setting, with its value converted to the type of its default
+  """
+  environ = os.environ if environ is None else environ
+  settings = dict(defaults)
+  path = path or environ.get('ADDRESSBOOK_CONFIG')
+  if path:
+    with open(path, encoding='utf-8') as file:
+      settings.update(_check(json.load(file), path))
+  for name in defaults:
+    if 'ADDRESSBOOK_'+name.upper() in environ:
+      settings[name] = environ['ADDRESSBOOK_'+name.upper()]
+  settings.update(_check(overrides, 'create_app'))
+  return {name: _convert(name, value) for name, value in settings.items()}
+
+
+def parseHosts(hosts):
+  """
+  Returns the Elasticsearch nodes as a list
+
+  Parameters
+  ----------
+  hosts: str or list
+    Comma separated host:port pairs or URLs, or a list of them
+
+  Returns
+  -------
+  list
+    One host:port or URL for each node
+  """
+  if isinstance(hosts, str):
+    hosts = hosts.split(',')
+  return [host.strip() for host in hosts if host and host.strip()]
+
+
+def clientOptions(settings, async_client=False):
+  """
+  Returns the keyword arguments used to create an Elasticsearch client from the settings
+
+  Parameters
+  ----------
+  settings: dict
+    Settings from loadConfig
+  async_client: bool
+    Whether the options are for AsyncElasticsearch, which takes a single timeout (default is False)
+
+  Returns
+  -------
+  dict
+    Keyword arguments for Elasticsearch or AsyncElasticsearch
+  """
+  from API_Files import metrics, storage
+
+  if async_client:
+    timeout = settings['request_timeout']
+  else:
+    # Separate connect and read timeouts, so an unreachable node fails fast while slow searches can still finish
+    import urllib3
+    timeout = urllib3.Timeout(connect=settings['connect_timeout'], read=settings['request_timeout'])
+  options = {
+    'hosts': parseHosts(settings['hosts']),
+    'serializer': storage.ContactSerializer(),
+    'maxsize': settings['pool_maxsize'],
+    'timeout': timeout,
+    'max_retries': settings['max_retries'],
+    'retry_on_timeout': settings['retry_on_timeout'],
+    'retry_on_status': tuple(int(status) for status in settings['retry_on_status'].split(',') if status.strip()),
+    'dead_timeout': settings['dead_timeout'],
+    'http_compress': settings['http_compress'],
+    'sniff_on_start': settings['sniff_on_start'],
+    'sniff_on_connection_fail': settings['sniff_on_connection_fail']
+  }
+  if not async_client:
+    # Records the count and duration of every Elasticsearch call for GET /metrics
+    options['transport_class'] = metrics.InstrumentedTransport
+  if settings['sniffer_timeout'] > 0:
+    options['sniffer_timeout'] = settings['sniffer_timeout']
+  return options
+
+
+def _check(values, source):
+  unknown = sorted(set(values) - set(defaults))
+  if unknown:
+    raise ValueError("Unknown settings in "+str(source)+": "+", ".join(unknown))
+  return values
+
+
+def _convert(name, value):
+  default = defaults[name]
+  try:
+    if name == 'hosts':
+      return ','.join(parseHosts(value))
+    if isinstance(default, bool):
+      return value if isinstance(value, bool) else str(value).strip().lower() in _true
+    if isinstance(default, str) and isinstance(value, list):
+      return ','.join(str(item) for item in value)
+    return type(default)(value)
+  except (TypeError, ValueError):
+    raise ValueError("Setting "+name+" must be a "+type(default).__name__+", not "+repr(value))
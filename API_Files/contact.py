@@ -30,14 +30,105 @@ Contact Attributes:
   email: str
     An email address for the contact. Email address must follow the formatting "example@example.com".
     Other formats will throw an error. Required for each contact.
+
+Contacts are held in memory as Contact objects, which store the five fields in slots instead of a dictionary, and are
+serialized straight to bytes with orjson when it is installed, or the standard json module when it is not.
 """
 
 import json
 import re
 
-def toJSON(fullname, firstname, lastname, phone, email):
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+# Fields of a contact, in the order they are serialized
+fields = ('fullname', 'firstname', 'lastname', 'phone', 'email')
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+_email_regex = re.compile(r'^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+$')
+
+class Contact:
   """
-  Formats the contacts inputted information into JSON to be stored in Elasticsearch
+  A single contact
+
+  Attributes
+  ----------
+  fullname: str
+    Unique name of the contact
+  firstname: str
+    Contacts first name
+  lastname: str
+    Contacts last name
+  phone: str
+    Contacts phone number
+  email: str
+    Contacts email address
+  """
+  __slots__ = fields
+
+  def __init__(self, fullname, firstname='', lastname='', phone='', email=''):
+    self.fullname = fullname
+    self.firstname = firstname
+    self.lastname = lastname
+    self.phone = phone
+    self.email = email
+
+  @classmethod
+  def fromDict(cls, source):
+    """Creates a Contact from a python dictionary, such as the _source of an Elasticsearch document"""
+    return cls(source['fullname'], source.get('firstname', ''), source.get('lastname', ''), source.get('phone', ''), source.get('email', ''))
+
+  def validate(self):
+    """Returns the error message for the first missing or badly formatted field, or None if the contact is valid"""
+    return missingFieldError(self.fullname, self.phone, self.email) or formatError(self.phone, self.email)
+
+  def toDict(self):
+    """Returns the contact as the python dictionary stored in Elasticsearch"""
+    return {'fullname': self.fullname, 'firstname': self.firstname, 'lastname': self.lastname, 'phone': self.phone, 'email': self.email}
+
+  def toBytes(self):
+    """Returns the contact serialized as UTF-8 JSON"""
+    return dumps(self.toDict())
+
+  def replace(self, changes):
+    """Returns a copy of the contact with the changed fields"""
+    return Contact(*(changes.get(field, getattr(self, field)) for field in fields))
+
+  def __eq__(self, other):
+    return isinstance(other, Contact) and all(getattr(self, field) == getattr(other, field) for field in fields)
+
+  def __repr__(self):
+    return 'Contact('+', '.join(field+'='+repr(getattr(self, field)) for field in fields)+')'
+
+def dumps(value):
+  """
+  Serializes a value to UTF-8 JSON bytes, using orjson when it is installed
+
+  Parameters
+  ----------
+  value: dict, list, str, int, float, bool, or None
+    The value to serialize
+
+  Returns
+  -------
+  bytes
+    Compact JSON
+  """
+  if orjson is not None:
+    return orjson.dumps(value)
+  return _encoder.encode(value).encode('utf-8')
+
+def loads(data):
+  """Parses JSON from bytes or a string, using orjson when it is installed"""
+  if orjson is not None:
+    return orjson.loads(data)
+  return json.loads(data)
+
+def toDict(fullname, firstname, lastname, phone, email):
+  """
+  Formats the contacts inputted information into the dictionary stored in Elasticsearch
 
   Parameters
   ----------
@@ -55,18 +146,40 @@ def toJSON(fullname, firstname, lastname, phone, email):
   Returns
   -------
   dict
-    python dictionary of data formatted into JSON
-
+    python dictionary of the contacts data
   """
-
-  data = {
+  return {
     'fullname': fullname,
     'firstname': firstname,
     'lastname': lastname,
     'phone': phone,
     'email': email
   }
-  return json.dumps(data)
+
+def toJSON(fullname, firstname, lastname, phone, email):
+  """
+  Formats the contacts inputted information into JSON to be stored in Elasticsearch
+
+  Parameters
+  ----------
+  fullname: str
+    Unique name for the new contact. Contacts full name
+  firstname: str
+    Contacts first name, does not have to be unique
+  lastname: str
+   Contacts last name, does not have to be unique
+  phone: str
+    Phone number for the new contact
+  email: str
+    Email address for the new contact
+
+  Returns
+  -------
+  dict
+    python dictionary of data formatted into JSON
+
+  """
+  return json.dumps(toDict(fullname, firstname, lastname, phone, email))
 
 def updateJSON(data, updates):
   """
@@ -91,6 +204,25 @@ def updateJSON(data, updates):
 
   return json.dumps(data)
 
+def changedFields(data, updates):
+  """
+  Takes in JSON from Elasticsearch as a dictionary and returns only the updates that would change it
+  Like updateJSON, empty values in updates are not treated as changes
+
+  Parameters
+  ----------
+  data: dict
+    Original JSON retrieved from ElasticSearch
+  updates: dict
+    Dictionary of updated values
+
+  Returns
+  -------
+  dict
+    python dictionary of the fields whose values differ from data
+  """
+  return {key: value for key, value in updates.items() if value != '' and data.get(key) != value}
+
 def formatPhone(phone):
   """
   Takes in a phone number and validates it againsts defined constraints
@@ -128,7 +260,54 @@ def formatEmail(email):
   bool
     boolean value of true if formatted correctly, false if not.
   """
-  email_regex = '^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+$'
-  if re.search(email_regex, email):
+  if _email_regex.search(email):
     return True
   return False
+
+def missingFieldError(fullname, phone, email):
+  """
+  Returns the message shown when a required field of a new contact is empty
+
+  Parameters
+  ----------
+  fullname: str
+    Unique name for the new contact
+  phone: str
+    Phone number for the new contact
+  email: str
+    Email address for the new contact
+
+  Returns
+  -------
+  str
+    The error message, or None if fullname, phone, and email were all provided
+  """
+  if not fullname:
+    return "Please provide a unique name for the new Contact."
+  if not phone:
+    return "Please provide a phone number for the new Contact."
+  if not email:
+    return "Please provide an email for the new Contact."
+  return None
+
+def formatError(phone, email):
+  """
+  Returns the message shown when the phone number or email address of a new contact is not properly formatted
+
+  Parameters
+  ----------
+  phone: str
+    Phone number for the new contact
+  email: str
+    Email address for the new contact
+
+  Returns
+  -------
+  str
+    The error message, or None if both are properly formatted
+  """
+  if not formatPhone(phone):
+    return "Phone number not properly formatted. Ensure that the entered phone number contains only numbers and is 10 digits long"
+  if not formatEmail(email):
+    return "Email address not properly formatted. Ensure the entered email follows the format: example@email.com"
+  return None
@@ -0,0 +1,401 @@
+'''Duplicate Contact Detection
+
+This file contains the methods used by Find_Duplicates.py and GET /contact/_duplicates to find contacts that are likely
+the same person, such as "Jon Smith" at jsmith@example.com and "John Smith" at john.smith@example.com.
+Uniqueness checks only reject exact repeats of a fullname, phone number, or email address, so near-duplicates get in
+through imports, and exact repeats remain in contacts stored before reservations were used.
+
+Comparing every pair of contacts does not scale, so contacts are only compared with the contacts sharing one of their
+blocking keys:
+  email: the email address in lowercase
+  phone: the digits of the phone number, without a leading 1 country code
+  name: the Soundex codes of the first and last names, so names that sound alike share a key
+Each pair sharing several keys is compared once, in the block of the first key they share, in alphabetical order. Blocks
+larger than max_block_size, such as a very common name, are sorted by name and each contact is only compared with the next
+window contacts, and pairs that also share a smaller block are compared there instead. Blocks are scored in a pool of processes, and matching pairs are joined into clusters.
+
+The contacts are read from the store in one pass, holding only the fields used for matching in memory, which takes a few
+hundred bytes per contact. Only a bounded number of tasks is queued for the worker processes at once, and the contacts of
+each cluster are read back from the store at the end.
+
+'''
+
+import difflib
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from API_Files import contact, storage
+from API_Files.api_errors import error_response
+
+# Score from 0 to 1 above which two contacts are reported as duplicates
+default_threshold = 0.7
+# Largest block compared in full. Larger blocks are compared within a sliding window
+max_block_size = 500
+# Number of following contacts each contact is compared with in a block larger than max_block_size
+default_window = 50
+# Number of comparisons sent to a worker process at once
+default_task_size = 20000
+# Largest address book GET /contact/_duplicates scans. It is scored in the request's worker, which takes about 2 seconds
+# for this many contacts with common names. Larger books are checked with Find_Duplicates.py
+max_endpoint_contacts = 2000
+
+# Weight of each signal in the score of a pair
+name_weight = 0.6
+email_weight = 0.2
+phone_weight = 0.2
+# Similarity from 0 to 1 above which names, or the parts of email addresses before the @, count as matching
+similar = 0.8
+
+_non_digits = re.compile(r'\D')
+_non_letters = re.compile(r'[^a-z ]')
+_soundex_codes = dict((letter, str(code)) for code, letters in enumerate(('aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'))
+  for letter in letters)
+
+
+def soundex(word):
+  """
+  Returns the Soundex code of a word, which is the same for words that sound alike in English
+
+  Parameters
+  ----------
+  word: str
+    The word, such as a first or last name
+
+  Returns
+  -------
+  str
+    A letter followed by three digits, such as J500 for John and Jon, or an empty string if the word has no letters
+  """
+  letters = _non_letters.sub('', word.lower()).replace(' ', '')
+  if not letters:
+    return ''
+  code, previous = letters[0].upper(), _soundex_codes.get(letters[0])
+  for letter in letters[1:]:
+    digit = _soundex_codes[letter]
+    if digit != '0' and digit != previous:
+      code += digit
+      if len(code) == 4:
+        break
+    # h and w do not separate letters with the same code, while vowels do
+    if letter not in 'hw':
+      previous = digit
+  return (code + '000')[:4]
+
+
+def normalizeEmail(email):
+  """Returns an email address in lowercase without surrounding whitespace"""
+  return (email or '').strip().lower()
+
+
+def normalizePhone(phone):
+  """Returns the digits of a phone number, without a leading 1 country code"""
+  digits = _non_digits.sub('', str(phone or ''))
+  return digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+
+
+def normalizeName(source):
+  """Returns the name of a contact in lowercase letters, made from its firstname and lastname when it has them"""
+  name = ' '.join(part for part in (source.get('firstname'), source.get('lastname')) if part) or source.get('fullname', '')
+  return ' '.join(_non_letters.sub(' ', name.lower()).split())
+
+
+def blockingKeys(record):
+  """
+  Returns the blocking keys of a contact
+
+  Parameters
+  ----------
+  record: tuple
+    The contact as returned by matchRecord
+
+  Returns
+  -------
+  tuple
+    The email, phone, and name keys the contact has, in that order
+  """
+  _, name, email, phone = record
+  keys = []
+  if email:
+    keys.append('email:'+email)
+  if phone:
+    keys.append('phone:'+phone)
+  words = name.split()
+  if words:
+    keys.append('name:'+soundex(words[0])+soundex(words[-1]))
+  return tuple(keys)
+
+
+def matchRecord(source):
+  """Returns the fields of a contact used for matching, as a (fullname, name, email, phone) tuple"""
+  return (source['fullname'], normalizeName(source), normalizeEmail(source.get('email')), normalizePhone(source.get('phone')))
+
+
+def score(first, second):
+  """
+  Scores how likely two contacts are to be the same person
+
+  Parameters
+  ----------
+  first, second: tuple
+    The contacts as returned by matchRecord
+
+  The score adds up the similarity of the names, the similarity of the email addresses, which is 1 for the same address
+  and the similarity of the parts before the @ for two addresses at the same domain, and 1 for the same phone number,
+  each multiplied by its weight.
+
+  Returns
+  -------
+  tuple
+    The score from 0 to 1, and the list of signals that matched: name, email, and phone
+  """
+  reasons = []
+  name = _similarity(first[1], second[1])
+  if name >= similar:
+    reasons.append('name')
+  email = 0.0
+  if first[2] and first[2] == second[2]:
+    email = 1.0
+  elif first[2] and second[2]:
+    first_user, _, first_domain = first[2].partition('@')
+    second_user, _, second_domain = second[2].partition('@')
+    if first_domain == second_domain:
+      email = _similarity(first_user, second_user)
+  if email >= similar:
+    reasons.append('email')
+  phone = 1.0 if first[3] and first[3] == second[3] else 0.0
+  if phone:
+    reasons.append('phone')
+  return round(name_weight * name + email_weight * email + phone_weight * phone, 3), reasons
+
+
+def scoreBlocks(blocks, threshold, oversized=frozenset()):
+  """
+  Compares the contacts of each block and returns the pairs scoring at least threshold
+
+  Runs in the worker processes, so it only takes and returns plain python values.
+
+  Parameters
+  ----------
+  blocks: list
+    (key, records, window) tuples, where records are (id, record, keys) tuples and window is None to compare every pair
+  threshold: float
+    Smallest score reported
+  oversized: set
+    Keys of the blocks larger than max_block_size (default is none)
+
+  Returns
+  -------
+  tuple
+    The list of (first id, second id, score, reasons) tuples, and the number of pairs compared
+  """
+  pairs, compared = [], 0
+  for key, records, window in blocks:
+    for position, (first_id, first, first_keys) in enumerate(records):
+      end = len(records) if window is None else min(len(records), position + 1 + window)
+      for second_id, second, second_keys in records[position + 1:end]:
+        # A pair sharing several keys is only compared in the block of the first one
+        if min(set(first_keys) & set(second_keys), key=lambda shared: (shared in oversized, shared)) != key:
+          continue
+        compared += 1
+        value, reasons = score(first, second)
+        if value >= threshold:
+          pairs.append((first_id, second_id, value, reasons))
+  return pairs, compared
+
+
+def findDuplicates(es_object, threshold=default_threshold, processes=None, window=default_window, task_size=default_task_size, progress=None):
+  """
+  Finds clusters of contacts that are likely duplicates of each other
+
+  Parameters
+  ----------
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  threshold: float
+    Score from 0 to 1 above which two contacts are considered duplicates (default is 0.7)
+  processes: int
+    Number of scoring processes. 0 scores in the current process (default is the number of CPUs)
+  window: int
+    Number of following contacts compared in blocks larger than max_block_size (default is 50)
+  task_size: int
+    Number of comparisons sent to a worker process at once (default is 20000)
+  progress: function
+    Called with the current counts after the contacts are read and after each task is scored (default is None)
+
+  Returns
+  -------
+  dict
+    Counts of contacts, blocks, comparisons, and matching pairs, the seconds taken, and the clusters from buildClusters,
+    each with its contacts under contacts, the contact to keep first
+  """
+  started = time.monotonic()
+  store = storage.getStore(es_object)
+  counts = {'contacts': 0, 'blocks': 0, 'comparisons': 0, 'pairs': 0, 'seconds': 0.0}
+  records, blocks = [], {}
+  for source in store.iterate(contact.fields):
+    record = matchRecord(source)
+    keys = blockingKeys(record)
+    for key in keys:
+      blocks.setdefault(key, []).append(len(records))
+    records.append((record, keys))
+  counts['contacts'] = len(records)
+  if progress is not None:
+    progress(dict(counts))
+
+  pairs = []
+
+  def finish(task):
+    found, compared = task.result()
+    pairs.extend(found)
+    counts['comparisons'] += compared
+    counts['pairs'] = len(pairs)
+    counts['seconds'] = time.monotonic() - started
+    if progress is not None:
+      progress(dict(counts))
+
+  if processes is None:
+    processes = os.cpu_count() or 1
+  pool = ProcessPoolExecutor(processes) if processes > 0 else None
+  scoring = deque()
+  try:
+    oversized = frozenset(key for key, ids in blocks.items() if len(ids) > max_block_size)
+    for task in _tasks(blocks, records, window, task_size, counts):
+      scoring.append(pool.submit(scoreBlocks, task, threshold, oversized) if pool else _Done(scoreBlocks(task, threshold, oversized)))
+      while len(scoring) > 2 * max(processes, 1):
+        finish(scoring.popleft())
+    while scoring:
+      finish(scoring.popleft())
+  finally:
+    if pool:
+      pool.shutdown()
+
+  counts['clusters'] = buildClusters(pairs, [record for record, _ in records])
+  names = [name for cluster in counts['clusters'] for name in [cluster['keep']] + cluster['merge']]
+  found = {}
+  for start in range(0, len(names), 1000):
+    chunk = names[start:start + 1000]
+    found.update((name, document['_source']) for name, document in zip(chunk, store.getMany(chunk)) if document is not None)
+  for cluster in counts['clusters']:
+    cluster['contacts'] = [found[name] for name in [cluster['keep']] + cluster['merge'] if name in found]
+  counts['seconds'] = time.monotonic() - started
+  return counts
+
+
+def buildClusters(pairs, records):
+  """
+  Joins matching pairs into clusters of duplicates, and suggests which contact of each to keep
+
+  The contact kept is the one with the most of its name, email, and phone filled in, then the first by fullname.
+
+  Parameters
+  ----------
+  pairs: list
+    (first id, second id, score, reasons) tuples from scoreBlocks
+  records: list
+    Every contact as returned by matchRecord, indexed by the ids in pairs
+
+  Returns
+  -------
+  list
+    A dictionary for each cluster, largest first, with the contact to keep, the contacts to merge into it,
+    the highest score, and the matching pairs
+  """
+  parents = {}
+
+  def find(node):
+    root = node
+    while parents.get(root, root) != root:
+      root = parents[root]
+    while node != root:
+      parents[node], node = root, parents[node]
+    return root
+
+  for first, second, _, _ in pairs:
+    first_root, second_root = find(first), find(second)
+    if first_root != second_root:
+      parents[max(first_root, second_root)] = min(first_root, second_root)
+
+  groups = {}
+  for pair in pairs:
+    groups.setdefault(find(pair[0]), []).append(pair)
+  clusters = []
+  for matches in groups.values():
+    members = sorted({node for pair in matches for node in pair[:2]},
+      key=lambda node: (-sum(1 for value in records[node][1:] if value), records[node][0]))
+    clusters.append({
+      'keep': records[members[0]][0],
+      'merge': sorted(records[node][0] for node in members[1:]),
+      'score': max(pair[2] for pair in matches),
+      'pairs': [{'first': records[first][0], 'second': records[second][0], 'score': value, 'reasons': reasons}
+        for first, second, value, reasons in matches]
+    })
+  return sorted(clusters, key=lambda cluster: (-len(cluster['merge']), -cluster['score'], cluster['keep']))
+
+
+def reportDuplicates(es_object, threshold=default_threshold, limit=None):
+  """
+  Finds duplicate clusters for GET /contact/_duplicates, scoring in the current process
+
+  Parameters
+  ----------
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  threshold: float
+    Score from 0 to 1 above which two contacts are considered duplicates (default is 0.7)
+  limit: int
+    Largest number of clusters returned (default is every cluster)
+
+  Raises
+  ------
+  413 Payload Too Large Error
+    If the address book has more than max_endpoint_contacts contacts
+
+  Returns
+  -------
+  dict
+    The report from findDuplicates, with at most limit clusters and the total number of clusters under total
+  """
+  store = storage.getStore(es_object)
+  if store.count() > max_endpoint_contacts:
+    return error_response(413, "The address book has more than "+str(max_endpoint_contacts)+" contacts. Please run Find_Duplicates.py to check it for duplicates.")
+  report = findDuplicates(store, threshold, processes=0)
+  report['total'] = len(report['clusters'])
+  if limit is not None:
+    report['clusters'] = report['clusters'][:limit]
+  return report
+
+
+def _similarity(first, second):
+  return difflib.SequenceMatcher(None, first, second).ratio() if first and second else 0.0
+
+
+def _tasks(blocks, records, window, task_size, counts):
+  # Groups the blocks with more than one contact into tasks of about task_size comparisons
+  task, size = [], 0
+  for key, ids in blocks.items():
+    if len(ids) < 2:
+      continue
+    counts['blocks'] += 1
+    members = [(node, records[node][0], records[node][1]) for node in ids]
+    block_window = None
+    if len(members) > max_block_size:
+      members.sort(key=lambda member: member[1][1])
+      block_window = window
+    task.append((key, members, block_window))
+    size += len(members) * (len(members) - 1) // 2 if block_window is None else len(members) * block_window
+    if size >= task_size:
+      yield task
+      task, size = [], 0
+  if task:
+    yield task
+
+
+class _Done:
+  # Stands in for a future when scoring in the current process
+  def __init__(self, value):
+    self.value = value
+
+  def result(self):
+    return self.value
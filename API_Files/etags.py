@@ -0,0 +1,134 @@
+'''Entity Tags
+
+This file contains the methods used to build and compare the ETag headers of contacts and search results.
+A contact's tag is made of its primary term and sequence number, so it changes every time the contact is written.
+A search's tag is made of the store's generation, which changes whenever any contact is written, and the search parameters.
+
+Clients send a tag back in If-None-Match to receive 304 Not Modified when nothing changed, or in If-Match on PUT and DELETE
+so the change is only made if the contact is still the version they read.
+
+A strong tag must change with the bytes of the body, so a contact sent compressed has the encoding added to its tag, such as
+"1-42-gzip". Tags are compared without that suffix, since every encoding of a body holds the same version of the contact.
+
+'''
+
+import hashlib
+
+# Content encodings whose name is added to the strong tag of a compressed body
+encodings = ('gzip', 'br')
+
+
+def contactTag(document):
+  """
+  Returns the strong ETag of a contact
+
+  Parameters
+  ----------
+  document: dict
+    The contact as returned by ContactStore.get, with its _seq_no and _primary_term
+
+  Returns
+  -------
+  str
+    The quoted tag, such as "1-42", or None if the document has no version
+  """
+  if document is None or document.get('_seq_no') is None:
+    return None
+  return '"'+str(document.get('_primary_term', 1))+'-'+str(document['_seq_no'])+'"'
+
+
+def searchTag(generation, *parameters):
+  """
+  Returns the weak ETag of a page of search results
+
+  Parameters
+  ----------
+  generation: str
+    Marker from ContactStore.generation, which changes whenever a contact is written
+  parameters: tuple
+    Values that select the page, such as the query, page size, and page
+
+  Returns
+  -------
+  str
+    The quoted weak tag, or None if the store has no generation
+  """
+  if generation is None:
+    return None
+  digest = hashlib.sha1(repr((generation,) + parameters).encode('utf-8')).hexdigest()[:20]
+  return 'W/"'+digest+'"'
+
+
+def encodedTag(tag, encoding):
+  """
+  Returns the ETag of a body sent with a content encoding
+
+  Parameters
+  ----------
+  tag: str
+    Tag of the uncompressed body, or None
+  encoding: str
+    Content encoding of the body, such as gzip or br
+
+  Returns
+  -------
+  str
+    A strong tag with the encoding added, such as "1-42-gzip". Weak tags, which do not depend on the bytes of the body,
+    and None are returned unchanged
+  """
+  if tag is None or tag.startswith('W/'):
+    return tag
+  return tag[:-1]+'-'+encoding+'"'
+
+
+def listedTag(header, tag, weak=True):
+  """
+  Returns the tag in an If-None-Match or If-Match header that matches the current tag, as matches
+
+  Returns
+  -------
+  str
+    The tag as listed in the header, with any encoding added by encodedTag, the current tag if the header is *, or None
+  """
+  if not header or tag is None:
+    return None
+  for value in header.split(','):
+    value = value.strip()
+    if value == '*':
+      return tag
+    if weak:
+      if _identityTag(value.replace('W/', '', 1)) == tag.replace('W/', '', 1):
+        return value
+    elif _identityTag(value) == tag and not value.startswith('W/') and not tag.startswith('W/'):
+      return value
+  return None
+
+
+def matches(header, tag, weak=True):
+  """
+  Checks whether an If-None-Match or If-Match header lists a tag, in any of its encodings
+
+  Parameters
+  ----------
+  header: str
+    Value of the header, a comma separated list of quoted tags or *
+  tag: str
+    Current tag of the resource, or None if it has none
+  weak: bool
+    Whether tags are compared without their W/ prefix, as for If-None-Match. If-Match uses strong comparison, where a weak tag
+    never matches (default is True)
+
+  Returns
+  -------
+  bool
+    True if the header lists the tag, or is * and the resource has a tag
+  """
+  return listedTag(header, tag, weak) is not None
+
+
+def _identityTag(value):
+  # Removes the encoding added by encodedTag from a quoted tag
+  for encoding in encodings:
+    if value.endswith('-'+encoding+'"'):
+      return value[:-len(encoding) - 2]+'"'
+  return value
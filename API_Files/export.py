@@ -0,0 +1,111 @@
+'''Contact Export
+
+This file contains the methods used to export the whole AddressBook, or the contacts matching a query, in a single response.
+Contacts are read from the store one page at a time and written to the response as they arrive, so memory use does not
+grow with the size of the book and the first contacts are sent before the last ones are read.
+
+'''
+
+import csv
+import io
+from API_Files import contact, storage
+
+# Formats contacts can be exported in, and the content type of each
+formats = {
+  'ndjson': 'application/x-ndjson',
+  'csv': 'text/csv'
+}
+# Number of bytes collected before they are sent as one chunk of the response
+chunk_bytes = 65536
+
+
+def parseFields(value):
+  """
+  Reads the comma separated list of fields to export
+
+  Parameters
+  ----------
+  value: str
+    Field names separated by commas. An empty value selects every field
+
+  Raises
+  ------
+  ValueError
+    If a field is not a contact field
+
+  Returns
+  -------
+  list
+    The selected fields, in the order given
+  """
+  fields = [field.strip() for field in value.split(',') if field.strip()]
+  for field in fields:
+    if field not in contact.fields:
+      raise ValueError("Unknown field "+field+". Fields can be any of: "+", ".join(contact.fields)+".")
+  return fields or list(contact.fields)
+
+
+def exportContacts(es_object, format='ndjson', query='', fields=None):
+  """
+  Exports contacts as newline delimited JSON or CSV
+
+  The format and fields are checked before any contact is read, so errors can be returned before the response starts.
+
+  Parameters
+  ----------
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  format: str
+    Either ndjson or csv (default is ndjson)
+  query: str
+    Keyword or phrase the exported contacts must match. If left empty, every contact is exported (default is an empty string)
+  fields: list
+    Fields to export for each contact, usually from parseFields (default is every field)
+
+  Raises
+  ------
+  ValueError
+    If the format is not supported
+
+  Returns
+  -------
+  generator
+    Chunks of the response body, as bytes
+  """
+  if format not in formats:
+    raise ValueError("Unknown format "+str(format)+". Please use one of: "+", ".join(formats)+".")
+  fields = list(fields or contact.fields)
+  records = storage.getStore(es_object).iterate(fields, query.strip() if query.strip() != '*' else '')
+  if format == 'csv':
+    return _chunks(_csvLines(records, fields))
+  return _chunks(contact.dumps({field: source.get(field, '') for field in fields}) + b'\n' for source in records)
+
+
+def _csvLines(records, fields):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(fields)
+  yield _drain(buffer)
+  for source in records:
+    writer.writerow([source.get(field, '') for field in fields])
+    yield _drain(buffer)
+
+
+def _drain(buffer):
+  data = buffer.getvalue().encode('utf-8')
+  buffer.seek(0)
+  buffer.truncate()
+  return data
+
+
+def _chunks(lines):
+  # Sends the first line on its own so the response starts at once, then groups lines into chunks of about chunk_bytes
+  pending, size, first = [], 0, True
+  for line in lines:
+    pending.append(line)
+    size += len(line)
+    if first or size >= chunk_bytes:
+      yield b''.join(pending)
+      pending, size, first = [], 0, False
+  if pending:
+    yield b''.join(pending)
@@ -0,0 +1,298 @@
+'''Contact File Import
+
+This file contains the methods used by Import_Contacts.py to load large CSV and vCard files into the AddressBook.
+Files are read lazily and split into batches. Each batch is validated in a pool of processes with the same rules used
+when creating a single contact, and the valid contacts are written by a pool of threads through the contact store, which
+checks the fullname, phone number, and email address for uniqueness as part of each write. Only a bounded number of
+batches is read ahead of the writes, so memory use stays flat and reading slows down when the store falls behind.
+
+'''
+
+import csv
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from API_Files import contact, storage
+
+# Number of rows validated and written together
+default_batch_size = 1000
+# Number of threads writing batches to the store at the same time
+default_threads = 4
+
+# CSV headers accepted for each contact field, compared without case, spaces, or underscores
+_headers = {
+  'fullname': 'fullname', 'name': 'fullname', 'displayname': 'fullname',
+  'firstname': 'firstname', 'givenname': 'firstname',
+  'lastname': 'lastname', 'surname': 'lastname', 'familyname': 'lastname',
+  'phone': 'phone', 'phonenumber': 'phone', 'telephone': 'phone', 'tel': 'phone',
+  'email': 'email', 'emailaddress': 'email', 'mail': 'email'
+}
+_non_digits = re.compile(r'\D')
+
+
+def readRecords(path, format=None):
+  """
+  Lazily reads the contacts in a CSV or vCard file
+
+  Parameters
+  ----------
+  path: str
+    Path of the file
+  format: str
+    Either csv or vcard (default is chosen from the file extension, .vcf and .vcard are read as vCard)
+
+  Returns
+  -------
+  generator
+    Yields (line, record) tuples, where line is the line the contact starts on and record is a python dictionary of its fields
+  """
+  if format is None:
+    format = 'vcard' if os.path.splitext(path)[1].lower() in ('.vcf', '.vcard') else 'csv'
+  if format == 'vcard':
+    return readVCard(path)
+  if format == 'csv':
+    return readCSV(path)
+  raise ValueError("Unknown format "+str(format)+". Please use csv or vcard.")
+
+
+def readCSV(path):
+  """
+  Lazily reads the contacts in a CSV file with a header row
+
+  Columns are matched to contact fields by name, for example fullname, First Name, or email_address.
+  When there is no fullname column, the first and last names are joined to form it.
+
+  Parameters
+  ----------
+  path: str
+    Path of the file
+
+  Returns
+  -------
+  generator
+    Yields (line, record) tuples
+  """
+  with open(path, newline='', encoding='utf-8-sig') as file:
+    reader = csv.reader(file)
+    header = next(reader, [])
+    columns = [(position, _headers.get(re.sub(r'[\s_-]', '', name.lower()))) for position, name in enumerate(header)]
+    columns = [(position, field) for position, field in columns if field]
+    for row in reader:
+      if not any(row):
+        continue
+      record = {field: row[position].strip() for position, field in columns if position < len(row)}
+      if not record.get('fullname'):
+        record['fullname'] = ' '.join(filter(None, (record.get('firstname', ''), record.get('lastname', ''))))
+      yield reader.line_num, record
+
+
+def readVCard(path):
+  """
+  Lazily reads the contacts in a vCard file
+
+  FN is read as the fullname, N as the last and first names (which form the fullname when there is no FN), and the first TEL and EMAIL as the phone number and email address.
+  Phone numbers are reduced to their digits, dropping a leading 1 country code, so +1 (301) 555-8899 is read as 3015558899.
+
+  Parameters
+  ----------
+  path: str
+    Path of the file
+
+  Returns
+  -------
+  generator
+    Yields (line, record) tuples
+  """
+  with open(path, encoding='utf-8-sig') as file:
+    record, start = None, 0
+    for number, line in _unfold(file):
+      name, _, value = line.partition(':')
+      name = name.split(';')[0].split('.')[-1].upper()
+      if name == 'BEGIN' and value.strip().upper() == 'VCARD':
+        record, start = {}, number
+      elif record is None:
+        continue
+      elif name == 'END':
+        if not record.get('fullname'):
+          record['fullname'] = ' '.join(filter(None, (record.get('firstname', ''), record.get('lastname', ''))))
+        yield start, record
+        record = None
+      elif name == 'FN':
+        record['fullname'] = _unescape(value)
+      elif name == 'N':
+        parts = value.split(';') + ['', '']
+        record.setdefault('lastname', _unescape(parts[0]))
+        record.setdefault('firstname', _unescape(parts[1]))
+      elif name == 'TEL' and 'phone' not in record:
+        digits = _non_digits.sub('', value)
+        record['phone'] = digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+      elif name == 'EMAIL' and 'email' not in record:
+        record['email'] = value.strip()
+
+
+def validateBatch(batch):
+  """
+  Validates a batch of records with the rules used when creating a single contact
+
+  Runs in the worker processes, so it only takes and returns plain python values.
+
+  Parameters
+  ----------
+  batch: list
+    (line, record) tuples from readRecords
+
+  Returns
+  -------
+  tuple
+    A list of (line, source) tuples for the valid records, with each source formatted by contact.toDict,
+    and a list of (line, record, error) tuples for the invalid records
+  """
+  valid, rejected = [], []
+  for line, record in batch:
+    fullname, phone, email = record.get('fullname', ''), record.get('phone', ''), record.get('email', '')
+    error = contact.missingFieldError(fullname, phone, email) or contact.formatError(phone, email)
+    if error:
+      rejected.append((line, record, error))
+    else:
+      valid.append((line, contact.toDict(fullname, record.get('firstname', ''), record.get('lastname', ''), phone, email)))
+  return valid, rejected
+
+
+def importContacts(records, es_object, batch_size=default_batch_size, processes=None, threads=default_threads, rejects=None, progress=None):
+  """
+  Validates and writes contacts, in batches, using a pool of processes and a pool of threads
+
+  At most processes + threads batches are held in memory at once. When the store writes more slowly than the file
+  is read and validated, reading waits for a write to finish.
+
+  Parameters
+  ----------
+  records: iterable
+    (line, record) tuples, usually from readRecords
+  es_object: ContactStore or Elasticsearch instance
+    Current contact store
+  batch_size: int
+    Number of records validated and written together (default is 1000)
+  processes: int
+    Number of validation processes. 0 validates in the current process (default is the number of CPUs)
+  threads: int
+    Number of batches written at the same time (default is 4)
+  rejects: file-like object
+    Text file the rejected records are written to as CSV, with their line number and the reason (default is None)
+  progress: function
+    Called with the current counts after each batch is written (default is None)
+
+  Returns
+  -------
+  dict
+    Counts of rows read, created, and rejected, the seconds taken, and the rows per second
+  """
+  store = storage.getStore(es_object)
+  counts = {'rows': 0, 'created': 0, 'rejected': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+  started = time.monotonic()
+  writer = csv.writer(rejects) if rejects is not None else None
+  if writer is not None:
+    writer.writerow(['line', 'reason'] + list(contact.fields))
+
+  def reject(line, record, error):
+    counts['rejected'] += 1
+    if writer is not None:
+      writer.writerow([line, error] + [record.get(field, '') for field in contact.fields])
+
+  def finish(batch):
+    # Records the result of one validated and written batch
+    rejected, written = batch
+    for line, record, error in rejected:
+      reject(line, record, error)
+    for line, source, (status, detail) in written:
+      if status == 201:
+        counts['created'] += 1
+      else:
+        reject(line, source, _storeError(status, detail, source))
+    counts['rows'] += len(rejected) + len(written)
+    counts['seconds'] = time.monotonic() - started
+    counts['rows_per_second'] = counts['rows'] / counts['seconds'] if counts['seconds'] else 0.0
+    if progress is not None:
+      progress(dict(counts))
+
+  if processes is None:
+    processes = os.cpu_count() or 1
+  validators = ProcessPoolExecutor(processes) if processes > 0 else None
+  writers = ThreadPoolExecutor(max(threads, 1))
+  validating, writing = deque(), deque()
+  try:
+    for batch in _batches(records, batch_size):
+      validating.append(validators.submit(validateBatch, batch) if validators else _Done(validateBatch(batch)))
+      while len(validating) > processes or (validating and validating[0].done()):
+        writing.append(_write(validating.popleft().result(), store, writers))
+      while len(writing) > threads:
+        finish(writing.popleft().result())
+    while validating:
+      writing.append(_write(validating.popleft().result(), store, writers))
+    while writing:
+      finish(writing.popleft().result())
+  finally:
+    writers.shutdown()
+    if validators:
+      validators.shutdown()
+  return counts
+
+
+def _write(validated, store, writers):
+  valid, rejected = validated
+
+  def write():
+    statuses = store.create([source for _, source in valid]) if valid else []
+    return rejected, [(line, source, status) for (line, source), status in zip(valid, statuses)]
+  return writers.submit(write)
+
+
+def _storeError(status, detail, source):
+  if status == 409:
+    if detail == 'fullname':
+      return "Name "+source['fullname']+" is not unique."
+    return "The "+('phone number' if detail == 'phone' else 'email address')+" is already in use."
+  return "Could not be created: "+str(detail)
+
+
+def _batches(records, batch_size):
+  records = iter(records)
+  while True:
+    batch = list(islice(records, batch_size))
+    if not batch:
+      return
+    yield batch
+
+
+def _unfold(file):
+  # Joins vCard lines continued on the next line with a leading space or tab
+  pending, start = None, 0
+  for number, line in enumerate(file, 1):
+    line = line.rstrip('\r\n')
+    if line[:1] in (' ', '\t') and pending is not None:
+      pending += line[1:]
+      continue
+    if pending is not None:
+      yield start, pending
+    pending, start = line, number
+  if pending is not None:
+    yield start, pending
+
+
+def _unescape(value):
+  return value.replace('\\,', ',').replace('\\;', ';').replace('\\n', ' ').strip()
+
+
+class _Done:
+  # Stands in for a future when validating in the current process
+  def __init__(self, value):
+    self.value = value
+
+  def done(self):
+    return True
+
+  def result(self):
+    return self.value
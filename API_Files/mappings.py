@@ -0,0 +1,481 @@
+'''Index Mappings and Bootstrap
+
+This file contains the Elasticsearch mappings for the AddressBook and the methods used to create and migrate its indices.
+Each index is created with a versioned name, for example addressbook-v1, and the API only reads and writes through an alias
+with the unversioned name. Changing a mapping means adding a new version and running migrate from Index_Setup.py, which copies the documents
+into the new index and moves the alias in a single atomic step, so searches keep working while the data is reindexed.
+Writes are only rejected for the short time the last changes are copied. The app never migrates an index itself.
+
+Address books other than the default one share the addressbook-books and addressbook-reservations-books indices, through
+filtered and routed aliases created by books.py. Migrating a shared index moves those aliases along with it.
+
+Shard, replica, and refresh settings are read from the environment:
+  ADDRESSBOOK_SHARDS: number of primary shards for new indices (default is 1)
+  ADDRESSBOOK_REPLICAS: number of replicas for new indices (default is 1)
+  ADDRESSBOOK_REFRESH_INTERVAL: how often new writes become searchable (default is 1s)
+
+'''
+
+import logging
+import os
+import time
+from itertools import islice
+from elasticsearch import helpers
+from elasticsearch.exceptions import NotFoundError
+from API_Files import reservations
+
+logger = logging.getLogger(__name__)
+
+# Fields searched by GET /contact, with boosts for matches on names
+search_fields = ['fullname^3', 'firstname^2', 'lastname^2', 'email.text', 'phone']
+
+# Name fields are searched as text, sorted and matched exactly on keyword, and completed as the user types on prefix
+_name = {'type': 'text', 'fields': {
+  'keyword': {'type': 'keyword', 'ignore_above': 256},
+  'prefix': {'type': 'text', 'analyzer': 'name_prefix', 'search_analyzer': 'standard'}
+}}
+
+# Fields searched by GET /contact/_suggest
+suggest_fields = ['fullname.prefix^3', 'firstname.prefix', 'lastname.prefix']
+
+contact_mapping = {
+  'dynamic': False,
+  'properties': {
+    'fullname': _name,
+    'firstname': _name,
+    'lastname': _name,
+    'phone': {'type': 'keyword'},
+    'email': {'type': 'keyword', 'normalizer': 'lowercase', 'fields': {'text': {'type': 'text'}}}
+  }
+}
+
+reservation_mapping = {
+  'dynamic': False,
+  'properties': {
+    'fullname': {'type': 'keyword'},
+    'phone': {'type': 'keyword'},
+    'email': {'type': 'keyword'}
+  }
+}
+
+# Indices shared by several address books also store the name of the book each document belongs to
+book_contact_mapping = {'dynamic': False, 'properties': dict(contact_mapping['properties'], book={'type': 'keyword'})}
+book_reservation_mapping = {'dynamic': False, 'properties': dict(reservation_mapping['properties'], book={'type': 'keyword'})}
+
+# Analyzers and normalizers are defined in the index settings, next to the shard and replica settings
+_analysis = {
+  'normalizer': {'lowercase': {'type': 'custom', 'filter': ['lowercase']}},
+  'filter': {'name_edge_ngram': {'type': 'edge_ngram', 'min_gram': 1, 'max_gram': 20}},
+  'analyzer': {'name_prefix': {'type': 'custom', 'tokenizer': 'standard', 'filter': ['lowercase', 'name_edge_ngram']}}
+}
+
+# Alias names used by the API, and the mapping of the index behind each one
+indices = {
+  reservations.contact_index: contact_mapping,
+  reservations.reservation_index: reservation_mapping,
+  reservations.book_contact_index: book_contact_mapping,
+  reservations.book_reservation_index: book_reservation_mapping
+}
+
+# Current mapping version of each index. Increase it whenever the mapping above changes, then run migrate
+mapping_versions = {
+  reservations.contact_index: 2,
+  reservations.reservation_index: 1,
+  reservations.book_contact_index: 1,
+  reservations.book_reservation_index: 1
+}
+
+
+def indexSettings(shards=None, replicas=None, refresh_interval=None):
+  """
+  Returns the settings used when creating an index
+
+  Parameters
+  ----------
+  shards: int
+    Number of primary shards (default is ADDRESSBOOK_SHARDS, or 1)
+  replicas: int
+    Number of replicas (default is ADDRESSBOOK_REPLICAS, or 1)
+  refresh_interval: str
+    Refresh interval, for example 1s or 30s (default is ADDRESSBOOK_REFRESH_INTERVAL, or 1s)
+
+  Returns
+  -------
+  dict
+    Index settings
+  """
+  return {
+    'number_of_shards': int(shards or os.environ.get('ADDRESSBOOK_SHARDS', 1)),
+    'number_of_replicas': int(replicas if replicas is not None else os.environ.get('ADDRESSBOOK_REPLICAS', 1)),
+    'refresh_interval': refresh_interval or os.environ.get('ADDRESSBOOK_REFRESH_INTERVAL', '1s'),
+    'analysis': _analysis
+  }
+
+
+def indexName(alias, version=None):
+  """
+  Returns the versioned index name behind an alias
+
+  Parameters
+  ----------
+  alias: str
+    Alias used by the API
+  version: int
+    Mapping version (default is the current version in mapping_versions)
+
+  Returns
+  -------
+  str
+    Versioned index name
+  """
+  return alias+'-v'+str(version or mapping_versions[alias])
+
+
+def currentIndex(alias, es_object):
+  """
+  Returns the index an alias currently points to
+
+  Parameters
+  ----------
+  alias: str
+    Alias used by the API
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+
+  Returns
+  -------
+  str
+    The index name, the alias itself if it is a concrete index created before aliases were used, or None if it does not exist
+  """
+  try:
+    return sorted(es_object.indices.get_alias(name=alias))[-1]
+  except NotFoundError:
+    pass
+  if es_object.indices.exists(index=alias):
+    return alias
+  return None
+
+
+def ensureIndices(es_object, settings=None):
+  """
+  Creates any missing index and alias at the current mapping version
+
+  An index created before aliases were used, or an alias pointing to an older mapping version, is left in place and logged,
+  so existing indices are only reindexed when Index_Setup.py migrate is run.
+
+  Parameters
+  ----------
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  settings: dict
+    Settings for new indices (default is indexSettings())
+
+  Returns
+  -------
+  dict
+    The index behind each alias
+  """
+  settings = settings or indexSettings()
+  current = {}
+  for alias in indices:
+    index = currentIndex(alias, es_object)
+    if index is None:
+      index = indexName(alias)
+      createIndex(index, alias, es_object, settings)
+      es_object.indices.put_alias(index=index, name=alias)
+    elif index == alias:
+      logger.warning("Index %s was created before aliases were used. Run Index_Setup.py migrate to move it behind an alias.", index)
+    elif index != indexName(alias):
+      logger.warning("Index %s is not at mapping version %d. Run Index_Setup.py migrate to reindex it.", index, mapping_versions[alias])
+    current[alias] = index
+  return current
+
+
+def migrate(alias, es_object, settings=None, poll_interval=1.0):
+  """
+  Copies the documents behind an alias into a new index at the current mapping version, then moves the alias to it
+
+  The documents are copied twice while the old index is still written to, the second time only bringing over the changes
+  made during the first. Writes to the old index are then blocked while the changes made during the second copy are copied,
+  contacts deleted meanwhile are removed, and the alias is moved, so no write is lost and writes are only rejected for that
+  last step. The alias is moved in a single atomic update, together with any other alias on the old index, such as the
+  filtered alias of an address book. The old index is kept read only, so the alias can be moved back once its write block is
+  removed, unless it was created before aliases were used, in which case it has to be removed to free the name.
+
+  This is only run by Index_Setup.py, never by the app itself.
+
+  Parameters
+  ----------
+  alias: str
+    Alias used by the API
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  settings: dict
+    Settings for the new index (default is indexSettings())
+  poll_interval: float
+    Seconds between checks on the progress of the copy (default is 1)
+
+  Raises
+  ------
+  RuntimeError
+    If any copy fails, in which case the alias is left on the old index and its writes are allowed again
+
+  Returns
+  -------
+  str
+    Name of the index the alias points to
+  """
+  source = currentIndex(alias, es_object)
+  target = indexName(alias)
+  if source == target:
+    return target
+  if source is None:
+    return ensureIndices(es_object, settings)[alias]
+
+  createIndex(target, alias, es_object, settings)
+  reindex(source, target, es_object, poll_interval=poll_interval)
+  reindex(source, target, es_object, poll_interval=poll_interval)
+  blockWrites(source, es_object)
+  try:
+    catchUp(source, target, es_object, poll_interval=poll_interval)
+    if source == alias:
+      # The old index has to be removed in the same update to free its name for the alias
+      actions = [{'remove_index': {'index': source}}, {'add': {'index': target, 'alias': alias}}]
+      es_object.indices.update_aliases(body={'actions': actions + _movedAliases(source, target, alias, es_object, False)})
+    else:
+      actions = [{'remove': {'index': source, 'alias': alias}}, {'add': {'index': target, 'alias': alias}}]
+      es_object.indices.update_aliases(body={'actions': actions + _movedAliases(source, target, alias, es_object, True)})
+  except Exception:
+    blockWrites(source, es_object, False)
+    raise
+  if source != alias:
+    logger.info("Alias %s moved from %s to %s. %s is read only, and can be deleted once the migration is verified.", alias, source, target, source)
+  return target
+
+
+def reserveExisting(es_object, chunk_size=500):
+  """
+  Creates the phone number and email address reservations for contacts stored before reservations were used
+
+  Values already reserved are left untouched, so when older contacts share a phone number or email address the first one read keeps it.
+
+  Parameters
+  ----------
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  chunk_size: int
+    Number of reservations written per bulk request (default is 500)
+
+  Returns
+  -------
+  int
+    Number of reservations created
+  """
+  def actions():
+    for hit in helpers.scan(es_object, index=reservations.contact_index, _source=['fullname'] + list(reservations.unique_fields)):
+      source = hit['_source']
+      for field in reservations.unique_fields:
+        if source.get(field):
+          yield {'_op_type': 'create', '_index': reservations.reservation_index, '_id': reservations.reservationId(field, source[field]),
+            '_source': {'fullname': hit['_id'], field: source[field]}}
+
+  created = 0
+  for ok, _ in helpers.streaming_bulk(es_object, actions(), chunk_size=chunk_size, raise_on_error=False):
+    created += ok
+  return created
+
+
+def createIndex(index, alias, es_object, settings=None):
+  """
+  Creates an index with the mapping used behind an alias, unless it already exists
+
+  Parameters
+  ----------
+  index: str
+    Name of the new index
+  alias: str
+    Alias in indices whose mapping the index uses
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  settings: dict
+    Settings for the new index (default is indexSettings())
+  """
+  es_object.indices.create(index=index, body={'settings': settings or indexSettings(), 'mappings': indices[alias]}, ignore=400)
+
+
+def reindex(source, target, es_object, query=None, poll_interval=1.0, routing='keep'):
+  """
+  Copies documents from one index to another, keeping the version of each document
+
+  Documents are only written when the source has a newer version than the target, so running the copy again brings over
+  the documents created or updated since the last copy. Documents deleted from the source are not removed, see removeDeleted.
+  The copy runs as a task so that large indices do not hit the client request timeout.
+
+  Parameters
+  ----------
+  source: str
+    Index or alias to copy from
+  target: str
+    Index to copy to
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  query: dict
+    Query selecting the documents to copy (default is every document)
+  poll_interval: float
+    Seconds between checks on the progress of the copy (default is 1)
+  routing: str
+    keep to copy each document's routing, or discard to route copies by their id (default is keep)
+
+  Raises
+  ------
+  RuntimeError
+    If the copy fails, or any document could not be copied
+
+  Returns
+  -------
+  dict
+    The response of the reindex task
+  """
+  # Version conflicts are documents the target already has at the same or a newer version, and are skipped
+  body = {'conflicts': 'proceed', 'source': {'index': source}, 'dest': {'index': target, 'version_type': 'external', 'routing': routing}}
+  if query is not None:
+    body['source']['query'] = query
+  task = es_object.reindex(body=body, wait_for_completion=False, refresh=True)['task']
+  return waitForTask(task, es_object, poll_interval)
+
+
+def waitForTask(task, es_object, poll_interval=1.0):
+  """
+  Waits for a task started with wait_for_completion=False to complete
+
+  Parameters
+  ----------
+  task: str
+    Id of the task
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  poll_interval: float
+    Seconds between checks on the progress of the task (default is 1)
+
+  Raises
+  ------
+  RuntimeError
+    If the task failed, or reported failures for any document
+
+  Returns
+  -------
+  dict
+    The response of the task
+  """
+  while True:
+    status = es_object.tasks.get(task_id=task)
+    if status.get('completed'):
+      break
+    time.sleep(poll_interval)
+  response = status.get('response', {})
+  if status.get('error') or response.get('failures'):
+    raise RuntimeError("Task "+str(task)+" failed: "+str(status.get('error') or response['failures'][:5]))
+  return response
+
+
+def catchUp(source, target, es_object, query=None, poll_interval=1.0, routing='keep', source_routing=None):
+  """
+  Copies the last changes made to the source into the target, once writes to the source are blocked
+
+  Parameters
+  ----------
+  source: str
+    Index or alias copied from, whose writes are blocked
+  target: str
+    Index copied to
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  query: dict
+    Query selecting the documents copied (default is every document)
+  poll_interval: float
+    Seconds between checks on the progress of the copy (default is 1)
+  routing: str
+    keep or discard, as in reindex (default is keep)
+  source_routing: str
+    Routing of every document in the source, used when the copies were made with routing discard (default is None)
+
+  Returns
+  -------
+  int
+    Number of documents removed because they were deleted from the source
+  """
+  # Writes acknowledged before the block may not be searchable yet, and the copy reads the source with a search
+  es_object.indices.refresh(index=source)
+  reindex(source, target, es_object, query, poll_interval, routing)
+  return removeDeleted(source, target, es_object, routing, source_routing)
+
+
+def removeDeleted(source, target, es_object, routing='keep', source_routing=None, chunk_size=500):
+  """
+  Deletes the documents of the target that no longer exist in the source, after they were copied by reindex
+
+  Parameters
+  ----------
+  source: str
+    Index or alias copied from
+  target: str
+    Index copied to
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  routing: str
+    keep or discard, as in reindex (default is keep)
+  source_routing: str
+    Routing of every document in the source, used when the copies were made with routing discard (default is None)
+  chunk_size: int
+    Number of documents checked per request (default is 500)
+
+  Returns
+  -------
+  int
+    Number of documents deleted
+  """
+  removed = 0
+  hits = helpers.scan(es_object, index=target, _source=False, size=chunk_size)
+  for chunk in iter(lambda: list(islice(hits, chunk_size)), []):
+    docs = []
+    for hit in chunk:
+      doc_routing = hit.get('_routing') if routing == 'keep' else source_routing
+      docs.append(dict({'_id': hit['_id']}, **({'routing': doc_routing} if doc_routing is not None else {})))
+    found = es_object.mget(index=source, body={'docs': docs}, _source=False)['docs']
+    for hit, doc in zip(chunk, found):
+      if not doc.get('found'):
+        es_object.delete(index=target, id=hit['_id'], routing=hit.get('_routing'), ignore=404)
+        removed += 1
+  return removed
+
+
+def blockWrites(index, es_object, blocked=True):
+  """
+  Blocks or allows writes to an index. Blocked writes are rejected by Elasticsearch rather than lost
+
+  Parameters
+  ----------
+  index: str
+    Name of the index
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  blocked: bool
+    Whether writes are blocked (default is True)
+  """
+  es_object.indices.put_settings(index=index, body={'index.blocks.write': blocked})
+
+
+def _movedAliases(source, target, alias, es_object, remove):
+  # Actions that move the other aliases of the source index, keeping their filters and routing
+  actions = []
+  for name, definition in es_object.indices.get_alias(index=source).get(source, {}).get('aliases', {}).items():
+    if name == alias:
+      continue
+    added = {'index': target, 'alias': name}
+    for key in ('filter', 'index_routing', 'search_routing'):
+      if key in definition:
+        added[key] = definition[key]
+    if remove:
+      actions.append({'remove': {'index': source, 'alias': name}})
+    actions.append({'add': added})
+  return actions
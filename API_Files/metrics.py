@@ -0,0 +1,263 @@
+'''Request Metrics
+
+This file contains the counters and histograms used to see where the time of each request goes, and renders them in the
+Prometheus text format served by GET /metrics.
+  requests: count and latency of each route, by method and status
+  backend: count and latency of each Elasticsearch call, by operation, recorded by InstrumentedTransport
+  per route backend use: number of Elasticsearch calls made, and seconds spent in them, by the requests of each route
+  errors: count of the error responses returned by api_errors.error_response, by status
+
+Metrics are kept in the memory of each app process, so each worker of a preforked server reports its own values.
+
+'''
+
+import threading
+import time
+from contextvars import ContextVar
+from elasticsearch import Transport, TransportError
+
+# Upper bounds, in seconds, of the latency histogram buckets
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Elasticsearch calls made, and seconds spent in them, by the request handled in the current context
+_request_backend = ContextVar('addressbook_request_backend', default=None)
+
+
+class Histogram:
+  """
+  Cumulative histogram of observed values, with a separate series for each set of label values
+
+  Parameters
+  ----------
+  buckets: tuple
+    Upper bounds of the buckets, in increasing order (default is latency_buckets)
+  """
+
+  def __init__(self, buckets=latency_buckets):
+    self.buckets = tuple(buckets)
+    self.series = {}
+
+  def observe(self, labels, value):
+    counts = self.series.get(labels)
+    if counts is None:
+      counts = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+    for position, bound in enumerate(self.buckets):
+      if value <= bound:
+        counts[0][position] += 1
+        break
+    counts[1] += value
+    counts[2] += 1
+
+
+class Metrics:
+  """
+  Registry of the request, backend, and error metrics of one app process
+
+  Attributes
+  ----------
+  requests, backend_calls, errors: dict
+    Counters keyed by their label values
+  request_latency, backend_latency: Histogram
+    Latencies in seconds keyed by their label values
+  """
+
+  def __init__(self):
+    self.requests = {}
+    self.request_latency = Histogram()
+    self.request_backend_calls = {}
+    self.request_backend_seconds = {}
+    self.slow_requests = {}
+    self.backend_calls = {}
+    self.backend_latency = Histogram()
+    self.errors = {}
+    self._lock = threading.Lock()
+
+  def startRequest(self):
+    """Starts counting the Elasticsearch calls made by the request handled in the current context"""
+    _request_backend.set([0, 0.0])
+
+  def observeRequest(self, method, route, status, seconds):
+    """
+    Records a finished request
+
+    Parameters
+    ----------
+    method: str
+      HTTP method of the request
+    route: str
+      URL rule that matched the request, such as /contact/<contact_name>
+    status: int
+      Status code of the response
+    seconds: float
+      Time taken to build the response
+
+    Returns
+    -------
+    tuple
+      The number of Elasticsearch calls made by the request, and the seconds spent in them
+    """
+    backend = _request_backend.get() or [0, 0.0]
+    _request_backend.set(None)
+    with self._lock:
+      _increment(self.requests, (method, route, str(status)))
+      self.request_latency.observe((method, route), seconds)
+      _increment(self.request_backend_calls, (method, route), backend[0])
+      _increment(self.request_backend_seconds, (method, route), backend[1])
+    return backend[0], backend[1]
+
+  def observeSlowRequest(self, method, route):
+    """Records a request that took longer than the slow request threshold"""
+    with self._lock:
+      _increment(self.slow_requests, (method, route))
+
+  def observeBackend(self, operation, status, seconds):
+    """
+    Records an Elasticsearch call, and adds it to the request handled in the current context
+
+    Parameters
+    ----------
+    operation: str
+      Operation name from backendOperation, such as get or search
+    status: str
+      Status code of the Elasticsearch response, or error when no response was received
+    seconds: float
+      Time taken by the call, including retries on other nodes
+    """
+    backend = _request_backend.get()
+    if backend is not None:
+      backend[0] += 1
+      backend[1] += seconds
+    with self._lock:
+      _increment(self.backend_calls, (operation, status))
+      self.backend_latency.observe((operation,), seconds)
+
+  def observeError(self, status):
+    """Records an error response returned to the user"""
+    with self._lock:
+      _increment(self.errors, (str(status),))
+
+  def render(self, gauges=()):
+    """
+    Returns every metric in the Prometheus text format
+
+    Parameters
+    ----------
+    gauges: iterable
+      Extra (name, help, value) metrics to include, such as the contact cache counters (default is none)
+
+    Returns
+    -------
+    str
+      The metrics, one sample per line
+    """
+    lines = []
+    with self._lock:
+      _counter(lines, 'addressbook_requests_total', "Requests handled, by method, route, and status.",
+        ('method', 'route', 'status'), self.requests)
+      _histogram(lines, 'addressbook_request_duration_seconds', "Time taken to build each response, by method and route.",
+        ('method', 'route'), self.request_latency)
+      _counter(lines, 'addressbook_request_backend_calls_total', "Elasticsearch calls made by requests, by method and route.",
+        ('method', 'route'), self.request_backend_calls)
+      _counter(lines, 'addressbook_request_backend_seconds_total', "Seconds requests spent waiting for Elasticsearch, by method and route.",
+        ('method', 'route'), self.request_backend_seconds)
+      _counter(lines, 'addressbook_slow_requests_total', "Requests slower than the slow request threshold, by method and route.",
+        ('method', 'route'), self.slow_requests)
+      _counter(lines, 'addressbook_backend_requests_total', "Elasticsearch calls, by operation and status.",
+        ('operation', 'status'), self.backend_calls)
+      _histogram(lines, 'addressbook_backend_duration_seconds', "Time taken by each Elasticsearch call, by operation.",
+        ('operation',), self.backend_latency)
+      _counter(lines, 'addressbook_errors_total', "Error responses returned, by status.", ('status',), self.errors)
+    for name, help, value in gauges:
+      lines.append('# HELP '+name+' '+help)
+      lines.append('# TYPE '+name+' gauge')
+      lines.append(name+' '+_number(value))
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedTransport(Transport):
+  """
+  Elasticsearch transport that records the operation, status, and duration of every call in registry
+
+  Used by passing transport_class=InstrumentedTransport when creating the client, as config.clientOptions does.
+  Calls made by the helpers, such as scan and bulk, are recorded as well.
+  """
+
+  def perform_request(self, method, url, headers=None, params=None, body=None):
+    started = time.perf_counter()
+    status = 'error'
+    try:
+      result = super().perform_request(method, url, headers=headers, params=params, body=body)
+      status = '200' if method != 'HEAD' or result else '404'
+      return result
+    except TransportError as error:
+      status = str(error.status_code) if isinstance(error.status_code, int) else 'error'
+      raise
+    finally:
+      registry.observeBackend(backendOperation(method, url), status, time.perf_counter() - started)
+
+
+def backendOperation(method, url):
+  """
+  Returns a short name for an Elasticsearch call, used as the operation label of the backend metrics
+
+  Parameters
+  ----------
+  method: str
+    HTTP method of the call
+  url: str
+    Path of the call, such as /addressbook/_doc/John%20Doe or /_search
+
+  Returns
+  -------
+  str
+    The first API name in the path without its underscore, such as search, bulk, or mget. Document calls are named
+    get, index, delete, or exists by their method, and calls with no API name, such as creating an index, are named indices
+  """
+  for part in url.split('?')[0].split('/'):
+    if part.startswith('_'):
+      if part == '_doc':
+        return {'GET': 'get', 'HEAD': 'exists', 'DELETE': 'delete'}.get(method, 'index')
+      if part == '_pit' and method == 'DELETE':
+        return 'close_pit'
+      return part[1:] if part != '_pit' else 'open_pit'
+  return 'indices'
+
+
+def _increment(counters, labels, amount=1):
+  counters[labels] = counters.get(labels, 0) + amount
+
+
+def _labels(names, values):
+  return '{' + ','.join(name+'="'+_escape(value)+'"' for name, value in zip(names, values)) + '}' if names else ''
+
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _counter(lines, name, help, names, counters):
+  lines.append('# HELP '+name+' '+help)
+  lines.append('# TYPE '+name+' counter')
+  for values, value in sorted(counters.items()):
+    lines.append(name+_labels(names, values)+' '+_number(value))
+
+
+def _histogram(lines, name, help, names, histogram):
+  lines.append('# HELP '+name+' '+help)
+  lines.append('# TYPE '+name+' histogram')
+  for values, (counts, total, count) in sorted(histogram.series.items()):
+    cumulative = 0
+    for bound, bucket in zip(histogram.buckets, counts):
+      cumulative += bucket
+      lines.append(name+'_bucket'+_labels(names + ('le',), values + (repr(bound),))+' '+str(cumulative))
+    lines.append(name+'_bucket'+_labels(names + ('le',), values + ('+Inf',))+' '+str(count))
+    lines.append(name+'_sum'+_labels(names, values)+' '+repr(total))
+    lines.append(name+'_count'+_labels(names, values)+' '+str(count))
+
+
+# Metrics of the current app process
+registry = Metrics()
@@ -0,0 +1,144 @@
+'''Search Pagination
+
+This file contains the methods used to page through contact search results. Offset paging (pageSize and page)
+is limited by the Elasticsearch max_result_window, so every search response also carries an opaque cursor
+which continues from the last returned contact using search_after. Cursor pages are served from a
+point in time when the Elasticsearch cluster supports them, so a walk through a large address book sees
+a consistent view of the index.
+
+'''
+
+import base64
+import json
+
+# Elasticsearch rejects from/size searches that go past this many results
+max_result_window = 10000
+# How long an idle point in time is kept open between cursor pages
+keep_alive = '1m'
+# Stable sort used by all contact searches. Relevance first, then the unique fullname as a tiebreaker
+sort = [{'_score': 'desc'}, {'fullname.keyword': {'order': 'asc', 'unmapped_type': 'keyword'}}]
+# Points in time add a _shard_doc tiebreaker to the sort. Since fullname is already unique, continuing an
+# offset page inside a point in time can use the largest possible value for it
+_max_shard_doc = 2**63 - 1
+
+
+def encodeCursor(query, page_size, search_after, pit_id=None, use_pit=True):
+  """
+  Builds the opaque cursor returned to users for fetching the next page of results
+
+  Parameters
+  ----------
+  query: str
+    Query the results were searched with
+  page_size: int
+    Number of contacts per page
+  search_after: list
+    Sort values of the last contact on the current page
+  pit_id: str
+    Point in time the results were read from (default is None)
+  use_pit: bool
+    Whether later pages should try to open a point in time (default is True)
+
+  Returns
+  -------
+  str
+    URL safe cursor string
+  """
+  state = {'q': query, 's': page_size, 'a': search_after}
+  if pit_id:
+    state['p'] = pit_id
+  if not use_pit:
+    state['n'] = 1
+  data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decodeCursor(cursor):
+  """
+  Reads the state stored in a cursor created by encodeCursor
+
+  Parameters
+  ----------
+  cursor: str
+    Cursor string sent by the user
+
+  Raises
+  ------
+  ValueError
+    If the cursor was not created by encodeCursor
+
+  Returns
+  -------
+  dict
+    Dictionary with the query, page size, search_after values, point in time id, and whether to use points in time
+  """
+  try:
+    data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    state = json.loads(data.decode('utf-8'))
+    return {'query': str(state['q']), 'page_size': int(state['s']), 'search_after': list(state['a']),
+      'pit_id': state.get('p'), 'use_pit': not state.get('n')}
+  except (ValueError, TypeError, KeyError, AttributeError):
+    raise ValueError("Invalid cursor. Please use the next value returned by a previous search.")
+
+
+def searchAfter(values, pit_id):
+  """
+  Returns the search_after values to send with a search
+
+  Parameters
+  ----------
+  values: list
+    Sort values of the last contact on the previous page
+  pit_id: str
+    Point in time the search will use, or None
+
+  Returns
+  -------
+  list
+    search_after values matching the sort used by the search
+  """
+  if pit_id and len(values) == len(sort):
+    return values + [_max_shard_doc]
+  return values
+
+
+def openPointInTime(index, es_object):
+  """
+  Opens a point in time on the specified index if the client and cluster support them
+
+  Parameters
+  ----------
+  index: str
+    Name of the index to open the point in time on
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+
+  Returns
+  -------
+  str
+    The point in time id, or None if points in time are not available
+  """
+  if not hasattr(es_object, 'open_point_in_time'):
+    return None
+  try:
+    return es_object.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+  except Exception:
+    return None
+
+
+def closePointInTime(pit_id, es_object):
+  """
+  Releases a point in time once the last page has been read
+
+  Parameters
+  ----------
+  pit_id: str
+    The point in time to close
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  """
+  try:
+    es_object.close_point_in_time(body={'id': pit_id})
+  except Exception:
+    # The point in time expires on its own after keep_alive
+    pass
@@ -0,0 +1,115 @@
+'''Search Result Projection
+
+This file contains the methods used to trim search results down to what the caller asked for.
+The fields parameter selects the contact fields returned for each hit, and is passed to Elasticsearch as _source
+includes and excludes so unused fields are never read or sent. The slim shape replaces the Elasticsearch hits object,
+with its _index, _type, _score, and sort values, by a plain list of contacts:
+{
+  'total': number of matching contacts,
+  'contacts': [{'fullname': ..., other selected fields}, ...],
+  'next': cursor for the next page, or None
+}
+
+'''
+
+from API_Files import contact
+
+# Elasticsearch response paths kept for slim search results
+slim_filter_path = ['hits.total', 'hits.hits._id', 'hits.hits._source', 'hits.hits.sort', 'pit_id']
+
+
+def parseProjection(value):
+  """
+  Reads the comma separated list of fields to return for each contact
+
+  Parameters
+  ----------
+  value: str
+    Field names separated by commas. A name starting with - is left out, for example fields=-email. An empty value selects every field
+
+  Raises
+  ------
+  ValueError
+    If a field is not a contact field
+
+  Returns
+  -------
+  tuple
+    The included and the excluded fields, or None when every field is selected
+  """
+  includes, excludes = [], []
+  for name in (name.strip() for name in (value or '').split(',')):
+    if not name:
+      continue
+    field = name[1:] if name.startswith('-') else name
+    if field not in contact.fields:
+      raise ValueError("Unknown field "+field+". Fields can be any of: "+", ".join(contact.fields)+".")
+    (excludes if name.startswith('-') else includes).append(field)
+  if not includes and not excludes:
+    return None
+  return tuple(includes), tuple(excludes)
+
+
+def sourceFilter(projection):
+  """
+  Returns the Elasticsearch _source value for a projection
+
+  Parameters
+  ----------
+  projection: tuple
+    Included and excluded fields from parseProjection, or None
+
+  Returns
+  -------
+  bool, list, or dict
+    True for every field, the list of included fields, or the includes and excludes
+  """
+  if projection is None:
+    return True
+  includes, excludes = projection
+  if not excludes:
+    return list(includes)
+  return {'includes': list(includes), 'excludes': list(excludes)}
+
+
+def project(source, projection):
+  """
+  Returns the fields of a contact selected by a projection, for stores that do not filter _source themselves
+
+  Parameters
+  ----------
+  source: dict
+    The contact
+  projection: tuple
+    Included and excluded fields from parseProjection, or None
+
+  Returns
+  -------
+  dict
+    The selected fields of the contact
+  """
+  if projection is None:
+    return source
+  includes, excludes = projection
+  return {field: value for field, value in source.items() if (not includes or field in includes) and field not in excludes}
+
+
+def slim(hits):
+  """
+  Returns search results in the slim shape
+
+  Parameters
+  ----------
+  hits: dict
+    The hits object of a search, with next set to the cursor of the following page
+
+  Returns
+  -------
+  dict
+    The total number of matches, the contacts with their fullname first, and the next cursor
+  """
+  total = hits.get('total', 0)
+  contacts = []
+  for hit in hits.get('hits', []):
+    contacts.append({'fullname': hit['_id'], **hit.get('_source', {})})
+  return {'total': total['value'] if isinstance(total, dict) else total, 'contacts': contacts, 'next': hits.get('next')}
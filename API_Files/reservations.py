@@ -0,0 +1,375 @@
+'''Contact Uniqueness Reservations
+
+This file contains the methods used to keep contact names, phone numbers, and email addresses unique.
+Each contact is stored with its fullname as the document id, and every phone number and email address in use
+is stored as a reservation document whose id is the value itself. All documents are written with create-only
+operations in one bulk request, so Elasticsearch rejects a duplicate in the same round trip as the write,
+without depending on search results that only become visible after a refresh.
+
+A reservation document is formatted as follows:
+Reservation = {
+  'fullname': fullname of the contact holding the value,
+  'phone' or 'email': the reserved value
+}
+
+Contacts of the default address book use the indices above and unprefixed ids. The contacts of other address books are
+described by a Space, which gives the aliases they are stored under, a prefix added to every document id, and fields added
+to every document, so several books can share the same indices without their names, phone numbers, or emails colliding.
+
+'''
+
+from elasticsearch import helpers
+
+contact_index = 'addressbook'
+reservation_index = 'addressbook-reservations'
+# Indices shared by the address books small enough not to have their own
+book_contact_index = 'addressbook-books'
+book_reservation_index = 'addressbook-reservations-books'
+# Contact fields that must be unique across the AddressBook, other than fullname
+unique_fields = ('phone', 'email')
+
+
+class Space:
+  """
+  Indices and document ids used by one address book
+
+  Parameters
+  ----------
+  contact_index: str
+    Alias the contacts are stored under (default is addressbook)
+  reservation_index: str
+    Alias the reservations are stored under (default is addressbook-reservations)
+  prefix: str
+    Added to the start of every document id (default is no prefix)
+  fields: dict
+    Added to every document written, and removed from every document read (default is no fields)
+  """
+
+  def __init__(self, contact_index=contact_index, reservation_index=reservation_index, prefix='', fields=None):
+    self.contact_index = contact_index
+    self.reservation_index = reservation_index
+    self.prefix = prefix
+    self.fields = dict(fields or {})
+
+  def docId(self, key):
+    """Returns the document id of a fullname or reservation id"""
+    return self.prefix+key
+
+  def fullname(self, doc_id):
+    """Returns the fullname of a contact document id"""
+    return doc_id[len(self.prefix):] if self.prefix and doc_id.startswith(self.prefix) else doc_id
+
+  def source(self, source):
+    """Returns a document source with the fields of the space added"""
+    return dict(source, **self.fields) if self.fields else source
+
+  def strip(self, source):
+    """Returns a document source with the fields of the space removed"""
+    if not self.fields:
+      return source
+    return {field: value for field, value in source.items() if field not in self.fields}
+
+
+# Space of the default address book
+default_space = Space()
+
+
+def reservationId(field, value):
+  """
+  Returns the id of the reservation document for a phone number or email address
+
+  Email addresses are compared without case, matching the analyzed search previously used to check them
+
+  Parameters
+  ----------
+  field: str
+    Either phone or email
+  value: str
+    The phone number or email address
+
+  Returns
+  -------
+  str
+    Reservation document id
+  """
+  value = str(value)
+  if field == 'email':
+    value = value.lower()
+  return field+':'+value
+
+
+def createContacts(sources, es_object, space=default_space):
+  """
+  Creates contacts together with the reservations for their phone numbers and email addresses
+
+  All documents are sent in a single bulk request. If any document for a contact is rejected, the documents
+  that were created for it are removed again, so a contact is either stored with all of its reservations or not at all.
+  A conflicting reservation whose contact no longer holds the value (for example after a failed write) is taken over.
+  Documents are only removed if they are unchanged since they were created, so a reservation taken over by another
+  contact in the meantime is kept.
+
+  Parameters
+  ----------
+  sources: list
+    Contacts to create, as python dictionaries from contact.toDict
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  space: Space
+    Address book the contacts are created in (default is the default address book)
+
+  Returns
+  -------
+  list
+    A (status, detail) tuple for each contact, in order. Status is 201 if the contact was created, 409 if the
+    field given in detail is already in use, or the Elasticsearch status with the error reason in detail
+  """
+  return _createGroups(_contactGroups(sources, space), es_object, space)
+
+
+def claim(fullname, values, es_object, space=default_space):
+  """
+  Reserves new phone numbers or email addresses for an existing contact
+
+  Every value is reserved in a single bulk request. If any value is already in use, the values reserved by the
+  request are released again, so either all of the values are reserved for the contact or none are.
+
+  Parameters
+  ----------
+  fullname: str
+    Name of the contact the values are reserved for
+  values: dict
+    New values keyed by field, either phone or email
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  space: Space
+    Address book of the contact (default is the default address book)
+
+  Returns
+  -------
+  tuple
+    A (status, detail) tuple formatted the same way as the results of createContacts
+  """
+  if not values:
+    return (201, None)
+  return _createGroups([_claimGroup(fullname, values, space)], es_object, space)[0]
+
+
+def release(source, es_object, fields=unique_fields, space=default_space, fullname=None):
+  """
+  Removes the reservations held by a contact for the specified fields
+
+  Only the reservations the contact still holds are removed, so a value taken over by another contact keeps its reservation
+
+  Parameters
+  ----------
+  source: dict
+    The contact whose reservations are released
+  es_object: Elasticsearch instance
+    Current Elasticsearch instance
+  fields: tuple
+    Fields to release (default is phone and email)
+  space: Space
+    Address book of the contact (default is the default address book)
+  fullname: str
+    Name of the contact holding the reservations (default is the fullname in source)
+  """
+  ids = [space.docId(reservationId(field, source[field])) for field in fields if source.get(field)]
+  if ids:
+    reservations = es_object.mget(index=space.reservation_index, body={'ids': ids})['docs']
+    _bulkDelete(_heldReservations(reservations, fullname or source.get('fullname'), space.reservation_index), es_object)
+
+
+async def createContactsAsync(sources, es_object):
+  """
+  Creates contacts together with their reservations using an AsyncElasticsearch instance
+
+  Works the same way as createContacts, and returns results in the same format
+  """
+  return await _createGroupsAsync(_contactGroups(sources), es_object)
+
+
+async def claimAsync(fullname, values, es_object):
+  """
+  Reserves new phone numbers or email addresses for an existing contact using an AsyncElasticsearch instance
+
+  Works the same way as claim, and returns a result in the same format
+  """
+  if not values:
+    return (201, None)
+  return (await _createGroupsAsync([_claimGroup(fullname, values)], es_object))[0]
+
+
+async def releaseAsync(source, es_object, fields=unique_fields, fullname=None):
+  """
+  Removes the reservations held by a contact for the specified fields using an AsyncElasticsearch instance
+
+  Works the same way as release
+  """
+  ids = [reservationId(field, source[field]) for field in fields if source.get(field)]
+  if ids:
+    reservations = (await es_object.mget(index=reservation_index, body={'ids': ids}))['docs']
+    await _bulkDeleteAsync(_heldReservations(reservations, fullname or source.get('fullname'), reservation_index), es_object)
+
+
+def _contactGroups(sources, space=default_space):
+  groups = []
+  for source in sources:
+    group = [('fullname', {'_op_type': 'create', '_index': space.contact_index, '_id': space.docId(source['fullname']),
+      '_source': space.source(source)})]
+    for field in unique_fields:
+      group.append((field, _reservationAction('create', field, source[field], source['fullname'], space)))
+    groups.append(group)
+  return groups
+
+
+def _claimGroup(fullname, values, space=default_space):
+  return [(field, _reservationAction('create', field, value, fullname, space)) for field, value in values.items()]
+
+
+def _createGroups(groups, es_object, space=default_space):
+  # Writes every group of create actions in one bulk request, rolling back the groups that are not fully created
+  write = _GroupWrite(groups)
+  responses = helpers.streaming_bulk(es_object, write.actions, chunk_size=max(len(write.actions), 1),
+    raise_on_error=False, raise_on_exception=False)
+  conflicts = write.collect(responses)
+  if conflicts:
+    reservations = es_object.mget(index=space.reservation_index, body={'ids': [action['_id'] for _, _, action in conflicts]})['docs']
+    names = _holderNames(reservations)
+    holders = es_object.mget(index=space.contact_index, body={'ids': [space.docId(name) for name in names]})['docs'] if names else []
+    for position, field, action, method, kwargs in _staleClaims(conflicts, reservations, holders, space):
+      try:
+        response = getattr(es_object, method)(**kwargs)
+      except Exception:
+        continue
+      write.claimed(position, field, action, response)
+  results, rollback = write.finish()
+  if rollback:
+    _bulkDelete(rollback, es_object)
+  return results
+
+
+async def _createGroupsAsync(groups, es_object):
+  from elasticsearch.helpers import async_streaming_bulk
+
+  write = _GroupWrite(groups)
+  responses = [response async for response in async_streaming_bulk(es_object, write.actions,
+    chunk_size=max(len(write.actions), 1), raise_on_error=False, raise_on_exception=False)]
+  conflicts = write.collect(responses)
+  if conflicts:
+    reservations = (await es_object.mget(index=reservation_index, body={'ids': [action['_id'] for _, _, action in conflicts]}))['docs']
+    names = _holderNames(reservations)
+    holders = (await es_object.mget(index=contact_index, body={'ids': names}))['docs'] if names else []
+    for position, field, action, method, kwargs in _staleClaims(conflicts, reservations, holders):
+      try:
+        response = await getattr(es_object, method)(**kwargs)
+      except Exception:
+        continue
+      write.claimed(position, field, action, response)
+  results, rollback = write.finish()
+  if rollback:
+    await _bulkDeleteAsync(rollback, es_object)
+  return results
+
+
+class _GroupWrite:
+  # Tracks which documents of each group were created, with their versions, so failed groups can be rolled back
+
+  def __init__(self, groups):
+    self.actions, self.owners = [], []
+    for position, group in enumerate(groups):
+      for field, action in group:
+        self.actions.append(action)
+        self.owners.append((position, field))
+    self.failures = [{} for _ in groups]
+    self.created = [[] for _ in groups]
+
+  def collect(self, responses):
+    # Records the bulk results, returning the reservation conflicts of groups that would otherwise have been created
+    conflicts = []
+    for (position, field), action, (ok, response) in zip(self.owners, self.actions, responses):
+      result = response.get('create', {})
+      if ok:
+        self.created[position].append((action, result))
+      elif result.get('status') == 409 and field != 'fullname':
+        conflicts.append((position, field, action))
+      else:
+        self.failures[position][field] = (result.get('status', 500), _reason(result))
+    conflicts = [conflict for conflict in conflicts if not self.failures[conflict[0]]]
+    for position, field, action in conflicts:
+      self.failures[position][field] = (409, field)
+    return conflicts
+
+  def claimed(self, position, field, action, response):
+    del self.failures[position][field]
+    self.created[position].append((action, response))
+
+  def finish(self):
+    # Returns the result of each group, and the documents to delete for the groups that failed with the version they were
+    # created at, so a document written again since, such as a reservation taken over by another contact, is not deleted
+    results, rollback = [], []
+    for position, failure in enumerate(self.failures):
+      if not failure:
+        results.append((201, None))
+        continue
+      rollback.extend((action['_index'], action['_id'], result['_seq_no'], result['_primary_term']) for action, result in self.created[position])
+      for field in ('fullname',) + unique_fields:
+        if field in failure:
+          status, detail = failure[field]
+          results.append((status, field if status == 409 else detail))
+          break
+    return results, rollback
+
+
+def _reservationAction(op_type, field, value, fullname, space=default_space):
+  return {'_op_type': op_type, '_index': space.reservation_index, '_id': space.docId(reservationId(field, value)),
+    '_source': space.source({'fullname': fullname, field: value})}
+
+
+def _holderNames(reservations):
+  return list({doc['_source']['fullname'] for doc in reservations if doc.get('found')})
+
+
+def _staleClaims(conflicts, reservations, holders, space=default_space):
+  # Yields the writes that take over conflicting reservations whose contact no longer holds the value
+  holders = {space.fullname(doc['_id']): doc['_source'] for doc in holders if doc.get('found')}
+  for (position, field, action), reservation in zip(conflicts, reservations):
+    claimant = action['_source']['fullname']
+    if not reservation.get('found'):
+      yield position, field, action, 'create', {'index': space.reservation_index, 'id': action['_id'], 'body': action['_source']}
+      continue
+    holder = reservation['_source']['fullname']
+    if holder != claimant and holder in holders and space.docId(reservationId(field, holders[holder].get(field, ''))) == action['_id']:
+      continue  # The value is in use by another contact
+    yield position, field, action, 'index', {'index': space.reservation_index, 'id': action['_id'], 'body': action['_source'],
+      'if_seq_no': reservation['_seq_no'], 'if_primary_term': reservation['_primary_term']}
+
+
+def _heldReservations(reservations, fullname, index):
+  # Returns the reservations from an mget that are held by a contact, with their versions
+  return [(index, doc['_id'], doc['_seq_no'], doc['_primary_term']) for doc in reservations
+    if doc.get('found') and doc['_source'].get('fullname') == fullname]
+
+
+def _deleteActions(documents):
+  # Deletes each (index, id, seq_no, primary_term) document, only if it is unchanged since that version
+  return ({'_op_type': 'delete', '_index': index, '_id': document_id, 'if_seq_no': seq_no, 'if_primary_term': primary_term}
+    for index, document_id, seq_no, primary_term in documents)
+
+
+def _bulkDelete(documents, es_object):
+  for _ in helpers.streaming_bulk(es_object, _deleteActions(documents), raise_on_error=False, raise_on_exception=False):
+    pass
+
+
+async def _bulkDeleteAsync(documents, es_object):
+  from elasticsearch.helpers import async_streaming_bulk
+
+  async for _ in async_streaming_bulk(es_object, _deleteActions(documents), raise_on_error=False, raise_on_exception=False):
+    pass
+
+
+def _reason(result):
+  error = result.get('error', 'Contact could not be created.')
+  if isinstance(error, dict):
+    error = error.get('reason', error.get('type', 'Contact could not be created.'))
+  return str(error)
@@ -0,0 +1,252 @@
+'''Address Book Statistics
+
+This file contains the counters behind GET /contact/_stats, which reports the number of contacts in an address book,
+and how many use each email domain and each initial of their last name.
+
+The counts are worked out by the store with aggregations over the keyword fields of the contacts. In Elasticsearch the
+domain and initial are runtime fields read from the email and lastname.keyword doc values, so no reindex is needed. Since
+an aggregation reads every contact, each app process keeps counters for every address book it serves, loaded from the
+aggregation on first use and changed by the create, update, and delete methods in api_methods, so most requests are
+answered without a search. Contacts written by other app processes or by the import tools are not seen by the counters,
+so they are reconciled with the aggregation again once they are older than reconcile_interval.
+
+'''
+
+import heapq
+import threading
+import time
+from collections import Counter
+
+# Number of seconds the counters of a book are used before they are reconciled with the store
+default_reconcile_interval = 60.0
+# Default number of email domains reported, the most used first
+default_limit = 10
+# Bucket of last names that do not start with a letter
+other_initial = '#'
+# Names of the facets, and the runtime fields they are aggregated on in Elasticsearch
+facet_fields = {'domains': 'email_domain', 'initials': 'lastname_initial'}
+
+# Runtime fields sent with the aggregations. They must give the same values as emailDomain and lastInitial
+runtime_fields = {
+  'email_domain': {'type': 'keyword', 'script': {'source':
+    "if (doc['email'].size() > 0) { String email = doc['email'].value; int at = email.lastIndexOf('@');"
+    " if (at >= 0) { emit(email.substring(at + 1)); } }"}},
+  'lastname_initial': {'type': 'keyword', 'script': {'source':
+    "if (doc['lastname.keyword'].size() > 0 && doc['lastname.keyword'].value.length() > 0) {"
+    " String initial = doc['lastname.keyword'].value.substring(0, 1).toUpperCase();"
+    " emit(Character.isLetter(initial.charAt(0)) ? initial : '"+other_initial+"'); }"}}
+}
+
+# Longest last name with a value in lastname.keyword, from its ignore_above
+_max_keyword_length = 256
+
+
+def emailDomain(email):
+  """Returns the domain of an email address in lowercase, or None if it has no @"""
+  email = (email or '').lower()
+  return email.rpartition('@')[2] if '@' in email else None
+
+
+def lastInitial(lastname):
+  """Returns the first letter of a last name in uppercase, other_initial if it starts with anything else, or None if it is empty"""
+  if not lastname or len(lastname) > _max_keyword_length:
+    return None
+  initial = lastname[:1].upper()
+  return initial if initial[:1].isalpha() else other_initial
+
+
+def facetValues(source):
+  """Returns the value of each facet for a contact, as a dictionary from facet name to value or None"""
+  return {'domains': emailDomain(source.get('email')), 'initials': lastInitial(source.get('lastname'))}
+
+
+def countFacets(sources):
+  """
+  Counts the contacts, and the contacts with each value of each facet
+
+  Parameters
+  ----------
+  sources: iterable
+    Contacts with at least their email and lastname fields
+
+  Returns
+  -------
+  dict
+    Number of contacts under total, and a dictionary from value to count under the name of each facet
+  """
+  counts = {'total': 0}
+  counts.update((facet, Counter()) for facet in facet_fields)
+  for source in sources:
+    counts['total'] += 1
+    for facet, value in facetValues(source).items():
+      if value is not None:
+        counts[facet][value] += 1
+  return {facet: dict(value) if isinstance(value, Counter) else value for facet, value in counts.items()}
+
+
+class ContactStats:
+  """
+  Counters of the contacts in each address book, by email domain and last name initial
+
+  The counters of a book are loaded with ContactStore.facets the first time its statistics are requested, and only change
+  after that. Changes made while the counters are being reconciled are applied again on top of the new counts, so a
+  change the aggregation already saw is counted twice until the next reconcile.
+
+  Parameters
+  ----------
+  reconcile_interval: float
+    Number of seconds the counters of a book are used before they are reconciled (default is 60). An interval of 0
+    reconciles on every request
+
+  Attributes
+  ----------
+  reconciles: int
+    Number of times counters were loaded or reconciled
+  drift: int
+    Sum of the differences corrected by reconciles, which counts the changes the counters missed
+  """
+
+  def __init__(self, reconcile_interval=default_reconcile_interval, clock=time.monotonic):
+    self.reconcile_interval = reconcile_interval
+    self.clock = clock
+    self.reconciles = 0
+    self.drift = 0
+    self._books = {}
+    self._lock = threading.Lock()
+
+  def tracking(self, store):
+    """Returns whether counters are kept for the address book of a store, so its changes need to be counted"""
+    with self._lock:
+      return store.bookKey() in self._books
+
+  def created(self, store, source):
+    """Counts a contact created in a store"""
+    self._change(store, source, 1)
+
+  def updated(self, store, old, new):
+    """Moves a contact changed in a store from the counts of its old values to the counts of its new ones"""
+    if facetValues(old) != facetValues(new):
+      self._change(store, old, -1)
+      self._change(store, new, 1)
+
+  def deleted(self, store, source):
+    """Removes a contact deleted from a store from the counts"""
+    self._change(store, source, -1)
+
+  def summary(self, store, limit=default_limit, exact=False):
+    """
+    Returns the statistics of the address book of a store, reconciling its counters first when they are due
+
+    Parameters
+    ----------
+    store: ContactStore
+      Store of the address book
+    limit: int
+      Number of email domains reported (default is 10)
+    exact: bool
+      Whether the counters are reconciled even when they are not due (default is False)
+
+    Returns
+    -------
+    dict
+      total, the most used domains, the number of contacts at other domains, every initial in alphabetical order,
+      and the number of seconds since the counters were reconciled
+    """
+    with self._lock:
+      counters = self._books.setdefault(store.bookKey(), _Counters())
+    if exact or not counters.loaded or self.clock() - counters.reconciled >= self.reconcile_interval:
+      self._reconcile(store, counters, exact)
+    with self._lock:
+      return dict(counters.summary(limit), reconciled=round(self.clock() - counters.reconciled, 3))
+
+  def clear(self):
+    """Drops the counters of every book, so they are loaded again on their next request"""
+    with self._lock:
+      self._books.clear()
+
+  def stats(self):
+    """Returns the number of books counted, reconciles, and the drift corrected by them"""
+    with self._lock:
+      return {'books': sum(1 for counters in self._books.values() if counters.loaded), 'reconciles': self.reconciles, 'drift': self.drift}
+
+  def _change(self, store, source, sign):
+    with self._lock:
+      counters = self._books.get(store.bookKey())
+      if counters is None:
+        return
+      if counters.changes is not None:
+        counters.changes.append((source, sign))
+      if counters.loaded:
+        counters.apply(source, sign)
+
+  def _reconcile(self, store, counters, exact):
+    # Only one request reconciles a book at a time. The others use the current counters, unless there are none yet
+    if not counters.reconciling.acquire(blocking=exact or not counters.loaded):
+      return
+    try:
+      if counters.loaded and not exact and self.clock() - counters.reconciled < self.reconcile_interval:
+        return
+      with self._lock:
+        counters.changes = []
+      try:
+        counts = store.facets()
+      except Exception:
+        with self._lock:
+          counters.changes = None
+        raise
+      with self._lock:
+        replacement = _Counters()
+        replacement.load(counts)
+        for source, sign in counters.changes:
+          replacement.apply(source, sign)
+        if counters.loaded:
+          self.drift += counters.difference(replacement)
+        counters.load({'total': replacement.total, **replacement.facets})
+        counters.changes = None
+        counters.reconciled = self.clock()
+        self.reconciles += 1
+    finally:
+      counters.reconciling.release()
+
+
+class _Counters:
+  # Counts of one address book. The summaries are cached until the next change, so reads between writes do not sort the domains again
+
+  def __init__(self):
+    self.loaded = False
+    self.total = 0
+    self.facets = {facet: Counter() for facet in facet_fields}
+    self.reconciled = 0.0
+    self.reconciling = threading.Lock()
+    self.changes = None
+    self._summaries = {}
+
+  def load(self, counts):
+    self.total = counts['total']
+    self.facets = {facet: Counter(counts.get(facet, {})) for facet in facet_fields}
+    self.loaded = True
+    self._summaries = {}
+
+  def apply(self, source, sign):
+    self.total += sign
+    for facet, value in facetValues(source).items():
+      if value is not None:
+        self.facets[facet][value] += sign
+        if self.facets[facet][value] <= 0:
+          del self.facets[facet][value]
+    self._summaries = {}
+
+  def difference(self, other):
+    return abs(self.total - other.total) + sum(abs(self.facets[facet][value] - other.facets[facet][value])
+      for facet in facet_fields for value in set(self.facets[facet]) | set(other.facets[facet]))
+
+  def summary(self, limit):
+    if limit not in self._summaries:
+      domains = heapq.nsmallest(limit, self.facets['domains'].items(), key=lambda item: (-item[1], item[0]))
+      self._summaries[limit] = {
+        'total': self.total,
+        'domains': [{'domain': domain, 'count': count} for domain, count in domains],
+        'other_domains': sum(self.facets['domains'].values()) - sum(count for _, count in domains),
+        'initials': [{'initial': initial, 'count': count} for initial, count in sorted(self.facets['initials'].items())]
+      }
+    return self._summaries[limit]
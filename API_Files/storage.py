@@ -0,0 +1,702 @@
+'''Contact Storage
+
+This file contains the storage interface used by the API methods, and the engines behind it.
+ElasticStore keeps contacts in Elasticsearch, with reservations for uniqueness and points in time for paging.
+MemoryStore keeps contacts in the current process, with hash indexes on fullname, phone, and email and an
+inverted index of the words in each contact for the query search. It needs no cluster, so it can be used for
+small address books at the edge and for tests.
+
+Documents returned by get are formatted the same way as an Elasticsearch get response:
+Document = {
+  '_id': fullname of the contact,
+  '_source': the contact, as a python dictionary from contact.toDict,
+  '_seq_no': number that changes every time the contact is written,
+  '_primary_term': second part of the version, used together with _seq_no
+}
+
+Writes return a (status, detail) tuple, formatted the same way as the results of reservations.createContacts.
+
+'''
+
+import bisect
+import os
+import re
+import threading
+from elasticsearch import helpers
+from elasticsearch.exceptions import ConflictError, NotFoundError
+from elasticsearch.serializer import JSONSerializer
+from API_Files import contact, mappings, pagination, projection, reservations, stats, suggest
+
+# Number of contacts read from Elasticsearch per page when iterating over the whole book
+scan_size = 1000
+# Number of email domains or initials read per page of the facet aggregations
+facet_page_size = 1000
+# Number of times a delete without a version is retried when the contact is written between its read and its delete
+max_delete_attempts = 3
+
+
+class ContactStore:
+  """
+  Interface implemented by every contact storage engine
+  """
+
+  # Address book the store holds, which gives the prefix of its cache keys
+  space = reservations.default_space
+
+  def setup(self):
+    """Prepares the store for use, creating anything it needs that does not exist yet"""
+    return None
+
+  def cacheKey(self, fullname):
+    """Returns the key a contact is cached under, which is unique across address books"""
+    return self.space.docId(fullname)
+
+  def bookKey(self):
+    """Returns the key the search results of the store are cached under, shared by every store holding the same contacts"""
+    return (getattr(self, 'index', None), self.space.prefix)
+
+  def get(self, fullname):
+    """
+    Returns a contact with its version
+
+    Parameters
+    ----------
+    fullname: str
+      Unique fullname of the contact
+
+    Returns
+    -------
+    dict
+      The contact formatted as a Document, or None if it does not exist
+    """
+    raise NotImplementedError
+
+  def getMany(self, fullnames, fields=None):
+    """
+    Returns several contacts with their versions in one call
+
+    Parameters
+    ----------
+    fullnames: list
+      Unique fullnames of the contacts
+    fields: list
+      Fields to return for each contact (default is every field)
+
+    Returns
+    -------
+    list
+      The contact formatted as a Document, or None if it does not exist, for each fullname in order
+    """
+    raise NotImplementedError
+
+  def create(self, sources):
+    """
+    Creates contacts, rejecting any whose fullname, phone number, or email address is already in use
+
+    Parameters
+    ----------
+    sources: list
+      Contacts to create, as python dictionaries from contact.toDict
+
+    Returns
+    -------
+    list
+      A (status, detail) tuple for each contact, in order. Status is 201 if the contact was created,
+      or 409 if the field given in detail is already in use
+    """
+    raise NotImplementedError
+
+  def update(self, current, changes):
+    """
+    Writes the changed fields of a contact, if it has not been written since it was read
+
+    Parameters
+    ----------
+    current: dict
+      The contact as returned by get
+    changes: dict
+      New values keyed by field
+
+    Returns
+    -------
+    tuple
+      (200, None) if the contact was updated, (404, None) if it no longer exists, (409, 'version') if it was
+      written since it was read, or (409, field) if a new phone number or email address is already in use
+    """
+    raise NotImplementedError
+
+  def delete(self, fullname, current=None):
+    """
+    Deletes a contact
+
+    Parameters
+    ----------
+    fullname: str
+      Unique fullname of the contact
+    current: dict
+      The contact as returned by get. When provided, the contact is only deleted if it is unchanged since it was read (default is None)
+
+    Returns
+    -------
+    tuple
+      (200, None) if the contact was deleted, (404, None) if it does not exist, or (409, 'version') if it was written since current was read
+    """
+    raise NotImplementedError
+
+  def search(self, query, size, offset=0, search_after=None, pit_id=None, fields=None, metadata=True):
+    """
+    Searches the contacts for the text entered by the user
+
+    Results are sorted by pagination.sort: best matches first, then by fullname.
+
+    Parameters
+    ----------
+    query: str
+      Keyword or phrase to search for. An empty query or * matches every contact
+    size: int
+      Number of contacts returned
+    offset: int
+      Number of contacts skipped, when search_after is not given (default is 0)
+    search_after: list
+      Sort values of the last contact on the previous page (default is None)
+    pit_id: str
+      Point in time to search, from openPointInTime (default is None)
+    fields: tuple
+      Included and excluded fields of each contact, from projection.parseProjection (default is every field)
+    metadata: bool
+      Whether each hit includes _index, _type, and _score, and the hits include max_score. Only _id, _source, and sort are
+      needed for slim results (default is True)
+
+    Returns
+    -------
+    tuple
+      The hits, formatted as the hits of an Elasticsearch search response, and the point in time id to use for the next page
+    """
+    raise NotImplementedError
+
+  def existsByField(self, field, value, exclude=None):
+    """
+    Checks whether a fullname, phone number, or email address is in use
+
+    Parameters
+    ----------
+    field: str
+      Either fullname, phone, or email
+    value: str
+      The value to look up. Email addresses are compared without case
+    exclude: str
+      Fullname of a contact whose own values are ignored (default is None)
+
+    Returns
+    -------
+    bool
+      True if a contact other than exclude holds the value
+    """
+    raise NotImplementedError
+
+  def count(self):
+    """Returns the number of contacts in the store"""
+    raise NotImplementedError
+
+  def iterate(self, fields=None, query=None):
+    """
+    Yields every contact in the store, or every contact matching a query, in no particular order
+
+    Parameters
+    ----------
+    fields: list
+      Fields to return for each contact (default is every field)
+    query: str
+      Keyword or phrase the contacts must match, as in search (default is every contact)
+    """
+    raise NotImplementedError
+
+  def facets(self):
+    """
+    Counts the contacts in the store by email domain and last name initial
+
+    Returns
+    -------
+    dict
+      Number of contacts under total, and a dictionary from value to count under each facet of stats.facet_fields
+    """
+    return stats.countFacets(self.iterate(['email', 'lastname']))
+
+  def suggest(self, prefix, limit):
+    """Returns up to limit suggestions, formatted by suggest.suggestion, for contacts whose names start with prefix"""
+    raise NotImplementedError
+
+  def generation(self):
+    """Returns a marker that changes whenever a contact is created, updated, or deleted, or None if the store cannot provide one"""
+    return None
+
+  def openPointInTime(self):
+    """Returns a point in time id that keeps later pages of a search consistent, or None if the store does not need one"""
+    return None
+
+  def closePointInTime(self, pit_id):
+    """Releases a point in time once the last page has been read"""
+    return None
+
+
+class ElasticStore(ContactStore):
+  """
+  Stores contacts in Elasticsearch
+
+  When created with a client_factory instead of a client, the client is created on first use, and created again in any
+  process forked from the one that created it, so preforked server workers never share connections.
+
+  Contacts of an address book other than the default one are stored under the aliases and id prefix of its books.Book.
+  Ids are prefixed on the way in and the prefix removed on the way out, so the documents returned always have the fullname as their _id.
+
+  Attributes
+  ----------
+  es: Elasticsearch instance
+    Current Elasticsearch instance
+  index: str
+    Alias the contacts are stored under
+  space: reservations.Space
+    Address book the store holds
+  """
+
+  def __init__(self, es_object=None, index=None, client_factory=None, space=reservations.default_space):
+    self.space = space
+    self.index = index or space.contact_index
+    self.client_factory = client_factory
+    self._client = es_object
+    self._pid = os.getpid()
+    self._lock = threading.Lock()
+
+  @property
+  def es(self):
+    if self.client_factory is not None and (self._client is None or self._pid != os.getpid()):
+      with self._lock:
+        if self._client is None or self._pid != os.getpid():
+          self._client, self._pid = self.client_factory(), os.getpid()
+    return self._client
+
+  def setup(self):
+    if self.space is reservations.default_space:
+      return mappings.ensureIndices(self.es)
+    from API_Files import books
+    return books.ensureBook(self.space, self.es)
+
+  def get(self, fullname):
+    try:
+      return self._document(self.es.get(index=self.index, id=self.space.docId(fullname)))
+    except NotFoundError:
+      return None
+
+  def getMany(self, fullnames, fields=None):
+    if not fullnames:
+      return []
+    docs = self.es.mget(index=self.index, body={'ids': [self.space.docId(fullname) for fullname in fullnames]}, _source=fields or True)['docs']
+    return [self._document(doc) if doc.get('found') else None for doc in docs]
+
+  def create(self, sources):
+    return reservations.createContacts(sources, self.es, self.space)
+
+  def update(self, current, changes):
+    # Reserve any new phone number or email address in one request, then write only the changed fields,
+    # and only if the contact is unchanged since it was read
+    fullname, source = current['_id'], current['_source']
+    replaced = {field: source.get(field, '') for field in reservations.unique_fields
+      if field in changes and reservations.reservationId(field, changes[field]) != reservations.reservationId(field, source.get(field, ''))}
+    claimed = {field: changes[field] for field in replaced}
+    status, detail = reservations.claim(fullname, claimed, self.es, self.space)
+    if status != 201:
+      return (status, detail)
+    try:
+      self.es.update(index=self.index, id=self.space.docId(fullname), body={'doc': changes},
+        if_seq_no=current['_seq_no'], if_primary_term=current['_primary_term'])
+    except (ConflictError, NotFoundError) as error:
+      reservations.release(claimed, self.es, space=self.space, fullname=fullname)
+      return (409, 'version') if isinstance(error, ConflictError) else (404, None)
+    reservations.release(replaced, self.es, space=self.space, fullname=fullname)
+    return (200, None)
+
+  def delete(self, fullname, current=None):
+    # The contact is deleted at the version read, so the reservations released afterwards are those of the contact deleted.
+    # Reservations taken over by another contact in the meantime are kept by release
+    for attempt in range(max_delete_attempts):
+      stored = current or self.get(fullname)
+      if stored is None:
+        return (404, None)
+      try:
+        result = self.es.delete(index=self.index, id=self.space.docId(fullname),
+          if_seq_no=stored['_seq_no'], if_primary_term=stored['_primary_term'])
+      except NotFoundError:
+        return (404, None)
+      except ConflictError:
+        if current is not None:
+          return (409, 'version')
+        continue
+      if result['result'] != 'deleted':
+        return (500, result['result'])
+      reservations.release(stored['_source'], self.es, space=self.space, fullname=fullname)
+      return (200, None)
+    return (409, 'version')
+
+  def search(self, query, size, offset=0, search_after=None, pit_id=None, fields=None, metadata=True):
+    body = {'size': size, 'sort': pagination.sort, 'query': self._scoped(searchQuery(query))}
+    if fields is not None:
+      body['_source'] = projection.sourceFilter(fields)
+    # Leave the metadata of each hit out of the response, so Elasticsearch sends and the client decodes less
+    options = {} if metadata else {'filter_path': projection.slim_filter_path}
+    if search_after is None:
+      body['from'] = offset
+    if pit_id:
+      body['pit'] = {'id': pit_id, 'keep_alive': pagination.keep_alive}
+      body['search_after'] = pagination.searchAfter(search_after, pit_id)
+      results = self.es.search(body=body, **options)
+      return self._hits(results), results.get('pit_id', pit_id)
+    if search_after is not None:
+      body['search_after'] = search_after[:len(pagination.sort)]
+    return self._hits(self.es.search(index=self.index, body=body, **options)), None
+
+  def existsByField(self, field, value, exclude=None):
+    if field == 'fullname':
+      return value != exclude and bool(self.es.exists(index=self.index, id=self.space.docId(value)))
+    # A reservation only counts while its contact still holds the value, matching how reservations are taken over
+    try:
+      holder = self.es.get(index=self.space.reservation_index, id=self.space.docId(reservations.reservationId(field, value)))['_source']['fullname']
+    except NotFoundError:
+      return False
+    if holder == exclude:
+      return False
+    held = self.get(holder)
+    return held is not None and reservations.reservationId(field, held['_source'].get(field, '')) == reservations.reservationId(field, value)
+
+  def count(self):
+    return self.es.count(index=self.index)['count']
+
+  def iterate(self, fields=None, query=None):
+    # Scrolls through the index a page at a time, so only one page of contacts is held in memory
+    for hit in helpers.scan(self.es, index=self.index, query={'query': searchQuery(query or '')}, size=scan_size, _source=fields or True):
+      yield self.space.strip(hit['_source'])
+
+  def facets(self):
+    # Pages through a composite aggregation on the runtime field of each facet, so every value is counted however many there are
+    counts = {}
+    for facet, field in stats.facet_fields.items():
+      counts[facet], after = {}, None
+      while True:
+        composite = {'size': facet_page_size, 'sources': [{facet: {'terms': {'field': field}}}]}
+        if after is not None:
+          composite['after'] = after
+        body = {'size': 0, 'track_total_hits': True, 'runtime_mappings': {field: stats.runtime_fields[field]}, 'aggs': {facet: {'composite': composite}}}
+        results = self.es.search(index=self.index, body=body, filter_path=['hits.total.value', 'aggregations'])
+        counts.setdefault('total', results['hits']['total']['value'])
+        aggregation = results.get('aggregations', {}).get(facet, {})
+        counts[facet].update((bucket['key'][facet], bucket['doc_count']) for bucket in aggregation.get('buckets', []))
+        after = aggregation.get('after_key')
+        if after is None or len(aggregation.get('buckets', [])) < facet_page_size:
+          break
+    return counts
+
+  def suggest(self, prefix, limit):
+    body = {'size': limit, '_source': ['fullname', 'firstname', 'lastname'],
+      'query': {'multi_match': {'query': prefix, 'fields': mappings.suggest_fields, 'operator': 'and'}}}
+    results = self.es.search(index=self.index, body=body, filter_path=['hits.hits._id', 'hits.hits._source'])
+    return [suggest.suggestion(dict(hit['_source'], fullname=self.space.fullname(hit['_id']))) for hit in results.get('hits', {}).get('hits', [])]
+
+  def generation(self):
+    # Write and refresh counters of the primary shards. Writes change the marker straight away, and the refresh that makes
+    # them searchable changes it again, so a search result is never tagged with a marker taken before it was visible
+    stats = self.es.indices.stats(index=self.index, metric='docs,indexing,refresh', filter_path=['_all.primaries', 'indices.*.uuid'])
+    primaries = stats.get('_all', {}).get('primaries', {})
+    return '%s:%s:%s:%s:%s' % (','.join(sorted(index.get('uuid', '') for index in stats.get('indices', {}).values())),
+      primaries.get('docs', {}).get('count'), primaries.get('indexing', {}).get('index_total'),
+      primaries.get('indexing', {}).get('delete_total'), primaries.get('refresh', {}).get('total'))
+
+  def openPointInTime(self):
+    return pagination.openPointInTime(self.index, self.es)
+
+  def closePointInTime(self, pit_id):
+    pagination.closePointInTime(pit_id, self.es)
+
+  def _document(self, document):
+    # Removes the address book's id prefix and fields from a document read from Elasticsearch
+    if self.space is not reservations.default_space:
+      document['_id'] = self.space.fullname(document['_id'])
+      if '_source' in document:
+        document['_source'] = self.space.strip(document['_source'])
+    return document
+
+  def _scoped(self, query):
+    # Searches of a point in time read the whole index, so the filter of a shared book's alias is repeated in the query
+    if not self.space.fields:
+      return query
+    return {'bool': {'must': query, 'filter': [{'term': {field: value}} for field, value in self.space.fields.items()]}}
+
+  def _hits(self, results):
+    # A filter_path drops the hits list when nothing matched, so put it back
+    hits = results.get('hits', {})
+    hits.setdefault('hits', [])
+    for hit in hits['hits']:
+      self._document(hit)
+    return hits
+
+
+class MemoryStore(ContactStore):
+  """
+  Stores contacts in the memory of the current process
+
+  Contacts are held as contact.Contact objects, found by fullname, phone number, and email address through hash indexes,
+  and searched through an inverted index from each lowercase word to the contacts containing it. Words are scored with the same field boosts
+  as mappings.search_fields, and a query word ending in * matches every word starting with it.
+  All methods are safe to call from several threads.
+
+  Attributes
+  ----------
+  index: str
+    Index name reported in search hits
+  space: reservations.Space
+    Address book the store holds
+  """
+
+  def __init__(self, contacts=(), index=None, space=reservations.default_space):
+    self.space = space
+    self.index = index or space.contact_index
+    self._contacts = {}
+    self._versions = {}
+    self._unique = {}
+    self._postings = {}
+    self._words = []
+    self._seq_no = 0
+    self._names = suggest.PrefixIndex()
+    self._names.reset([])
+    self._lock = threading.RLock()
+    if contacts:
+      self.create(list(contacts))
+
+  def bookKey(self):
+    # Contacts are only held by this store, so its results are cached apart from those of every other store
+    return (id(self), self.space.prefix)
+
+  def get(self, fullname):
+    with self._lock:
+      record = self._contacts.get(fullname)
+      if record is None:
+        return None
+      return {'_index': self.index, '_id': fullname, '_seq_no': self._versions[fullname], '_primary_term': 1,
+        'found': True, '_source': record.toDict()}
+
+  def getMany(self, fullnames, fields=None):
+    with self._lock:
+      documents = [self.get(fullname) for fullname in fullnames]
+    if fields:
+      for document in documents:
+        if document is not None:
+          document['_source'] = {field: value for field, value in document['_source'].items() if field in fields}
+    return documents
+
+  def create(self, sources):
+    results = []
+    with self._lock:
+      for source in sources:
+        results.append(self._conflict(source['fullname'], source, check_name=True) or (201, None))
+        if results[-1][0] == 201:
+          self._store(contact.Contact.fromDict(source))
+    return results
+
+  def update(self, current, changes):
+    fullname = current['_id']
+    with self._lock:
+      record = self._contacts.get(fullname)
+      if record is None:
+        return (404, None)
+      if self._versions[fullname] != current['_seq_no']:
+        return (409, 'version')
+      conflict = self._conflict(fullname, changes)
+      if conflict:
+        return conflict
+      self._discard(fullname)
+      self._store(record.replace(changes))
+    return (200, None)
+
+  def delete(self, fullname, current=None):
+    with self._lock:
+      if fullname not in self._contacts:
+        return (404, None)
+      if current is not None and self._versions[fullname] != current['_seq_no']:
+        return (409, 'version')
+      self._discard(fullname)
+    return (200, None)
+
+  def search(self, query, size, offset=0, search_after=None, pit_id=None, fields=None, metadata=True):
+    with self._lock:
+      scores = self._score(query)
+      ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+      if search_after is not None:
+        last = (-float(search_after[0]), str(search_after[1]))
+        start = bisect.bisect_right([(-score, fullname) for fullname, score in ranked], last)
+      else:
+        start = offset
+      hits = [{'_index': self.index, '_id': fullname, '_score': score, '_source': projection.project(self._contacts[fullname].toDict(), fields),
+        'sort': [score, fullname]} for fullname, score in ranked[start:start + size]]
+    if not metadata:
+      return {'total': {'value': len(ranked), 'relation': 'eq'},
+        'hits': [{'_id': hit['_id'], '_source': hit['_source'], 'sort': hit['sort']} for hit in hits]}, None
+    return {'total': {'value': len(ranked), 'relation': 'eq'}, 'max_score': ranked[0][1] if ranked else None,
+      'hits': hits}, None
+
+  def existsByField(self, field, value, exclude=None):
+    with self._lock:
+      if field == 'fullname':
+        holder = value if value in self._contacts else None
+      else:
+        holder = self._unique.get(reservations.reservationId(field, value))
+    return holder is not None and holder != exclude
+
+  def count(self):
+    with self._lock:
+      return len(self._contacts)
+
+  def iterate(self, fields=None, query=None):
+    with self._lock:
+      if query:
+        records = [self._contacts[fullname] for fullname in self._score(query)]
+      else:
+        records = list(self._contacts.values())
+    for record in records:
+      yield {field: getattr(record, field) for field in fields if field in contact.fields} if fields else record.toDict()
+
+  def suggest(self, prefix, limit):
+    return self._names.search(prefix, limit)
+
+  def generation(self):
+    with self._lock:
+      return str(self._seq_no)
+
+  def _conflict(self, fullname, source, check_name=False):
+    if check_name and fullname in self._contacts:
+      return (409, 'fullname')
+    for field in reservations.unique_fields:
+      if source.get(field) and self._unique.get(reservations.reservationId(field, source[field]), fullname) != fullname:
+        return (409, field)
+    return None
+
+  def _store(self, record):
+    fullname = record.fullname
+    self._seq_no += 1
+    self._contacts[fullname] = record
+    self._versions[fullname] = self._seq_no
+    for field in reservations.unique_fields:
+      if getattr(record, field):
+        self._unique[reservations.reservationId(field, getattr(record, field))] = fullname
+    for word, weight in _wordWeights(record).items():
+      if word not in self._postings:
+        self._postings[word] = {}
+        bisect.insort(self._words, word)
+      self._postings[word][fullname] = weight
+    self._names.add(record.toDict())
+
+  def _discard(self, fullname):
+    record = self._contacts.pop(fullname)
+    del self._versions[fullname]
+    self._seq_no += 1
+    for field in reservations.unique_fields:
+      if getattr(record, field):
+        self._unique.pop(reservations.reservationId(field, getattr(record, field)), None)
+    for word in _wordWeights(record):
+      postings = self._postings[word]
+      postings.pop(fullname, None)
+      if not postings:
+        del self._postings[word]
+        del self._words[bisect.bisect_left(self._words, word)]
+    self._names.remove(fullname)
+
+  def _score(self, query):
+    # Every contact matching any word of the query is returned, scored by the boosts of the fields each word was found in
+    if query.strip() in ('', '*'):
+      return {fullname: 1.0 for fullname in self._contacts}
+    scores = {}
+    for term in _term_regex.findall(query.lower()):
+      if term.endswith('*'):
+        words = list(_takePrefix(self._words[bisect.bisect_left(self._words, term[:-1]):], term[:-1]))
+      else:
+        words = [term] if term in self._postings else []
+      for word in words:
+        for fullname, weight in self._postings[word].items():
+          scores[fullname] = scores.get(fullname, 0.0) + weight
+    return scores
+
+
+class ContactSerializer(JSONSerializer):
+  """
+  Serializer for Elasticsearch clients that encodes request bodies and decodes responses with orjson when it is installed
+
+  Pass an instance as the serializer of an Elasticsearch or AsyncElasticsearch client. Values orjson cannot encode
+  fall back to the standard serializer.
+  """
+
+  def loads(self, s):
+    if contact.orjson is None:
+      return super().loads(s)
+    try:
+      return contact.orjson.loads(s)
+    except contact.orjson.JSONDecodeError:
+      return super().loads(s)
+
+  def dumps(self, data):
+    if contact.orjson is None or isinstance(data, (str, bytes)):
+      return super().dumps(data)
+    try:
+      return contact.orjson.dumps(data, default=self.default).decode('utf-8')
+    except TypeError:
+      return super().dumps(data)
+
+
+def getStore(backend):
+  """
+  Returns the store used by the API methods
+
+  Parameters
+  ----------
+  backend: ContactStore or Elasticsearch instance
+    A store, which is returned unchanged, or an Elasticsearch instance to wrap in an ElasticStore
+
+  Returns
+  -------
+  ContactStore
+    The store
+  """
+  if isinstance(backend, ContactStore):
+    return backend
+  return ElasticStore(backend)
+
+
+def searchQuery(query):
+  """Returns the Elasticsearch query used to search contacts for the text entered by the user"""
+  if query.strip() in ('', '*'):
+    return {'match_all': {}}
+  return {'query_string': {'fields': mappings.search_fields, 'query': query}}
+
+
+def _fieldBoosts():
+  # Maps each searched contact field to its boost, for example fullname^3 to {'fullname': 3.0}
+  boosts = {}
+  for field in mappings.search_fields:
+    name, _, boost = field.partition('^')
+    boosts[name.split('.')[0]] = float(boost or 1)
+  return boosts
+
+_boosts = _fieldBoosts()
+_word_regex = re.compile(r'\w+')
+_term_regex = re.compile(r'\w+\*?')
+
+
+def _wordWeights(record):
+  weights = {}
+  for field, boost in _boosts.items():
+    for word in set(_word_regex.findall(str(getattr(record, field) or '').lower())):
+      weights[word] = weights.get(word, 0.0) + boost
+  return weights
+
+
+def _takePrefix(words, prefix):
+  for word in words:
+    if not word.startswith(prefix):
+      break
+    yield word
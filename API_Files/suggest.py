@@ -0,0 +1,194 @@
+'''Contact Name Suggestions
+
+This file contains the in-process prefix index used to complete contact names as the user types.
+Small address books are loaded into memory once and answered without calling the contact store. Larger books
+are completed by the store, which for Elasticsearch uses the prefix subfields of the name fields defined in mappings.py.
+
+'''
+
+import bisect
+import threading
+import time
+
+# Books with at most this many contacts are completed in memory
+default_max_contacts = 5000
+# Number of seconds before the in-memory index is reloaded, to pick up writes made by other processes
+default_reload_interval = 300
+
+
+class PrefixIndex:
+  """
+  Sorted arrays of lowercase names searched with binary search
+
+  Each contact is stored under its whole fullname, and under every word of its fullname, firstname, and lastname.
+  Matches on the start of the fullname are returned before matches on a later word.
+
+  Attributes
+  ----------
+  max_contacts: int
+    Largest book loaded into memory
+  reload_interval: float
+    Seconds the loaded index is used for before it is loaded again
+  """
+
+  def __init__(self, max_contacts=default_max_contacts, reload_interval=default_reload_interval, clock=time.monotonic):
+    self.max_contacts = max_contacts
+    self.reload_interval = reload_interval
+    self.clock = clock
+    self.loaded_at = None
+    self.enabled = False
+    self._names = []
+    self._words = []
+    self._contacts = {}
+    self._lock = threading.Lock()
+
+  def stale(self):
+    """Returns True if the index has never been loaded or should be loaded again"""
+    return self.loaded_at is None or self.clock() - self.loaded_at >= self.reload_interval
+
+  def load(self, store):
+    """
+    Loads every contact name in the book, unless the book has more than max_contacts contacts
+
+    Parameters
+    ----------
+    store: ContactStore
+      Store to load the names from
+
+    Returns
+    -------
+    bool
+      True if the index was loaded and can answer suggestions
+    """
+    contacts = []
+    if self.max_contacts > 0 and store.count() <= self.max_contacts:
+      for source in store.iterate(['fullname', 'firstname', 'lastname']):
+        contacts.append(source)
+        if len(contacts) > self.max_contacts:
+          break
+    enabled = 0 < self.max_contacts and len(contacts) <= self.max_contacts
+    self.reset(contacts if enabled else [], enabled)
+    return enabled
+
+  def reset(self, contacts, enabled=True):
+    """
+    Replaces the contents of the index
+
+    Parameters
+    ----------
+    contacts: list
+      Contacts as python dictionaries with fullname, firstname, and lastname
+    enabled: bool
+      Whether the index can answer suggestions (default is True)
+    """
+    with self._lock:
+      self._names, self._words, self._contacts = [], [], {}
+      for source in contacts:
+        self._add(source)
+      self._names.sort()
+      self._words.sort()
+      self.enabled = enabled
+      self.loaded_at = self.clock()
+
+  def add(self, source):
+    """Adds or replaces a contact in the index"""
+    with self._lock:
+      if not self.enabled:
+        return
+      self._remove(source['fullname'])
+      names, words = self._keys(source)
+      for key in names:
+        bisect.insort(self._names, key)
+      for key in words:
+        bisect.insort(self._words, key)
+      self._contacts[source['fullname']] = suggestion(source)
+
+  def remove(self, fullname):
+    """Removes a contact from the index"""
+    with self._lock:
+      if self.enabled:
+        self._remove(fullname)
+
+  def search(self, prefix, limit):
+    """
+    Returns the contacts whose fullname starts with prefix, or whose names have a word starting with each word of prefix
+
+    Parameters
+    ----------
+    prefix: str
+      Start of the name typed by the user
+    limit: int
+      Maximum number of contacts returned
+
+    Returns
+    -------
+    list
+      Contact names as python dictionaries, formatted by suggestion
+    """
+    prefix = ' '.join(prefix.lower().split())
+    words = prefix.split()
+    found = []
+    with self._lock:
+      for fullname in self._matches(self._names, prefix):
+        if len(found) >= limit:
+          break
+        if fullname not in found:
+          found.append(fullname)
+      for fullname in self._matches(self._words, words[0] if words else ''):
+        if len(found) >= limit:
+          break
+        if fullname not in found and all(self._hasWord(fullname, word) for word in words[1:]):
+          found.append(fullname)
+      return [dict(self._contacts[fullname]) for fullname in found]
+
+  def _matches(self, keys, prefix):
+    position = bisect.bisect_left(keys, (prefix,))
+    while position < len(keys) and keys[position][0].startswith(prefix):
+      yield keys[position][1]
+      position += 1
+
+  def _hasWord(self, fullname, prefix):
+    names, words = self._keys(self._contacts[fullname])
+    return any(word.startswith(prefix) for word, _ in words)
+
+  def _add(self, source):
+    names, words = self._keys(source)
+    self._names.extend(names)
+    self._words.extend(words)
+    self._contacts[source['fullname']] = suggestion(source)
+
+  def _remove(self, fullname):
+    source = self._contacts.pop(fullname, None)
+    if source is None:
+      return
+    names, words = self._keys(source)
+    for keys, removed in ((self._names, names), (self._words, words)):
+      for key in removed:
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+          del keys[position]
+
+  def _keys(self, source):
+    fullname = source['fullname']
+    words = set()
+    for field in ('fullname', 'firstname', 'lastname'):
+      words.update(str(source.get(field) or '').lower().split())
+    return [(fullname.lower(), fullname)], [(word, fullname) for word in words]
+
+
+def suggestion(source):
+  """
+  Formats a contact as a suggestion, keeping only its id and names
+
+  Parameters
+  ----------
+  source: dict
+    The contact, or the names of the contact
+
+  Returns
+  -------
+  dict
+    Suggestion with the contacts id, fullname, firstname, and lastname
+  """
+  return {'id': source['fullname'], 'fullname': source['fullname'],
+    'firstname': source.get('firstname', ''), 'lastname': source.get('lastname', '')}
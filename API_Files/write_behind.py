@@ -0,0 +1,563 @@
+'''Write-Behind Store
+
+This file contains the contact store used when write_behind is set. It acknowledges creates, updates, and deletes as soon as
+they are validated and appended to a local journal file, and writes them to the underlying store from a background thread.
+  coalescing: only the latest state of each contact is kept, so a contact edited many times between two flushes is written once
+  flushes: pending contacts are written every flush_interval seconds, or as soon as flush_size of them are waiting, with
+    new contacts created in one bulk request and the current versions of the others read with one multi-get per flush_size contacts
+  overlay: reads of a single contact, lookups of fullnames, phone numbers, and emails, and search hits of a pending contact
+    return its pending state, so a client always reads its own writes. New contacts appear in searches once they are flushed
+  journal: every pending write is appended to the journal, and synced to disk when journal_fsync is set, before it is
+    acknowledged. Each app process appends to its own file, named after its process id, so preforked workers never share
+    one. Writes left in the journal of a process that stopped are moved into the journal of the next store opened on the
+    same journal path, and flushed by it
+
+Pending contacts have ETags made of primary term 0 and a local version, which change to their Elasticsearch ETag once flushed.
+An update, or a delete with If-Match, of a contact with no pending write is journaled with the version of the contact it was
+made to, and is only flushed if the contact still has that version, so a write made by another process in the meantime is
+never overwritten. A write that fails when it is flushed, such as one whose contact was written or deleted by another
+process, is logged and counted as failed, since it was already acknowledged. Process ids are only checked on the local machine, so app processes running on
+different machines or containers must not share a journal directory.
+
+'''
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from API_Files import contact, projection, reservations, storage
+
+logger = logging.getLogger(__name__)
+
+# Number of times a flushed update is retried when the contact is changed by another process at the same time
+max_flush_attempts = 3
+# Number of failed writes kept for stats
+max_failures = 100
+# Journal files of each app process after the shared journal path: the process id, and the suffix of the journal being
+# flushed, or of a journal being moved into another process's journal
+_journal_suffix = re.compile(r'^(?:-(\d+))?(\.flushing|\.adopting)?$')
+
+
+class WriteBehindStore(storage.ContactStore):
+  """
+  Contact store that journals writes and flushes them to another store in the background
+
+  Parameters
+  ----------
+  store: ContactStore
+    Store the writes are flushed to, and reads are made from
+  journal_path: str
+    Journal path shared by the app processes. The pending writes are appended to journal_path followed by a dash and the
+    id of the process. When the store is created, the journals of processes that are no longer running are moved into its own, and
+    replayed with the writes already in it
+  flush_size: int
+    Number of pending contacts that starts a flush, and the largest number written per bulk request (default is 500)
+  flush_interval: float
+    Seconds between flushes (default is 1)
+  fsync: bool
+    Whether each write is synced to disk before it is acknowledged (default is True)
+  on_flush: function
+    Called with the fullnames written by each flush, to invalidate cached copies of them (default is None)
+
+  Attributes
+  ----------
+  journal_path: str
+    Journal file of this process
+  flushed, failed: int
+    Number of contacts written by flushes, and number whose write failed
+  failures: deque
+    The most recent failed writes, as (fullname, status, detail) tuples
+  """
+
+  def __init__(self, store, journal_path, flush_size=500, flush_interval=1.0, fsync=True, on_flush=None):
+    self.store = store
+    self.space = store.space
+    self.shared_path = journal_path
+    self.journal_path = journal_path+'-'+str(os.getpid())
+    self.flush_size = max(int(flush_size), 1)
+    self.flush_interval = flush_interval
+    self.fsync = fsync
+    self.on_flush = on_flush
+    self.flushed = 0
+    self.failed = 0
+    self.failures = deque(maxlen=max_failures)
+    # Latest state of each contact written since the last flush, and of each contact being flushed
+    self._pending = {}
+    self._flushing = {}
+    # Reservation ids held by pending contacts, and released by pending contacts that held them in the store
+    self._holders = {}
+    self._released = {}
+    self._version = 0
+    self._journal = None
+    self._worker = None
+    self._closed = False
+    self._lock = threading.RLock()
+    self._wake = threading.Condition(self._lock)
+    self._write_lock = threading.Lock()
+    self._flush_lock = threading.Lock()
+    self._adopt()
+    self._replay()
+
+  def setup(self):
+    return self.store.setup()
+
+  def bookKey(self):
+    return self.store.bookKey()
+
+  def get(self, fullname):
+    with self._lock:
+      entry = self._entry(fullname)
+      if entry is not None:
+        return self._document(fullname, entry)
+    return self.store.get(fullname)
+
+  def getMany(self, fullnames, fields=None):
+    documents = {}
+    with self._lock:
+      for fullname in fullnames:
+        entry = self._entry(fullname)
+        if entry is not None:
+          documents[fullname] = self._document(fullname, entry, fields)
+    missing = [fullname for fullname in fullnames if fullname not in documents]
+    documents.update(zip(missing, self.store.getMany(missing, fields)))
+    return [documents[fullname] for fullname in fullnames]
+
+  def create(self, sources):
+    results = []
+    with self._write_lock:
+      for source in sources:
+        field = self._conflict(source['fullname'], source)
+        if field is not None:
+          results.append((409, field))
+          continue
+        # A contact created again after a pending delete still replaces the one in the store
+        with self._lock:
+          entry = self._entry(source['fullname'])
+        self._apply(source['fullname'], dict(source), None, entry['base'] if entry is not None else None)
+        results.append((201, None))
+    return results
+
+  def update(self, current, changes):
+    fullname = current['_id']
+    with self._write_lock:
+      with self._lock:
+        entry = self._entry(fullname)
+      if entry is not None:
+        if entry['source'] is None:
+          return (404, None)
+        if current.get('_primary_term') != 0 or current.get('_seq_no') != entry['version']:
+          return (409, 'version')
+      field = self._conflict(fullname, {field: changes[field] for field in reservations.unique_fields if field in changes})
+      if field is not None:
+        return (409, field)
+      if entry is None:
+        self._apply(fullname, dict(current['_source'], **changes), sorted(changes), current['_source'], _version(current))
+      else:
+        fields = None if entry['changes'] is None else sorted(set(entry['changes']) | set(changes))
+        self._apply(fullname, dict(entry['source'], **changes), fields, entry['base'], self._expected(fullname, entry))
+    return (200, None)
+
+  def delete(self, fullname, current=None):
+    with self._write_lock:
+      with self._lock:
+        entry = self._entry(fullname)
+      if entry is not None:
+        if entry['source'] is None:
+          return (404, None)
+        if current is not None and (current.get('_primary_term') != 0 or current.get('_seq_no') != entry['version']):
+          return (409, 'version')
+        base, expected = entry['base'], self._expected(fullname, entry)
+      else:
+        stored = current or self.store.get(fullname)
+        if stored is None:
+          return (404, None)
+        base, expected = stored['_source'], _version(current) if current is not None else None
+      self._apply(fullname, None, None, base, expected)
+    return (200, None)
+
+  def search(self, query, size, offset=0, search_after=None, pit_id=None, fields=None, metadata=True):
+    hits, pit_id = self.store.search(query, size, offset, search_after, pit_id, fields, metadata)
+    with self._lock:
+      if self._pending or self._flushing:
+        overlaid = []
+        for hit in hits.get('hits', []):
+          entry = self._entry(hit['_id'])
+          if entry is None:
+            overlaid.append(hit)
+          elif entry['source'] is not None:
+            overlaid.append(dict(hit, _source=projection.project(dict(entry['source']), fields)))
+        hits['hits'] = overlaid
+    return hits, pit_id
+
+  def existsByField(self, field, value, exclude=None):
+    if field == 'fullname':
+      if value == exclude:
+        return False
+      with self._lock:
+        entry = self._entry(value)
+      if entry is not None:
+        return entry['source'] is not None
+      return self.store.existsByField(field, value, exclude)
+    key = reservations.reservationId(field, value)
+    with self._lock:
+      holder = self._holders.get(key)
+      if holder is not None:
+        return holder != exclude
+      if key in self._released:
+        return False
+    return self.store.existsByField(field, value, exclude)
+
+  def count(self):
+    with self._lock:
+      change = sum(_countChange(entry) for entry in self._effectiveEntries())
+    return self.store.count() + change
+
+  def iterate(self, fields=None, query=None):
+    # Exports read every contact, so pending writes are flushed first rather than merged into the results
+    self.flush()
+    return self.store.iterate(fields, query)
+
+  def facets(self):
+    # Counted by the store after a flush, as for exports
+    self.flush()
+    return self.store.facets()
+
+  def suggest(self, prefix, limit):
+    return self.store.suggest(prefix, limit)
+
+  def generation(self):
+    generation = self.store.generation()
+    if generation is None:
+      return None
+    with self._lock:
+      return str(generation)+'+'+str(self._version)
+
+  def openPointInTime(self):
+    return self.store.openPointInTime()
+
+  def closePointInTime(self, pit_id):
+    return self.store.closePointInTime(pit_id)
+
+  def stats(self):
+    """Returns the number of pending, flushing, flushed, and failed contact writes"""
+    with self._lock:
+      return {'pending': len(self._pending), 'flushing': len(self._flushing), 'flushed': self.flushed, 'failed': self.failed}
+
+  def flush(self):
+    """
+    Writes every pending contact to the store
+
+    Contacts left over from a flush that stopped on an error are written first, and the flush stops again at the first
+    error, leaving the remaining contacts in the journal to be retried.
+
+    Returns
+    -------
+    int
+      Number of contacts written or failed
+    """
+    with self._flush_lock:
+      with self._lock:
+        if not self._flushing:
+          if not self._pending:
+            return 0
+          self._rotate()
+        batch = dict(self._flushing)
+      names = list(batch)
+      written = []
+      try:
+        for start in range(0, len(names), self.flush_size):
+          chunk = names[start:start + self.flush_size]
+          creates = []
+          # Deletes and updates are written before creates, so values they release can be taken by the new contacts
+          for fullname, current in zip(chunk, self.store.getMany(chunk)):
+            entry = batch[fullname]
+            if entry['expected'] is not None and (current is None or _version(current) != entry['expected']):
+              # Written or deleted by another process since the write was made
+              result = (409, 'version') if current is not None else (404, None)
+            elif entry['source'] is None:
+              result = self.store.delete(fullname, current if entry['expected'] is not None else None) if current is not None else (200, None)
+            elif current is None:
+              creates.append(fullname)
+              continue
+            else:
+              result = self._flushUpdate(fullname, current, entry)
+            self._done(fullname, entry, result)
+            written.append(fullname)
+          if creates:
+            for fullname, result in zip(creates, self.store.create([batch[fullname]['source'] for fullname in creates])):
+              self._done(fullname, batch[fullname], result)
+              written.append(fullname)
+      finally:
+        with self._lock:
+          if not self._flushing:
+            _remove(self.journal_path+'.flushing')
+        if written and self.on_flush is not None:
+          self.on_flush(written)
+      return len(written)
+
+  def close(self):
+    """Stops the background thread after a last flush, and closes the journal"""
+    with self._lock:
+      self._closed = True
+      self._wake.notify_all()
+      worker = self._worker
+    if worker is not None:
+      worker.join()
+    else:
+      self.flush()
+    with self._lock:
+      if self._journal is not None:
+        self._journal.close()
+        self._journal = None
+
+  def _entry(self, fullname):
+    # Latest state of a contact that is not in the store yet, or None
+    entry = self._pending.get(fullname)
+    return entry if entry is not None else self._flushing.get(fullname)
+
+  def _effectiveEntries(self):
+    return [self._entry(fullname) for fullname in set(self._pending) | set(self._flushing)]
+
+  def _document(self, fullname, entry, fields=None):
+    if entry['source'] is None:
+      return None
+    source = dict(entry['source'])
+    if fields:
+      source = {field: source[field] for field in fields if field in source}
+    return {'_index': getattr(self.store, 'index', None), '_id': fullname, '_seq_no': entry['version'], '_primary_term': 0,
+      'found': True, '_source': source}
+
+  def _conflict(self, fullname, source):
+    # Returns the first field of source already in use by another contact, or None
+    if 'fullname' in source and self.existsByField('fullname', fullname):
+      return 'fullname'
+    for field in reservations.unique_fields:
+      if source.get(field) and self.existsByField(field, source[field], fullname):
+        return field
+    return None
+
+  def _expected(self, fullname, entry):
+    # Version a write on top of a pending entry is flushed against. An entry being flushed has no version to check, since
+    # the version it is written at is not known
+    with self._lock:
+      return entry['expected'] if self._pending.get(fullname) is entry else None
+
+  def _apply(self, fullname, source, changes, base, expected=None):
+    # Journals the new state of a contact, then makes it visible to reads
+    with self._lock:
+      self._version += 1
+      entry = {'source': source, 'changes': changes, 'base': base, 'expected': expected, 'version': self._version}
+      self._append(fullname, entry)
+      self._index(fullname, self._entry(fullname), False)
+      self._pending[fullname] = entry
+      self._index(fullname, entry, True)
+      self._startWorker()
+      if len(self._pending) >= self.flush_size:
+        self._wake.notify_all()
+
+  def _index(self, fullname, entry, add):
+    # Adds or removes the reservation ids an entry holds, and those it releases from the contact in the store
+    if entry is None:
+      return
+    source = entry['source'] or {}
+    held = {reservations.reservationId(field, source[field]) for field in reservations.unique_fields if source.get(field)}
+    released = {reservations.reservationId(field, entry['base'][field]) for field in reservations.unique_fields
+      if entry['base'] and entry['base'].get(field)} - held
+    for keys, index in ((held, self._holders), (released, self._released)):
+      for key in keys:
+        if add:
+          index[key] = fullname
+        elif index.get(key) == fullname:
+          del index[key]
+
+  def _done(self, fullname, entry, result):
+    # Removes a flushed entry. A newer pending entry for the same contact now starts from what was written
+    status, detail = result
+    with self._lock:
+      if self._flushing.get(fullname) is entry:
+        del self._flushing[fullname]
+      pending = self._pending.get(fullname)
+      if pending is None:
+        self._index(fullname, entry, False)
+      elif status in (200, 201):
+        self._index(fullname, pending, False)
+        pending['base'] = entry['source']
+        self._index(fullname, pending, True)
+      if status in (200, 201):
+        self.flushed += 1
+      else:
+        self.failed += 1
+        self.failures.append((fullname, status, detail))
+    if status not in (200, 201):
+      logger.warning("Could not write contact %s from the journal: %s %s", fullname, status, detail)
+
+  def _flushUpdate(self, fullname, current, entry):
+    # Sets the fields written since the last flush, reading the contact again if another process changed it meanwhile
+    source = entry['source']
+    for attempt in range(max_flush_attempts):
+      if entry['changes'] is None:
+        changes = {field: value for field, value in source.items() if field != 'fullname' and current['_source'].get(field) != value}
+      else:
+        changes = contact.changedFields(current['_source'], {field: source.get(field, '') for field in entry['changes']})
+      if not changes:
+        return (200, None)
+      result = self.store.update(current, changes)
+      if result != (409, 'version') or entry['expected'] is not None:
+        return result
+      current = self.store.get(fullname)
+      if current is None:
+        return self.store.create([source])[0]
+    return (409, 'version')
+
+  def _append(self, fullname, entry):
+    if self._journal is None:
+      self._journal = open(self.journal_path, 'a', encoding='utf-8')
+    record = {'fullname': fullname, 'source': entry['source'], 'changes': entry['changes'], 'base': entry['base'], 'expected': entry.get('expected')}
+    self._journal.write(json.dumps(record, ensure_ascii=False, separators=(',', ':'))+'\n')
+    self._journal.flush()
+    if self.fsync:
+      os.fsync(self._journal.fileno())
+
+  def _rotate(self):
+    # Moves the pending entries, and the journal holding them, aside to be flushed while new writes start a new journal
+    if self._journal is not None:
+      self._journal.close()
+      self._journal = None
+    if os.path.exists(self.journal_path):
+      os.replace(self.journal_path, self.journal_path+'.flushing')
+    self._flushing, self._pending = self._pending, {}
+
+  def _adopt(self):
+    # Appends the writes left by processes that stopped to this process's journal. Each journal is first renamed to this
+    # process's .adopting file, so only one process takes it, and one left there by a stop is taken again by the next store
+    directory, name = os.path.split(self.shared_path)
+    own = os.getpid()
+    journals = []
+    for filename in os.listdir(directory or '.'):
+      match = _journal_suffix.match(filename[len(name):]) if filename.startswith(name) else None
+      if match is None:
+        continue
+      pid = int(match.group(1)) if match.group(1) else None
+      suffix = match.group(2) or ''
+      if (pid == own and suffix != '.adopting') or (pid not in (None, own) and _running(pid)):
+        continue
+      journals.append((suffix != '.adopting', suffix != '.flushing', pid or 0, os.path.join(directory, filename)))
+    adopting = self.journal_path+'.adopting'
+    # Journals being moved go first, then each process's journal being flushed before its newer writes
+    for _, _, _, path in sorted(journals):
+      if path != adopting:
+        try:
+          os.replace(path, adopting)
+        except FileNotFoundError:
+          # Taken by another process first
+          continue
+      records = list(_records(adopting))
+      if records:
+        logger.info("Moving %d contact writes from %s to %s", len(records), path, self.journal_path)
+        for record in records:
+          self._append(record['fullname'], record)
+        self._journal.close()
+        self._journal = None
+      _remove(adopting)
+
+  def _replay(self):
+    # Reloads the writes left in the journal files by a previous process
+    for path, layer in ((self.journal_path+'.flushing', self._flushing), (self.journal_path, self._pending)):
+      for record in _records(path):
+        self._version += 1
+        entry = {'source': record['source'], 'changes': record['changes'], 'base': record['base'],
+          'expected': _version(record['expected']) if record.get('expected') else None, 'version': self._version}
+        self._index(record['fullname'], self._entry(record['fullname']), False)
+        layer[record['fullname']] = entry
+        self._index(record['fullname'], entry, True)
+    if self._pending or self._flushing:
+      logger.info("Replaying %d contact writes from %s", len(self._pending) + len(self._flushing), self.journal_path)
+      self._startWorker()
+
+  def _startWorker(self):
+    if self._worker is None and not self._closed:
+      self._worker = threading.Thread(target=self._run, name='addressbook-write-behind', daemon=True)
+      self._worker.start()
+      atexit.register(self.close)
+
+  def _run(self):
+    while True:
+      with self._lock:
+        if not self._closed and len(self._pending) < self.flush_size:
+          self._wake.wait(self.flush_interval)
+        closed = self._closed
+      try:
+        self.flush()
+      except Exception as error:
+        logger.warning("Could not flush contact writes, retrying in %s seconds: %s", self.flush_interval, error)
+        if not closed:
+          with self._lock:
+            self._wake.wait(self.flush_interval)
+      if closed:
+        return
+
+
+def journalPath(path, book=None):
+  """
+  Returns the journal file of an address book
+
+  Parameters
+  ----------
+  path: str
+    Journal file of the default address book, from the journal_path setting
+  book: books.Book
+    The address book, or None for the default address book
+
+  Returns
+  -------
+  str
+    The path, with the book's name added for books other than the default one
+  """
+  return path if book is None else path+'.'+book.name
+
+
+def _version(document):
+  # Sequence number and primary term of a contact read from the store, or of a journaled version
+  if isinstance(document, dict):
+    return (document['_seq_no'], document['_primary_term'])
+  return tuple(document)
+
+
+def _running(pid):
+  # Checks whether a process id is in use on this machine
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def _countChange(entry):
+  # Contacts a pending entry adds to, or removes from, the count of the store
+  if entry['base'] is None:
+    return 1 if entry['source'] is not None else 0
+  return -1 if entry['source'] is None else 0
+
+
+def _records(path):
+  if not os.path.exists(path):
+    return
+  with open(path, encoding='utf-8') as file:
+    for line in file:
+      try:
+        yield json.loads(line)
+      except ValueError:
+        # The last line is incomplete if the process stopped while writing it
+        logger.warning("Skipping an incomplete write in %s", path)
+
+
+def _remove(path):
+  try:
+    os.remove(path)
+  except FileNotFoundError:
+    pass
@@ -3,34 +3,191 @@
 This file creates the Address Book flask instance, allowing users to make HTTP requests to the specified path
 in order to interact with the API.
 
+The app is built by create_app, which reads its settings with API_Files/config.py from a JSON file named by ADDRESSBOOK_CONFIG,
+ADDRESSBOOK_ environment variables, or keyword arguments. Each app process creates its own Elasticsearch client the first time it
+is used, so the app can be served by several preforked workers, for example: gunicorn --workers 4 "Address_Book:create_app()"
+
+The latency of each route, and the count and latency of the Elasticsearch calls made by each request, are served in the
+Prometheus format by GET /metrics. Set slow_request_ms to log every request slower than that many milliseconds.
+
+Single contacts and search results are sent with an ETag. Requests with a matching If-None-Match header receive
+304 Not Modified, and PUT and DELETE requests with an If-Match header only change the contact if it still has that ETag.
+Responses are compressed with gzip or brotli when the client accepts it, as set by compress_responses and compress_min_bytes.
+
+With write_behind set, creates, updates, and deletes are acknowledged once they are journaled, and written to Elasticsearch
+in the background by API_Files/write_behind.py.
+
+Every contact endpoint is also served under /books/<book>/ for a separate address book, as described in API_Files/books.py.
+Requests without a book use the default address book.
+
 '''
 
-from datetime import datetime
-from flask import Flask, request
+import time
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from elasticsearch import Elasticsearch
-from API_Files import api_methods
+from API_Files import api_methods, books, bulk, cache, compression, config, contact, dedup, etags, export, metrics, projection, reservations, stats, storage, write_behind
+from API_Files.api_errors import bad_request
+
+api = Blueprint('addressbook', __name__)
+admin = Blueprint('admin', __name__)
+
+
+class AddressBookApp(Flask):
+  # Dictionaries returned by the endpoints are serialized straight to bytes with contact.dumps, which uses orjson when it is installed
+  def make_response(self, rv):
+    if isinstance(rv, dict):
+      rv = self.response_class(contact.dumps(rv), mimetype='application/json')
+    return super().make_response(rv)
+
+
+def create_app(config_path=None, **settings):
+  """
+  Creates the Address Book flask app
+
+  Parameters
+  ----------
+  config_path: str
+    JSON configuration file (default is ADDRESSBOOK_CONFIG, or no file)
+  settings: dict
+    Settings that replace the values from the file and environment, as described in API_Files/config.py
+
+  Returns
+  -------
+  Flask
+    The app, with the contact store of each address book under app.extensions['addressbook']
+  """
+  settings = config.loadConfig(config_path, **settings)
+  app = AddressBookApp(__name__)
+  app.config['ADDRESSBOOK'] = settings
+  app.extensions['addressbook'] = createStore(settings)
+  # Set cache_size to 0 to disable caching of single contact lookups
+  api_methods.contact_cache = cache.ContactCache(settings['cache_size'], settings['cache_ttl'], local_ttl=settings['cache_local_ttl'])
+  # Set search_cache_bytes to 0 to disable caching of search result pages
+  api_methods.search_cache = cache.SearchCache(settings['search_cache_bytes'], settings['search_cache_ttl'])
+  api_methods.contact_stats = stats.ContactStats(settings['stats_reconcile_interval'])
+  app.register_blueprint(api)
+  app.register_blueprint(api, url_prefix='/books/<book>')
+  app.register_blueprint(admin)
+
+  @app.before_request
+  def startTimer():
+    g.started = time.perf_counter()
+    metrics.registry.startRequest()
+
+  # Records the latency of the request and its Elasticsearch calls, and logs it when it is slower than slow_request_ms
+  @app.after_request
+  def recordRequest(response):
+    seconds = time.perf_counter() - g.get('started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    calls, backend_seconds = metrics.registry.observeRequest(request.method, route, response.status_code, seconds)
+    slow_ms = app.config['ADDRESSBOOK']['slow_request_ms']
+    if slow_ms and seconds * 1000 >= slow_ms:
+      metrics.registry.observeSlowRequest(request.method, route)
+      app.logger.warning("Slow request: %s %s %d in %.1f ms, %d Elasticsearch calls in %.1f ms", request.method,
+        request.full_path.rstrip('?'), response.status_code, seconds * 1000, calls, backend_seconds * 1000)
+    return response
+
+  # Runs before recordRequest, so the time taken to compress is included in the request latency
+  if settings['compress_responses']:
+    @app.after_request
+    def compressResponse(response):
+      return compression.compressResponse(response, request.headers.get('Accept-Encoding'), settings['compress_min_bytes'])
+
+  # Create the addressbook indices and aliases if they do not exist yet. Use Index_Setup.py to migrate existing indices
+  @app.before_first_request
+  def setupIndices():
+    try:
+      app.extensions['addressbook'].get().setup()
+    except Exception as error:
+      app.logger.warning("Could not set up the addressbook indices: %s", error)
+
+  return app
+
+
+def createStore(settings):
+  """
+  Creates the contact store described by the settings
+
+  Parameters
+  ----------
+  settings: dict
+    Settings from config.loadConfig
+
+  Returns
+  -------
+  books.BookStores
+    The store of each address book. These are MemoryStores when storage is memory, otherwise ElasticStores sharing one
+    client, which is created in each process that uses it. With write_behind, each is wrapped in a WriteBehindStore
+  """
+  if settings['storage'] == 'memory':
+    factory = lambda book: storage.MemoryStore(space=book or reservations.default_space)
+  else:
+    options = config.clientOptions(settings)
+    default = storage.ElasticStore(client_factory=lambda: Elasticsearch(**options))
+    factory = lambda book: storage.ElasticStore(client_factory=lambda: default.es, space=book) if book else default
+  if not settings['write_behind']:
+    return books.BookStores(factory)
+  return books.BookStores(lambda book: writeBehind(factory(book), settings, book))
+
 
-# Configure the following ports to desired Elasticsearch port and Flask port.
-# Defaul Elastic Search port is 9200
-elastic_port = 9200
-# Default flask port is 5000
-flask_port = 5000
+def writeBehind(store, settings, book):
+  # Flushed contacts are removed from the contact cache, which holds their pending version until then, and new contacts
+  # become searchable once flushed
+  def invalidate(fullnames):
+    for fullname in fullnames:
+      api_methods.contact_cache.invalidate(store.cacheKey(fullname))
+    api_methods.contactsWritten(store)
+  return write_behind.WriteBehindStore(store, write_behind.journalPath(settings['journal_path'], book), settings['flush_size'],
+    settings['flush_interval'], settings['journal_fsync'], invalidate)
 
-# Connect to Elasticsearch cluster
-es = Elasticsearch([{'host': 'localhost', 'port':elastic_port}])
-# To check connection to elasticsearch, use es.ping()
 
-app = Flask(__name__)
+def currentStore():
+  # Contact store of the address book named in the request. To check the connection to Elasticsearch, use currentStore().es.ping()
+  return current_app.extensions['addressbook'].get(g.get('book'))
+
+
+# The book is removed from the arguments of the endpoints, which read it through currentStore
+@api.url_value_preprocessor
+def pullBook(endpoint, values):
+  g.book = values.pop('book', None) if values else None
+
+
+@api.before_request
+def checkBook():
+  if g.get('book') is not None and not books.name_regex.match(g.book):
+    return bad_request("Invalid address book name "+g.book+". Book names can only contain lowercase letters, digits, and underscores, and must be at most 48 characters long.")
+
+
+def taggedResponse(result, tag):
+  # Sends 304 Not Modified when the request's If-None-Match lists the tag, otherwise the result with the tag as its ETag.
+  # The 304 repeats the tag as listed, so it names the encoding the client or cache holds
+  listed = etags.listedTag(request.headers.get('If-None-Match'), tag)
+  if listed is not None:
+    return Response(status=304, headers={'ETag': listed})
+  response = current_app.make_response(result)
+  if tag is not None and response.status_code == 200:
+    response.headers['ETag'] = tag
+  return response
+
 
 # Endpoint for getting a list of all contacts and additional queries
-@app.route('/contact', methods=['GET', 'POST'])
+@api.route('/contact', methods=['GET', 'POST'])
 def getContacts():
-  # HTTP GET call should be formatted as: GET {path}/contact?pageSize={}&page={}&query={}
+  # HTTP GET call should be formatted as: GET {path}/contact?pageSize={}&page={}&query={}&fields={}&slim={}
+  # or, to continue from a previous response: GET {path}/contact?cursor={}&fields={}&slim={}
   if request.method == 'GET':
-    page_size = min(request.args.get('pageSize', 10, type=int), 30)
+    page_size = max(min(request.args.get('pageSize', 10, type=int), 30), 1)
     page = request.args.get('page', 1, type=int)
     query = request.args.get('query', '*')
-    return api_methods.getAllContacts(page_size, page, query, es)
+    cursor = request.args.get('cursor', None)
+    slim = request.args.get('slim', '').lower() in ('1', 'true', 'yes')
+    try:
+      fields = projection.parseProjection(request.args.get('fields', ''))
+    except ValueError as error:
+      return bad_request(str(error))
+    if cursor:
+      return api_methods.getAllContacts(page_size, page, query, currentStore(), cursor, fields, slim)
+    return taggedResponse(*api_methods.getTaggedContacts(page_size, page, query, currentStore(), fields, slim))
 
   # Endpoint for creating new contacts
   # HTTP POST call should be formatted as: POST {path}/contact?fullname={}&firstname={}&lastname={}&phone={}&email={}
@@ -41,32 +198,129 @@ def getContacts():
     phone = request.args.get('phone', '') # get entered phone number from request
     email = request.args.get('email', '') # get entered email from request
 
-    return api_methods.createContact(fullname, firstname, lastname, phone, email, es)
+    return api_methods.createContact(fullname, firstname, lastname, phone, email, currentStore())
+
+
+# Endpoint for creating many contacts at once
+# HTTP POST call should be formatted as: POST {path}/contact/_bulk?chunkSize={} with an NDJSON or JSON array body
+@api.route('/contact/_bulk', methods=['POST'])
+def bulkContacts():
+  chunk_size = bulk.parseChunkSize(request.args.get('chunkSize', None, type=int))
+  try:
+    records = bulk.readRecords(request.stream, request.content_type or '')
+    return jsonify(bulk.bulkCreateContacts(records, currentStore(), chunk_size))
+  except ValueError as error:
+    return bad_request(str(error))
+
+
+# Endpoint for exporting every contact, or the contacts matching a query, in one streamed response
+# HTTP GET call should be formatted as: GET {path}/contact/_export?format={}&query={}&fields={}
+@api.route('/contact/_export', methods=['GET'])
+def exportContacts():
+  format = request.args.get('format', 'ndjson')
+  try:
+    fields = export.parseFields(request.args.get('fields', ''))
+    chunks = export.exportContacts(currentStore(), format, request.args.get('query', ''), fields)
+  except ValueError as error:
+    return bad_request(str(error))
+  headers = {'Content-Disposition': 'attachment; filename=addressbook.'+format}
+  return Response(stream_with_context(chunks), mimetype=export.formats[format], headers=headers)
+
+
+# Endpoint for retrieving many contacts by name in one request
+# HTTP GET call should be formatted as: GET {path}/contact/_mget?names={},{}&fields={}
+# HTTP POST call should be formatted as: POST {path}/contact/_mget?fields={} with a JSON list of names as the body
+@api.route('/contact/_mget', methods=['GET', 'POST'])
+def getManyContacts():
+  try:
+    fields = export.parseFields(request.args.get('fields', ''))
+  except ValueError as error:
+    return bad_request(str(error))
+  if request.method == 'POST':
+    names = request.get_json(force=True, silent=True)
+    if isinstance(names, dict):
+      names = names.get('names')
+  else:
+    names = [name for value in request.args.getlist('names') for name in value.split(',') if name]
+  return api_methods.getContacts(names, fields if request.args.get('fields') else None, currentStore())
+
+
+# Endpoint for completing contact names as the user types
+# HTTP GET call should be formatted as: GET {path}/contact/_suggest?prefix={}&limit={}
+@api.route('/contact/_suggest', methods=['GET'])
+def suggestContacts():
+  prefix = request.args.get('prefix', '')
+  limit = max(min(request.args.get('limit', 10, type=int), 50), 1)
+  return api_methods.suggestContacts(prefix, limit, currentStore())
+
+
+# Endpoint for finding contacts that are likely duplicates of each other. Use Find_Duplicates.py for large address books
+# HTTP GET call should be formatted as: GET {path}/contact/_duplicates?threshold={}&limit={}
+@api.route('/contact/_duplicates', methods=['GET'])
+def duplicateContacts():
+  threshold = min(max(request.args.get('threshold', dedup.default_threshold, type=float), 0.0), 1.0)
+  limit = max(min(request.args.get('limit', 100, type=int), 1000), 1)
+  return dedup.reportDuplicates(currentStore(), threshold, limit)
+
+
+# Endpoint for counting contacts by email domain and last name initial
+# HTTP GET call should be formatted as: GET {path}/contact/_stats?limit={}&exact={}
+@api.route('/contact/_stats', methods=['GET'])
+def contactStats():
+  limit = max(min(request.args.get('limit', stats.default_limit, type=int), 1000), 1)
+  exact = request.args.get('exact', '').lower() in ('1', 'true', 'yes')
+  return api_methods.getStats(limit, currentStore(), exact)
 
 
 # Endpoints for updating, deleting, or retrieving a single contact
-@app.route('/contact/<contact_name>', methods=['GET', 'PUT', 'DELETE'])
+@api.route('/contact/<contact_name>', methods=['GET', 'PUT', 'DELETE'])
 def changeContact(contact_name):
   # Update specified contacted with inputted parameters
   # HTTP PUT call should be formatted as: PUT {path}/contact/<contact_name>?phone=''&email=''
+  # with an optional If-Match header holding the ETag from GET {path}/contact/<contact_name>
   if request.method == 'PUT':
     firstname = request.args.get('firstname', '') # get entered firstname from request
     lastname = request.args.get('lastname', '') # get entered lastname from request
     phone = request.args.get('phone', '') # get entered phone number from request
     email = request.args.get('email', '') # get entered email from request
 
-    return api_methods.updateContact(contact_name, firstname, lastname, phone, email, es)
+    return api_methods.updateContact(contact_name, firstname, lastname, phone, email, currentStore(), request.headers.get('If-Match'))
 
   # Delete specified contact based on inputted name
-  # HTTP DELETE call should be formatted as: DELETE {path}/contact/<contact_name>
+  # HTTP DELETE call should be formatted as: DELETE {path}/contact/<contact_name>, with an optional If-Match header
   elif request.method == 'DELETE':
-    return api_methods.deleteContact(contact_name, es)
+    return api_methods.deleteContact(contact_name, currentStore(), request.headers.get('If-Match'))
 
   # Get the specified contact based on name and return the formatted json
   # HTTP GET call should be formatted as: GET {path}/contact/<contact_name>
   elif request.method == 'GET':
-    return api_methods.getContact(contact_name, es)
+    return taggedResponse(*api_methods.getTaggedContact(contact_name, currentStore()))
+
+# Endpoint for checking the hit, miss, and eviction counts of the contact cache
+# HTTP GET call should be formatted as: GET {path}/_cache
+@admin.route('/_cache', methods=['GET'])
+def cacheStats():
+  return dict(api_methods.contact_cache.stats(), search=api_methods.search_cache.stats())
+
+# Endpoint for collecting request, Elasticsearch, error, and cache metrics with Prometheus
+# HTTP GET call should be formatted as: GET {path}/metrics
+@admin.route('/metrics', methods=['GET'])
+def metricsText():
+  stats = api_methods.contact_cache.stats()
+  gauges = [('addressbook_cache_'+name, "Contact cache "+name.replace('_', ' ')+".", value) for name, value in stats.items()]
+  gauges += [('addressbook_search_cache_'+name, "Search cache "+name.replace('_', ' ')+".", value)
+    for name, value in api_methods.search_cache.stats().items()]
+  gauges += [('addressbook_stats_'+name, "Contact statistics counter "+name+".", value) for name, value in api_methods.contact_stats.stats().items()]
+  if current_app.config['ADDRESSBOOK']['write_behind']:
+    totals = {}
+    for store in current_app.extensions['addressbook'].stores():
+      for name, value in store.stats().items():
+        totals[name] = totals.get(name, 0) + value
+    gauges += [('addressbook_write_behind_'+name, "Contact writes "+name+" by the write-behind store.", value) for name, value in totals.items()]
+  return Response(metrics.registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+app = create_app()
 
 if __name__ == "__main__":
-  # Default port for Flask is 5000. To change the port, use app.run(port={port}), substituing in your desired port for {port}
-  app.run(port=flask_port)
+  # Default port for Flask is 5000. To change the port, set ADDRESSBOOK_FLASK_PORT or flask_port in the configuration file
+  app.run(port=app.config['ADDRESSBOOK']['flask_port'])
@@ -0,0 +1,91 @@
+'''Address Book ASGI Application
+
+This file creates an async version of the Address Book API, serving the same contact endpoints as Address_Book.py with the same
+parameters, messages, and error payloads. Requests are handled by an ASGI server and Elasticsearch is called with AsyncElasticsearch,
+so a single process can keep many requests in flight while they wait on Elasticsearch.
+
+To start the app with uvicorn, run: uvicorn Address_Book_Async:app --port 5000
+Elasticsearch hosts, timeouts, and retries are read with API_Files/config.py, the same way as for Address_Book.py.
+
+'''
+
+import logging
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Route
+from API_Files import api_methods, async_methods, cache, config, mappings, stats
+
+settings = config.loadConfig()
+
+# Connect to Elasticsearch cluster. Each uvicorn worker imports this file, so each worker has its own client
+es = AsyncElasticsearch(**config.clientOptions(settings, async_client=True))
+
+# Caches and statistics counters of the worker, kept by async_methods with the same settings as Address_Book.py
+api_methods.contact_cache = cache.ContactCache(settings['cache_size'], settings['cache_ttl'], local_ttl=settings['cache_local_ttl'])
+api_methods.search_cache = cache.SearchCache(settings['search_cache_bytes'], settings['search_cache_ttl'])
+api_methods.contact_stats = stats.ContactStats(settings['stats_reconcile_interval'])
+
+logger = logging.getLogger(__name__)
+
+
+# Endpoint for getting a list of all contacts and additional queries, and for creating new contacts
+async def getContacts(request):
+  # HTTP GET call should be formatted as: GET {path}/contact?pageSize={}&page={}&query={}
+  # or, to continue from a previous response: GET {path}/contact?cursor={}
+  if request.method == 'GET':
+    page_size = max(min(_intArg(request, 'pageSize', 10), 30), 1)
+    page = _intArg(request, 'page', 1)
+    query = request.query_params.get('query', '*')
+    cursor = request.query_params.get('cursor', None)
+    return async_methods.toResponse(await async_methods.getAllContacts(page_size, page, query, es, cursor))
+
+  # HTTP POST call should be formatted as: POST {path}/contact?fullname={}&firstname={}&lastname={}&phone={}&email={}
+  elif request.method == 'POST':
+    args = request.query_params
+    return async_methods.toResponse(await async_methods.createContact(args.get('fullname', ''), args.get('firstname', ''),
+      args.get('lastname', ''), args.get('phone', ''), args.get('email', ''), es))
+
+
+# Endpoints for updating, deleting, or retrieving a single contact
+async def changeContact(request):
+  contact_name = request.path_params['contact_name']
+  # HTTP PUT call should be formatted as: PUT {path}/contact/<contact_name>?phone=''&email=''
+  if request.method == 'PUT':
+    args = request.query_params
+    return async_methods.toResponse(await async_methods.updateContact(contact_name, args.get('firstname', ''),
+      args.get('lastname', ''), args.get('phone', ''), args.get('email', ''), es))
+
+  # HTTP DELETE call should be formatted as: DELETE {path}/contact/<contact_name>
+  elif request.method == 'DELETE':
+    return async_methods.toResponse(await async_methods.deleteContact(contact_name, es))
+
+  # HTTP GET call should be formatted as: GET {path}/contact/<contact_name>
+  elif request.method == 'GET':
+    return async_methods.toResponse(await async_methods.getContact(contact_name, es))
+
+
+async def setupIndices():
+  # Create the addressbook indices and aliases if they do not exist yet, using a short lived synchronous client
+  try:
+    await run_in_threadpool(mappings.ensureIndices, Elasticsearch(**config.clientOptions(settings)))
+  except Exception as error:
+    logger.warning("Could not set up the addressbook indices: %s", error)
+
+
+async def closeClient():
+  await es.close()
+
+
+def _intArg(request, name, default):
+  # Matches request.args.get(name, default, type=int) in Flask, which falls back to the default for values that are not integers
+  try:
+    return int(request.query_params.get(name, default))
+  except ValueError:
+    return default
+
+
+app = Starlette(routes=[
+  Route('/contact', getContacts, methods=['GET', 'POST']),
+  Route('/contact/{contact_name}', changeContact, methods=['GET', 'PUT', 'DELETE'])
+], on_startup=[setupIndices], on_shutdown=[closeClient])
@@ -0,0 +1,94 @@
+'''Contact Serialization Benchmarks
+
+This file compares the time and peak memory allocations of the contact serialization paths used per request.
+  create: building a contact and encoding the Elasticsearch request body
+  read: decoding an Elasticsearch get response and encoding the API response
+  hold: memory used to keep contacts in the MemoryStore or contact cache
+
+The previous path formats a JSON string with contact.toJSON, which the Elasticsearch client sends as is, and decodes and
+re-encodes responses with the standard json module, the way Flask's jsonify does. The current path builds the dictionary
+directly and encodes it with storage.ContactSerializer and contact.dumps, which use orjson when it is installed.
+
+To run the benchmarks, run: python Benchmarks/bench_contact.py --number 100000
+
+'''
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from API_Files import contact, storage
+
+_fields = ('John Doe', 'John', 'Doe', '3015558899', 'JohnDoe@example.com')
+_response = json.dumps({'_index': 'addressbook-v2', '_id': 'John Doe', '_version': 1, '_seq_no': 4, '_primary_term': 1,
+  'found': True, '_source': contact.toDict(*_fields)})
+_serializer = storage.ContactSerializer()
+
+
+def previousCreate():
+  return contact.toJSON(*_fields)
+
+
+def currentCreate():
+  return _serializer.dumps(contact.toDict(*_fields))
+
+
+def previousRead():
+  return json.dumps(json.loads(_response)['_source'], indent=None, sort_keys=True).encode('utf-8')
+
+
+def currentRead():
+  return contact.dumps(_serializer.loads(_response)['_source'])
+
+
+def timePerCall(function, number):
+  """Returns the average number of microseconds taken by one call"""
+  return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+
+def peakBytesPerCall(function, number):
+  """Returns the average peak of memory allocated while one call runs, including memory freed before it returns"""
+  function()
+  tracemalloc.start()
+  total = 0
+  for _ in range(number):
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function()
+    total += tracemalloc.get_traced_memory()[1] - baseline
+  tracemalloc.stop()
+  return total / number
+
+
+def heldBytes(build, number):
+  """Returns the average number of bytes used to hold one contact"""
+  tracemalloc.start()
+  held = [build('Contact '+str(position)) for position in range(number)]
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  del held
+  return size / number
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark contact serialization")
+  parser.add_argument('--number', type=int, default=100000, help="Calls timed per benchmark (default is 100000)")
+  args = parser.parse_args()
+
+  print("JSON encoder: "+("orjson" if contact.orjson is not None else "json (install orjson for faster serialization)"))
+  print("%-8s %-9s %10s %14s" % ('path', 'version', 'us/call', 'peak bytes'))
+  number = min(args.number, 10000)
+  for name, previous, current in (('create', previousCreate, currentCreate), ('read', previousRead, currentRead)):
+    for version, function in (('previous', previous), ('current', current)):
+      print("%-8s %-9s %10.2f %14.1f" % (name, version, timePerCall(function, args.number), peakBytesPerCall(function, number)))
+
+  print("%-8s %-9s %10s %14.1f" % ('hold', 'dict', '', heldBytes(lambda name: contact.toDict(name, *_fields[1:]), number)))
+  print("%-8s %-9s %10s %14.1f" % ('hold', 'Contact', '', heldBytes(lambda name: contact.Contact(name, *_fields[1:]), number)))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,362 @@
+'''Address Book Load Test
+
+This file sends a reproducible mix of requests to every Address Book endpoint from several threads, and reports the
+throughput and the p50, p95, and p99 latency of each endpoint. Results can be saved as JSON and compared with an
+earlier run, so the effect of a change on each endpoint can be measured.
+
+Mixes:
+  read: mostly single contact lookups, with some searches, suggestions, multi-gets, and writes
+  write: mostly creates, updates, and deletes, with some lookups and bulk loads
+  search: mostly searches and suggestions, with some lookups and creates, and an occasional export
+
+Before the mix starts, the address book is loaded with --contacts generated contacts through POST /contact/_bulk.
+Contacts, names, and the order of requests are generated from --seed, so two runs with the same options send the same requests.
+
+The app is run in this process with the Flask test client, keeping contacts in memory by default. To measure the app
+with a real Elasticsearch cluster, use --storage elasticsearch with the settings described in API_Files/config.py,
+or use --url to send the requests to a running app over HTTP.
+
+To run the load test, run: python Benchmarks/load_test.py --mix read --concurrency 8 --contacts 10000 --output read.json
+To compare with an earlier run, add: --compare previous.json
+
+'''
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import quote, urlencode, urlsplit
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Weight of each operation in each mix
+mixes = {
+  'read': {'get': 60, 'search': 10, 'suggest': 10, 'mget': 10, 'update': 5, 'create': 5},
+  'write': {'create': 35, 'update': 30, 'delete': 15, 'get': 15, 'bulk': 5},
+  'search': {'search': 55, 'suggest': 25, 'get': 10, 'create': 9, 'export': 1}
+}
+# Endpoint each operation is reported under
+endpoints = {
+  'get': 'GET /contact/<name>',
+  'update': 'PUT /contact/<name>',
+  'delete': 'DELETE /contact/<name>',
+  'search': 'GET /contact',
+  'create': 'POST /contact',
+  'bulk': 'POST /contact/_bulk',
+  'mget': 'GET /contact/_mget',
+  'suggest': 'GET /contact/_suggest',
+  'export': 'GET /contact/_export'
+}
+
+_firstnames = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+  'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen')
+_lastnames = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+  'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin')
+
+
+class Dataset:
+  """
+  Contacts the load test reads and writes, shared by every thread
+
+  Contacts loaded before the run are never deleted, so lookups and updates always find their contact.
+  Deletes remove contacts created during the run, oldest first.
+  """
+  def __init__(self, contacts, seed):
+    self.seed = seed
+    self.loaded = [self.contact(number) for number in range(contacts)]
+    self.created = deque()
+    self.numbers = itertools.count(contacts)
+    self.lock = threading.Lock()
+
+  def contact(self, number):
+    """Returns the contact generated for a number, which is the same in every run with the same seed"""
+    chosen = random.Random(self.seed * 1000003 + number)
+    firstname, lastname = chosen.choice(_firstnames), chosen.choice(_lastnames)
+    return {'fullname': '%s %s %07d' % (firstname, lastname, number), 'firstname': firstname, 'lastname': lastname,
+      'phone': '%010d' % (2000000000 + number), 'email': '%s.%s.%d@example.com' % (firstname, lastname, number)}
+
+  def new(self):
+    with self.lock:
+      return self.contact(next(self.numbers))
+
+  def remember(self, fullname):
+    with self.lock:
+      self.created.append(fullname)
+
+  def forget(self):
+    with self.lock:
+      return self.created.popleft() if self.created else None
+
+
+class LocalClient:
+  """Sends requests to an app in this process with the Flask test client"""
+  def __init__(self, app):
+    self.client = app.test_client()
+
+  def request(self, method, path, params=None, body=None, content_type=None):
+    response = self.client.open(path, method=method, query_string=params, data=body, content_type=content_type)
+    response.get_data()
+    return response.status_code
+
+
+class HTTPClient:
+  """Sends requests to a running app over one keep-alive HTTP connection"""
+  def __init__(self, url):
+    parts = urlsplit(url)
+    connection = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    self.connection = connection(parts.hostname, parts.port, timeout=60)
+    self.root = parts.path.rstrip('/')
+
+  def request(self, method, path, params=None, body=None, content_type=None):
+    target = self.root + quote(path) + ('?' + urlencode(params) if params else '')
+    headers = {'Content-Type': content_type} if content_type else {}
+    try:
+      self.connection.request(method, target, body=body, headers=headers)
+      response = self.connection.getresponse()
+      response.read()
+      return response.status
+    except (http.client.HTTPException, OSError):
+      self.connection.close()
+      return 0
+
+
+def operation(name, client, dataset, chosen):
+  """
+  Sends one request of the mix
+
+  Parameters
+  ----------
+  name: str
+    Operation from the mix, one of the keys of endpoints
+  client: LocalClient or HTTPClient
+    Client of the current thread
+  dataset: Dataset
+    Contacts shared by every thread
+  chosen: random.Random
+    Random number generator of the current thread
+
+  Returns
+  -------
+  tuple
+    The name of the operation that was sent, which is create when a delete finds no contact to delete, and the status code
+  """
+  if name == 'delete':
+    fullname = dataset.forget()
+    if fullname is not None:
+      return name, client.request('DELETE', '/contact/'+fullname)
+    name = 'create'
+  if name == 'create':
+    source = dataset.new()
+    status = client.request('POST', '/contact', source)
+    if status == 200:
+      dataset.remember(source['fullname'])
+    return name, status
+  if name == 'get':
+    return name, client.request('GET', '/contact/'+chosen.choice(dataset.loaded)['fullname'])
+  if name == 'update':
+    return name, client.request('PUT', '/contact/'+chosen.choice(dataset.loaded)['fullname'], {'firstname': chosen.choice(_firstnames)})
+  if name == 'search':
+    return name, client.request('GET', '/contact', {'query': chosen.choice(_lastnames), 'pageSize': 10})
+  if name == 'suggest':
+    return name, client.request('GET', '/contact/_suggest', {'prefix': chosen.choice(_firstnames)[:chosen.randint(1, 3)], 'limit': 10})
+  if name == 'mget':
+    names = [source['fullname'] for source in chosen.sample(dataset.loaded, min(20, len(dataset.loaded)))]
+    return name, client.request('GET', '/contact/_mget', {'names': ','.join(names)})
+  if name == 'bulk':
+    sources = [dataset.new() for _ in range(50)]
+    body = b''.join(json.dumps(source).encode('utf-8') + b'\n' for source in sources)
+    status = client.request('POST', '/contact/_bulk', body=body, content_type='application/x-ndjson')
+    if status == 200:
+      for source in sources:
+        dataset.remember(source['fullname'])
+    return name, status
+  if name == 'export':
+    return name, client.request('GET', '/contact/_export', {'query': chosen.choice(_lastnames)})
+  raise ValueError("Unknown operation "+str(name))
+
+
+def load(client, dataset, chunk_size=1000):
+  """Loads the dataset through the bulk endpoint before the run starts"""
+  for start in range(0, len(dataset.loaded), chunk_size):
+    body = b''.join(json.dumps(source).encode('utf-8') + b'\n' for source in dataset.loaded[start:start+chunk_size])
+    status = client.request('POST', '/contact/_bulk', {'chunkSize': chunk_size}, body, 'application/x-ndjson')
+    if status != 200:
+      raise RuntimeError("Loading the dataset failed with status "+str(status))
+
+
+def run(clients, dataset, mix, requests, duration, seed, warmup=0):
+  """
+  Sends the mix of requests from one thread per client and records the latency of each
+
+  Parameters
+  ----------
+  clients: list
+    One LocalClient or HTTPClient for each thread
+  dataset: Dataset
+    Contacts shared by every thread
+  mix: dict
+    Weight of each operation
+  requests: int
+    Number of requests to send, shared between the threads
+  duration: float
+    Seconds to send requests for instead of a number of requests, or 0 to use requests
+  seed: int
+    Seed of the random number generator of each thread
+  warmup: int
+    Requests sent by each thread before latencies are recorded (default is 0)
+
+  Returns
+  -------
+  tuple
+    Seconds the run took, and a dictionary of the latencies in seconds and error count of each operation
+  """
+  names, weights = list(mix), list(mix.values())
+  remaining = itertools.count()
+  results = [defaultdict(lambda: {'latencies': [], 'errors': 0}) for _ in clients]
+  start = threading.Barrier(len(clients) + 1)
+  deadline = [0.0]
+
+  def worker(position, client):
+    chosen = random.Random(seed * 7919 + position)
+    for _ in range(warmup):
+      operation(chosen.choices(names, weights)[0], client, dataset, chosen)
+    start.wait()
+    recorded = results[position]
+    while (time.perf_counter() < deadline[0]) if duration else (next(remaining) < requests):
+      began = time.perf_counter()
+      name, status = operation(chosen.choices(names, weights)[0], client, dataset, chosen)
+      recorded[name]['latencies'].append(time.perf_counter() - began)
+      if not 200 <= status < 300:
+        recorded[name]['errors'] += 1
+
+  threads = [threading.Thread(target=worker, args=(position, client), daemon=True) for position, client in enumerate(clients)]
+  for thread in threads:
+    thread.start()
+  start.wait()
+  began = time.perf_counter()
+  deadline[0] = began + duration
+  for thread in threads:
+    thread.join()
+  seconds = time.perf_counter() - began
+
+  merged = defaultdict(lambda: {'latencies': [], 'errors': 0})
+  for recorded in results:
+    for name, values in recorded.items():
+      merged[name]['latencies'].extend(values['latencies'])
+      merged[name]['errors'] += values['errors']
+  return seconds, merged
+
+
+def percentile(ordered, percent):
+  """Returns the nearest-rank percentile of a sorted list"""
+  if not ordered:
+    return 0.0
+  return ordered[max(int(-(-percent * len(ordered) // 100)) - 1, 0)]
+
+
+def summarize(latencies, errors, seconds):
+  """Returns the request count, error count, throughput, and latencies in milliseconds of one endpoint"""
+  ordered = sorted(latencies)
+  return {
+    'requests': len(ordered),
+    'errors': errors,
+    'throughput': len(ordered) / seconds if seconds else 0.0,
+    'mean_ms': sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+    'p50_ms': percentile(ordered, 50) * 1000,
+    'p95_ms': percentile(ordered, 95) * 1000,
+    'p99_ms': percentile(ordered, 99) * 1000,
+    'max_ms': ordered[-1] * 1000 if ordered else 0.0
+  }
+
+
+def report(seconds, merged):
+  """Returns the summary of every endpoint, and of all requests together under total"""
+  summary = {endpoints[name]: summarize(values['latencies'], values['errors'], seconds) for name, values in sorted(merged.items())}
+  summary['total'] = summarize([latency for values in merged.values() for latency in values['latencies']],
+    sum(values['errors'] for values in merged.values()), seconds)
+  return summary
+
+
+def printReport(summary, previous=None):
+  """Prints the summary as a table, with the change from a previous run when one is given"""
+  print("%-24s %9s %7s %10s %9s %9s %9s" % ('endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+  for endpoint, values in summary.items():
+    print("%-24s %9d %7d %10.1f %9.2f %9.2f %9.2f" % (endpoint, values['requests'], values['errors'], values['throughput'],
+      values['p50_ms'], values['p95_ms'], values['p99_ms']))
+    if previous and endpoint in previous:
+      before = previous[endpoint]
+      print("%-24s %9s %7s %10s %9s %9s %9s" % ('', '', '', _change(before['throughput'], values['throughput']),
+        _change(before['p50_ms'], values['p50_ms']), _change(before['p95_ms'], values['p95_ms']), _change(before['p99_ms'], values['p99_ms'])))
+
+
+def _change(before, after):
+  return "%+.0f%%" % ((after - before) / before * 100) if before else '-'
+
+
+def _commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+      cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except (OSError, subprocess.SubprocessError):
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Load test every Address Book endpoint with a mix of requests")
+  parser.add_argument('--mix', choices=sorted(mixes), default='read', help="Mix of requests to send (default is read)")
+  parser.add_argument('--concurrency', type=int, default=4, help="Threads sending requests at the same time (default is 4)")
+  parser.add_argument('--contacts', type=int, default=10000, help="Contacts loaded before the run (default is 10000)")
+  parser.add_argument('--requests', type=int, default=10000, help="Requests sent by all threads together (default is 10000)")
+  parser.add_argument('--duration', type=float, default=0, help="Seconds to send requests for, instead of --requests")
+  parser.add_argument('--warmup', type=int, default=50, help="Unrecorded requests sent by each thread first (default is 50)")
+  parser.add_argument('--seed', type=int, default=1, help="Seed for the contacts and requests (default is 1)")
+  parser.add_argument('--storage', choices=('memory', 'elasticsearch'), default='memory',
+    help="Store of the app run in this process (default is memory). elasticsearch uses the settings from API_Files/config.py")
+  parser.add_argument('--url', help="Send requests over HTTP to a running app at this URL instead, for example http://127.0.0.1:5000")
+  parser.add_argument('--output', help="Save the results to this JSON file")
+  parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with")
+  args = parser.parse_args()
+  if args.concurrency < 1 or args.contacts < 1:
+    parser.error("--concurrency and --contacts must be at least 1")
+
+  if args.url:
+    clients = [HTTPClient(args.url) for _ in range(args.concurrency)]
+  else:
+    from Address_Book import create_app
+    app = create_app(storage=args.storage)
+    clients = [LocalClient(app) for _ in range(args.concurrency)]
+  previous = None
+  if args.compare:
+    with open(args.compare) as file:
+      previous = json.load(file)['endpoints']
+
+  dataset = Dataset(args.contacts, args.seed)
+  began = time.perf_counter()
+  load(clients[0], dataset)
+  print("Loaded %d contacts in %.1f s" % (args.contacts, time.perf_counter() - began), file=sys.stderr)
+  seconds, merged = run(clients, dataset, mixes[args.mix], args.requests, args.duration, args.seed, args.warmup)
+  summary = report(seconds, merged)
+  printReport(summary, previous)
+
+  if args.output:
+    settings = {name: getattr(args, name) for name in ('mix', 'concurrency', 'contacts', 'requests', 'duration', 'warmup', 'seed', 'storage', 'url')}
+    results = {
+      'settings': settings,
+      'environment': {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'commit': _commit(), 'python': platform.python_version(),
+        'platform': platform.platform(), 'cpus': os.cpu_count()},
+      'seconds': seconds,
+      'endpoints': summary
+    }
+    with open(args.output, 'w') as file:
+      json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+  main()
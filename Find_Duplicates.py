@@ -0,0 +1,55 @@
+'''Address Book Duplicate Report
+
+This file checks an address book for contacts that are likely duplicates of each other, and writes the clusters found to
+a JSON report with the contact to keep and the contacts to merge into it. It does not change any contact.
+Contacts are matched as described in API_Files/dedup.py, with the scoring spread over several processes.
+
+Usage:
+  python Find_Duplicates.py
+  python Find_Duplicates.py --book acme --threshold 0.8 --processes 8 --output acme-duplicates.json
+
+'''
+
+import argparse
+import json
+import sys
+from elasticsearch import Elasticsearch
+from API_Files import books, dedup, reservations, storage
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Find contacts that are likely duplicates of each other")
+  parser.add_argument('--book', help="Address book to check (default is the default address book)")
+  parser.add_argument('--host', default='localhost', help="Elasticsearch host (default is localhost)")
+  parser.add_argument('--port', default=9200, type=int, help="Elasticsearch port (default is 9200)")
+  parser.add_argument('--threshold', default=dedup.default_threshold, type=float,
+    help="Score from 0 to 1 above which two contacts are duplicates (default is "+str(dedup.default_threshold)+")")
+  parser.add_argument('--processes', type=int, help="Scoring processes (default is the number of CPUs)")
+  parser.add_argument('--window', default=dedup.default_window, type=int,
+    help="Contacts compared with each contact in blocks of more than "+str(dedup.max_block_size)+" contacts (default is "+str(dedup.default_window)+")")
+  parser.add_argument('--output', default='duplicates.json', help="File the report is written to (default is duplicates.json)")
+  args = parser.parse_args()
+
+  try:
+    space = books.Book(args.book) if args.book else reservations.default_space
+  except ValueError as error:
+    parser.error(str(error))
+  es = Elasticsearch([{'host': args.host, 'port': args.port}], serializer=storage.ContactSerializer(), timeout=60)
+  store = storage.ElasticStore(es, space=space)
+
+  def progress(counts):
+    sys.stderr.write("\r%d contacts, %d blocks, %d comparisons, %d matching pairs" % (counts['contacts'], counts['blocks'], counts['comparisons'], counts['pairs']))
+    sys.stderr.flush()
+
+  report = dedup.findDuplicates(store, args.threshold, args.processes, max(args.window, 1), progress=progress)
+  sys.stderr.write("\n")
+  report['book'] = args.book
+  report['threshold'] = args.threshold
+  with open(args.output, 'w', encoding='utf-8') as file:
+    json.dump(report, file, ensure_ascii=False, indent=2)
+  print("Found "+str(len(report['clusters']))+" clusters of duplicates among "+str(report['contacts'])+" contacts in "
+    +str(round(report['seconds'], 1))+" seconds, with "+str(report['comparisons'])+" comparisons. The report was written to "+args.output+".")
+
+
+if __name__ == "__main__":
+  main()
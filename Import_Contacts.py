@@ -0,0 +1,48 @@
+'''Address Book Contact Import
+
+This file loads contacts from a CSV or vCard file into the Address Book without going through the HTTP API.
+Rows are validated with the same rules as POST /contact, and rows that cannot be created are written to a reject file
+together with the reason, so they can be corrected and imported again.
+
+Usage:
+  python Import_Contacts.py contacts.csv
+  python Import_Contacts.py contacts.vcf --batch-size 2000 --processes 4 --threads 8 --rejects rejected.csv
+
+'''
+
+import argparse
+import sys
+from elasticsearch import Elasticsearch
+from API_Files import importer, storage
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Import contacts from a CSV or vCard file into the Address Book")
+  parser.add_argument('path', help="CSV or vCard file to import")
+  parser.add_argument('--format', choices=['csv', 'vcard'], help="File format (default is chosen from the file extension)")
+  parser.add_argument('--host', default='localhost', help="Elasticsearch host (default is localhost)")
+  parser.add_argument('--port', default=9200, type=int, help="Elasticsearch port (default is 9200)")
+  parser.add_argument('--batch-size', default=importer.default_batch_size, type=int, help="Rows validated and written together (default is 1000)")
+  parser.add_argument('--processes', type=int, help="Validation processes (default is the number of CPUs)")
+  parser.add_argument('--threads', default=importer.default_threads, type=int, help="Batches written to Elasticsearch at the same time (default is 4)")
+  parser.add_argument('--rejects', help="CSV file for rows that could not be imported (default is the input path with .rejects.csv added)")
+  args = parser.parse_args()
+
+  es = Elasticsearch([{'host': args.host, 'port': args.port}], serializer=storage.ContactSerializer(), timeout=60)
+  store = storage.ElasticStore(es)
+  store.setup()
+
+  def progress(counts):
+    sys.stderr.write("\r%d rows, %d created, %d rejected, %.0f rows/s" % (counts['rows'], counts['created'], counts['rejected'], counts['rows_per_second']))
+    sys.stderr.flush()
+
+  with open(args.rejects or args.path+'.rejects.csv', 'w', newline='', encoding='utf-8') as rejects:
+    counts = importer.importContacts(importer.readRecords(args.path, args.format), store, max(args.batch_size, 1),
+      args.processes, args.threads, rejects, progress)
+  sys.stderr.write("\n")
+  print("Imported "+str(counts['created'])+" of "+str(counts['rows'])+" rows in "+str(round(counts['seconds'], 1))+" seconds ("
+    +str(int(counts['rows_per_second']))+" rows/s). "+str(counts['rejected'])+" rows were written to "+(args.rejects or args.path+'.rejects.csv')+".")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,61 @@
+'''Address Book Index Setup
+
+This file creates and migrates the Elasticsearch indices used by the Address Book API. It can be run before starting
+Address_Book.py, and must be run whenever the mapping version in API_Files/mappings.py changes.
+
+Usage:
+  python Index_Setup.py create    Create any missing index and alias
+  python Index_Setup.py migrate   Reindex every alias into the current mapping version
+  python Index_Setup.py reserve   Create phone and email reservations for contacts stored before reservations were used
+  python Index_Setup.py status    Show the index behind each alias
+  python Index_Setup.py books     List the address books, with where each is stored and its number of contacts
+  python Index_Setup.py rebalance Move every shared address book with more than --threshold contacts to indices of its own
+
+'''
+
+import argparse
+import logging
+from elasticsearch import Elasticsearch
+from API_Files import books, mappings
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Create and migrate the Address Book Elasticsearch indices")
+  parser.add_argument('command', choices=['create', 'migrate', 'reserve', 'status', 'books', 'rebalance'])
+  parser.add_argument('--host', default='localhost', help="Elasticsearch host (default is localhost)")
+  parser.add_argument('--port', default=9200, type=int, help="Elasticsearch port (default is 9200)")
+  parser.add_argument('--shards', type=int, help="Primary shards for new indices (default is ADDRESSBOOK_SHARDS, or 1)")
+  parser.add_argument('--replicas', type=int, help="Replicas for new indices (default is ADDRESSBOOK_REPLICAS, or 1)")
+  parser.add_argument('--refresh-interval', help="Refresh interval for new indices (default is ADDRESSBOOK_REFRESH_INTERVAL, or 1s)")
+  parser.add_argument('--threshold', type=int, default=books.default_dedicated_size,
+    help="Contacts above which rebalance moves a book to its own indices (default is "+str(books.default_dedicated_size)+")")
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO, format='%(message)s')
+  es = Elasticsearch([{'host': args.host, 'port': args.port}])
+  settings = mappings.indexSettings(args.shards, args.replicas, args.refresh_interval)
+
+  if args.command == 'create':
+    current = mappings.ensureIndices(es, settings)
+  elif args.command == 'migrate':
+    current = {alias: mappings.migrate(alias, es, settings) for alias in mappings.indices}
+  elif args.command == 'reserve':
+    print("Created "+str(mappings.reserveExisting(es))+" reservations.")
+    return
+  elif args.command == 'books':
+    for entry in books.listBooks(es):
+      print(entry['book']+": "+entry['placement']+", "+str(entry['contacts'])+" contacts")
+    return
+  elif args.command == 'rebalance':
+    moved = books.rebalance(es, args.threshold, settings)
+    print("Moved "+str(len(moved))+" books to their own indices"+(": "+", ".join(moved) if moved else "."))
+    return
+  else:
+    current = {alias: mappings.currentIndex(alias, es) for alias in mappings.indices}
+
+  for alias, index in current.items():
+    print(alias+" -> "+str(index)+" (current version is "+mappings.indexName(alias)+")")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,267 @@
+'''In-memory stand-in for an Elasticsearch client
+
+This file contains FakeElasticsearch, which keeps indices in memory and answers the client calls made by mappings.py,
+books.py, reservations.py, and async_methods.py, so their migrations, rollbacks, takeovers, and writes can be tested without
+an Elastic Search instance.
+It supports aliases with term filters and routing, sequence numbers and versions, write blocks, bulk requests, scrolls,
+and reindex and delete by query tasks. Only the queries those files send are understood.
+
+'''
+
+import json
+from types import SimpleNamespace
+from elasticsearch.exceptions import AuthorizationException, ConflictError, NotFoundError, RequestError
+from elasticsearch.serializer import JSONSerializer
+
+
+class FakeElasticsearch:
+  """
+  Elasticsearch client holding its indices in memory
+
+  Attributes
+  ----------
+  after_reindex: function
+    Called with the client after each reindex task has copied its documents, to make writes the copy did not see
+  fail_tasks: bool
+    Whether reindex and delete by query tasks report a failure
+  """
+
+  def __init__(self):
+    self.data = {}
+    self.after_reindex = None
+    self.fail_tasks = False
+    self.indices = _Indices(self)
+    self.tasks = _Tasks(self)
+    self.transport = SimpleNamespace(serializer=JSONSerializer())
+    self._seq_no = 0
+    self._tasks = {}
+
+  def get(self, index, id, routing=None, **kwargs):
+    doc = self._docs(index).get(id)
+    if doc is None:
+      raise NotFoundError(404, 'not_found', {'_id': id, 'found': False})
+    return self._hit(id, doc, True)
+
+  def mget(self, index, body, _source=True, **kwargs):
+    docs = self._docs(index)
+    requested = body['docs'] if 'docs' in body else [{'_id': doc_id} for doc_id in body['ids']]
+    return {'docs': [self._hit(doc['_id'], docs[doc['_id']], _source) if doc['_id'] in docs else {'_id': doc['_id'], 'found': False}
+      for doc in requested]}
+
+  def create(self, index, id, body, **kwargs):
+    return self._write('create', index, id, body, kwargs)
+
+  def index(self, index, id, body, **kwargs):
+    return self._write('index', index, id, body, kwargs)
+
+  def update(self, index, id, body, **kwargs):
+    current = self.get(index, id)['_source']
+    return self._write('index', index, id, dict(current, **body['doc']), kwargs)
+
+  def delete(self, index, id, ignore=(), **kwargs):
+    try:
+      return self._write('delete', index, id, None, kwargs)
+    except NotFoundError:
+      if 404 in (ignore if isinstance(ignore, (list, tuple)) else (ignore,)):
+        return {'_id': id, 'result': 'not_found'}
+      raise
+
+  def bulk(self, body, **kwargs):
+    lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+    items = []
+    while lines:
+      (op_type, meta), = lines.pop(0).items()
+      source = lines.pop(0) if op_type != 'delete' else None
+      options = {key: meta[key] for key in ('if_seq_no', 'if_primary_term', 'routing') if key in meta}
+      try:
+        result = dict(self._write(op_type, meta['_index'], meta['_id'], source, options), status=201 if op_type == 'create' else 200)
+      except (AuthorizationException, ConflictError, NotFoundError) as error:
+        result = {'_id': meta['_id'], 'status': error.status_code, 'error': {'type': error.error, 'reason': error.error}}
+      items.append({op_type: result})
+    return {'errors': any(item[op]['status'] >= 300 for item in items for op in item), 'items': items}
+
+  def search(self, index, body=None, scroll=None, _source=True, **kwargs):
+    query = (body or {}).get('query') or kwargs.get('query')
+    hits = [self._hit(doc_id, doc, _source) for doc_id, doc in self._docs(index).items() if _matches(doc['_source'], query)]
+    return {'_scroll_id': 'scroll' if scroll else None, '_shards': {'total': 1, 'successful': 1, 'skipped': 0},
+      'hits': {'total': {'value': len(hits)}, 'hits': hits}}
+
+  def scroll(self, **kwargs):
+    return {'_scroll_id': None, '_shards': {'total': 1, 'successful': 1, 'skipped': 0}, 'hits': {'hits': []}}
+
+  def clear_scroll(self, **kwargs):
+    return {}
+
+  def count(self, index, **kwargs):
+    return {'count': len(self._docs(index))}
+
+  def reindex(self, body, **kwargs):
+    source, dest = body['source'], body['dest']
+    copied = conflicts = 0
+    for doc_id, doc in list(self._docs(source['index']).items()):
+      if not _matches(doc['_source'], source.get('query')):
+        continue
+      index = self._writeIndex(dest['index'])[0]
+      current = self.data[index]['docs'].get(doc_id)
+      if (dest.get('op_type') == 'create' and current is not None) or (dest.get('version_type') == 'external' and current is not None and current['_version'] >= doc['_version']):
+        conflicts += 1
+        continue
+      version = doc['_version'] if dest.get('version_type') == 'external' else (current['_version'] + 1 if current else 1)
+      self._store(index, doc_id, doc['_source'], version, doc.get('_routing') if dest.get('routing', 'keep') == 'keep' else None)
+      copied += 1
+    if self.after_reindex is not None:
+      self.after_reindex(self)
+    return {'task': self._task({'total': copied + conflicts, 'created': copied, 'version_conflicts': conflicts, 'failures': []})}
+
+  def delete_by_query(self, index, body, **kwargs):
+    deleted = 0
+    for name, _ in self._resolve(index):
+      for doc_id, doc in list(self.data[name]['docs'].items()):
+        if _matches(doc['_source'], body.get('query')):
+          del self.data[name]['docs'][doc_id]
+          deleted += 1
+    return {'task': self._task({'deleted': deleted, 'failures': []})}
+
+  def _task(self, response):
+    if self.fail_tasks:
+      response['failures'] = [{'cause': {'type': 'es_rejected_execution_exception'}}]
+    task = 'task:'+str(len(self._tasks) + 1)
+    self._tasks[task] = {'completed': True, 'response': response}
+    return task
+
+  def _resolve(self, name):
+    # Returns each index behind a name, with the definition of the alias it was reached through
+    if name in self.data:
+      return [(name, None)]
+    return [(index, data['aliases'][name]) for index, data in self.data.items() if name in data['aliases']]
+
+  def _writeIndex(self, name):
+    resolved = self._resolve(name)
+    if len(resolved) != 1:
+      raise NotFoundError(404, 'index_not_found_exception', name)
+    return resolved[0]
+
+  def _docs(self, name):
+    docs = {}
+    for index, alias in self._resolve(name):
+      docs.update((doc_id, doc) for doc_id, doc in self.data[index]['docs'].items() if alias is None or _matches(doc['_source'], alias.get('filter')))
+    return docs
+
+  def _write(self, op_type, name, doc_id, source, options):
+    index, alias = self._writeIndex(name)
+    if self.data[index]['blocked']:
+      raise AuthorizationException(403, 'cluster_block_exception', index)
+    current = self.data[index]['docs'].get(doc_id)
+    if op_type == 'create' and current is not None:
+      raise ConflictError(409, 'version_conflict_engine_exception', doc_id)
+    if op_type == 'delete' and current is None:
+      raise NotFoundError(404, 'not_found', doc_id)
+    if 'if_seq_no' in options and (current is None or current['_seq_no'] != options['if_seq_no']):
+      raise ConflictError(409, 'version_conflict_engine_exception', doc_id)
+    if op_type == 'delete':
+      del self.data[index]['docs'][doc_id]
+      self._seq_no += 1
+      return {'_index': index, '_id': doc_id, 'result': 'deleted', '_seq_no': self._seq_no, '_primary_term': 1}
+    routing = options.get('routing') or (alias or {}).get('index_routing')
+    doc = self._store(index, doc_id, source, current['_version'] + 1 if current else 1, routing)
+    return {'_index': index, '_id': doc_id, 'result': 'updated' if current else 'created', '_seq_no': doc['_seq_no'], '_primary_term': 1}
+
+  def _store(self, index, doc_id, source, version, routing):
+    self._seq_no += 1
+    doc = {'_source': dict(source), '_version': version, '_seq_no': self._seq_no, '_primary_term': 1}
+    if routing is not None:
+      doc['_routing'] = routing
+    self.data[index]['docs'][doc_id] = doc
+    return doc
+
+  def _hit(self, doc_id, doc, source=True):
+    hit = {'_id': doc_id, 'found': True, '_version': doc['_version'], '_seq_no': doc['_seq_no'], '_primary_term': doc['_primary_term']}
+    if '_routing' in doc:
+      hit['_routing'] = doc['_routing']
+    if source:
+      hit['_source'] = dict(doc['_source'])
+    return hit
+
+
+class _Indices:
+  def __init__(self, client):
+    self.client = client
+
+  def create(self, index, body=None, ignore=(), **kwargs):
+    if index in self.client.data:
+      if 400 in (ignore if isinstance(ignore, (list, tuple)) else (ignore,)):
+        return {'error': 'resource_already_exists_exception'}
+      raise RequestError(400, 'resource_already_exists_exception', index)
+    self.client.data[index] = {'docs': {}, 'aliases': {}, 'blocked': False}
+    return {'acknowledged': True}
+
+  def exists(self, index, **kwargs):
+    return index in self.client.data
+
+  def exists_alias(self, name, **kwargs):
+    return any(name in data['aliases'] for data in self.client.data.values())
+
+  def get_alias(self, name=None, index=None, **kwargs):
+    result = {}
+    for current, data in self.client.data.items():
+      if index is not None and current != index:
+        continue
+      aliases = {alias: dict(definition) for alias, definition in data['aliases'].items()
+        if name is None or alias == name or (name.endswith('*') and alias.startswith(name[:-1]))}
+      if aliases or (index is not None and name is None):
+        result[current] = {'aliases': aliases}
+    if not result:
+      raise NotFoundError(404, 'aliases_not_found_exception', name)
+    return result
+
+  def put_alias(self, index, name, body=None, **kwargs):
+    definition = dict(body or {})
+    if 'routing' in definition:
+      definition['index_routing'] = definition['search_routing'] = definition.pop('routing')
+    self.client.data[index]['aliases'][name] = definition
+    return {'acknowledged': True}
+
+  def update_aliases(self, body, **kwargs):
+    for action in body['actions']:
+      (kind, options), = action.items()
+      if kind == 'remove_index':
+        del self.client.data[options['index']]
+      elif kind == 'remove':
+        del self.client.data[options['index']]['aliases'][options['alias']]
+      else:
+        definition = {key: value for key, value in options.items() if key not in ('index', 'alias')}
+        if options['alias'] in self.client.data:
+          raise RequestError(400, 'invalid_alias_name_exception', options['alias'])
+        self.client.data[options['index']]['aliases'][options['alias']] = definition
+    return {'acknowledged': True}
+
+  def put_settings(self, index, body, **kwargs):
+    self.client.data[index]['blocked'] = bool(body.get('index.blocks.write'))
+    return {'acknowledged': True}
+
+  def refresh(self, index=None, **kwargs):
+    return {}
+
+
+class _Tasks:
+  def __init__(self, client):
+    self.client = client
+
+  def get(self, task_id, **kwargs):
+    return self.client._tasks[task_id]
+
+
+def _matches(source, query):
+  # Understands match_all, term, and bool filters, the only queries sent by the files tested with this client
+  if not query or 'match_all' in query:
+    return True
+  if 'term' in query:
+    (field, value), = query['term'].items()
+    return source.get(field) == (value['value'] if isinstance(value, dict) else value)
+  if 'bool' in query:
+    clauses = []
+    for occur in ('filter', 'must'):
+      value = query['bool'].get(occur, [])
+      clauses += value if isinstance(value, list) else [value]
+    return all(_matches(source, clause) for clause in clauses)
+  raise ValueError("Query not understood by FakeElasticsearch: "+repr(query))
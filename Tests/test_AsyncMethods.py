@@ -0,0 +1,73 @@
+'''Testing for methods in async_methods.py
+
+This file contains unit tests for the caches and statistics counters kept by the async create, update, and delete methods
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+import sys
+sys.path.append('..')
+
+from API_Files import api_methods, async_methods, cache, mappings, stats, storage
+from fake_elasticsearch import FakeElasticsearch
+
+
+class AsyncFake:
+  # Calls a FakeElasticsearch the way the async methods call an AsyncElasticsearch
+  def __init__(self, client):
+    self.client = client
+    self.transport = client.transport
+
+  def __getattr__(self, name):
+    method = getattr(self.client, name)
+    async def call(*args, **kwargs):
+      return method(*args, **kwargs)
+    return call
+
+
+class TestAsyncWrites(unittest.TestCase):
+  def setUp(self):
+    self.fake = FakeElasticsearch()
+    mappings.ensureIndices(self.fake)
+    self.es = AsyncFake(self.fake)
+    self.store = storage.getStore(self.fake)
+    api_methods.contact_cache = cache.ContactCache()
+    api_methods.search_cache = cache.SearchCache()
+    api_methods.contact_stats = stats.ContactStats()
+    # Loads empty counters for the default address book, which stay in use for the reconcile interval
+    self.counted = SimpleNamespace(bookKey=self.store.bookKey, facets=lambda: {'total': 0})
+    api_methods.contact_stats.summary(self.counted)
+
+  def test_bookkeeping(self):
+    '''Test that async writes invalidate the caches and move the statistics counters of the process'''
+    book = self.store.bookKey()
+    asyncio.run(async_methods.createContact('John Doe', 'John', 'Doe', '1234567890', 'john@example.com', self.es))
+    self.assertEqual(api_methods.search_cache.generation(book), 1)
+    self.assertEqual(asyncio.run(async_methods.getContact('John Doe', self.es))['firstname'], 'John')
+    asyncio.run(async_methods.updateContact('John Doe', 'Johnny', 'Roe', '', '', self.es))
+    self.assertEqual(api_methods.search_cache.generation(book), 2)
+    self.assertEqual(asyncio.run(async_methods.getContact('John Doe', self.es))['firstname'], 'Johnny')
+    self.assertEqual(api_methods.contact_stats.summary(self.counted)['initials'], [{'initial': 'R', 'count': 1}])
+    asyncio.run(async_methods.deleteContact('John Doe', self.es))
+    self.assertEqual(api_methods.search_cache.generation(book), 3)
+    self.assertEqual(api_methods.contact_stats.summary(self.counted)['total'], 0)
+
+  def test_invalidated_during_read(self):
+    '''Test that a contact updated while its read is awaited is not cached, so the next read returns the update'''
+    asyncio.run(async_methods.createContact('John Doe', 'John', 'Doe', '1234567890', 'john@example.com', self.es))
+    get, reads = self.es.get, []
+    async def racingGet(**kwargs):
+      document = await get(**kwargs)
+      if not reads:
+        reads.append(document)
+        await async_methods.updateContact('John Doe', 'Johnny', 'Doe', '', '', self.es)
+      return document
+    self.es.get = racingGet
+    self.assertEqual(asyncio.run(async_methods.getContact('John Doe', self.es))['firstname'], 'John')
+    self.assertEqual(asyncio.run(async_methods.getContact('John Doe', self.es))['firstname'], 'Johnny')
+
+if __name__=='__main__':
+  unittest.main()
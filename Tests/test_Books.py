@@ -0,0 +1,100 @@
+'''Testing for methods in books.py
+
+This file contains unit tests for address book names, the ids and fields of each book, and the isolation of books served by the app
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from elasticsearch.exceptions import AuthorizationException
+from API_Files import books, mappings, reservations
+from fake_elasticsearch import FakeElasticsearch
+
+class TestBookMethods(unittest.TestCase):
+  def test_book_names(self):
+    '''Test that book names are limited to what can be used in an alias name'''
+    self.assertEqual(books.Book('acme_2').contact_index, 'addressbook-book-acme_2')
+    for name in ('Acme', 'acme-corp', '_acme', '', 'a' * 49, None):
+      with self.assertRaises(ValueError):
+        books.Book(name)
+
+  def test_space(self):
+    '''Test that a book prefixes ids, and adds and removes its field'''
+    book = books.Book('acme')
+    self.assertEqual(book.docId('John Doe'), 'acme/John Doe')
+    self.assertEqual(book.fullname('acme/John Doe'), 'John Doe')
+    self.assertEqual(book.source({'fullname': 'John Doe'}), {'fullname': 'John Doe', 'book': 'acme'})
+    self.assertEqual(book.strip({'fullname': 'John Doe', 'book': 'acme'}), {'fullname': 'John Doe'})
+    self.assertEqual(reservations.default_space.docId('John Doe'), 'John Doe')
+
+  def test_reservation_actions(self):
+    '''Test that a book's contacts and reservations are written to its aliases with prefixed ids'''
+    book = books.Book('acme')
+    actions = [action for group in reservations._contactGroups([{'fullname': 'John Doe', 'phone': '1234567890', 'email': 'john@example.com'}], book)
+      for _, action in group]
+    self.assertEqual([(action['_index'], action['_id']) for action in actions],
+      [('addressbook-book-acme', 'acme/John Doe'), ('addressbook-reservations-book-acme', 'acme/phone:1234567890'),
+      ('addressbook-reservations-book-acme', 'acme/email:john@example.com')])
+    self.assertEqual(actions[0]['_source']['book'], 'acme')
+
+
+class TestPromoteBook(unittest.TestCase):
+  def test_writes_during_promotion(self):
+    '''Test that a book's updates and deletes made while it is copied reach its own indices, and shared writes are blocked for the last copy'''
+    es = FakeElasticsearch()
+    acme, globex = books.Book('acme'), books.Book('globex')
+    for book in (acme, globex):
+      books.ensureBook(book, es)
+    for book, fullname in ((acme, 'John Doe'), (acme, 'Jane Doe'), (globex, 'John Doe')):
+      es.index(index=book.contact_index, id=book.docId(fullname), body=book.source({'fullname': fullname, 'phone': '1234567890'}))
+    passes = []
+    def writes(client):
+      passes.append(True)
+      if len(passes) == 1:
+        client.index(index=acme.contact_index, id=acme.docId('John Doe'), body=acme.source({'fullname': 'John Doe', 'phone': '1234567899'}))
+      elif len(passes) == 2:
+        client.delete(index=acme.contact_index, id=acme.docId('Jane Doe'))
+      elif len(passes) == 5:
+        with self.assertRaises(AuthorizationException):
+          client.index(index=globex.contact_index, id=globex.docId('Jim Doe'), body=globex.source({'fullname': 'Jim Doe'}))
+    es.after_reindex = writes
+
+    books.promoteBook(acme, es, poll_interval=0)
+    self.assertEqual(books.placement(acme, es), 'dedicated')
+    docs = es.data['addressbook-book-acme-v1']['docs']
+    self.assertEqual(sorted(docs), ['acme/John Doe'])
+    self.assertEqual(docs['acme/John Doe']['_source']['phone'], '1234567899')
+    shared = es.data[mappings.currentIndex(reservations.book_contact_index, es)]
+    self.assertEqual(sorted(shared['docs']), ['globex/John Doe'])
+    self.assertFalse(shared['blocked'])
+
+
+class TestBookRequests(unittest.TestCase):
+  def setUp(self):
+    from Address_Book import create_app
+    self.client = create_app(storage='memory').test_client()
+
+  def test_isolation(self):
+    '''Test that the same fullname and phone number can be used in separate books, and that searches stay in their book'''
+    for path in ('/contact', '/books/acme/contact', '/books/globex/contact'):
+      response = self.client.post(path+'?fullname=John%20Doe&firstname=John&phone=1234567890&email=john@example.com')
+      self.assertEqual(response.status_code, 200)
+    self.client.put('/books/acme/contact/John Doe?firstname=Johnny')
+    self.assertEqual(self.client.get('/books/acme/contact/John Doe').get_json()['firstname'], 'Johnny')
+    self.assertEqual(self.client.get('/contact/John Doe').get_json()['firstname'], 'John')
+    self.client.post('/books/acme/contact?fullname=Jane%20Doe&phone=1234567891&email=jane@example.com')
+    self.assertEqual(self.client.get('/books/acme/contact?slim=true').get_json()['total'], 2)
+    self.assertEqual(self.client.get('/books/globex/contact?slim=true').get_json()['total'], 1)
+    self.client.delete('/books/globex/contact/John Doe')
+    self.assertEqual(self.client.get('/books/globex/contact/John Doe').status_code, 400)
+    self.assertEqual(self.client.get('/contact/John Doe').status_code, 200)
+
+  def test_invalid_book(self):
+    '''Test that an invalid book name is rejected'''
+    self.assertEqual(self.client.get('/books/Acme/contact').status_code, 400)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,104 @@
+'''Testing for methods in bulk.py
+
+This file contains unit tests for reading and validating the records sent to the bulk endpoint
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import io
+import sys
+sys.path.append('..')
+
+from API_Files import bulk, contact, storage
+
+class TestBulkMethods(unittest.TestCase):
+  def test_read_ndjson(self):
+    '''Test that NDJSON bodies are read one record per line'''
+    body = b'{"fullname": "John Doe"}\n\n{"fullname": "Jane Doe"}\n[1, 2]\n'
+    records = list(bulk.readRecords(io.BytesIO(body), 'application/x-ndjson'))
+    self.assertEqual(records, [{'fullname': 'John Doe'}, {'fullname': 'Jane Doe'}, None])
+
+  def test_read_json_array(self):
+    '''Test that JSON array bodies are read one element at a time, even across reads'''
+    original_size = bulk.read_size
+    bulk.read_size = 5
+    try:
+      body = b' [{"fullname": "John Doe", "phone": "3015558899"}, {"fullname": "Jane Doe"}, 7] '
+      records = list(bulk.readRecords(io.BytesIO(body), 'application/json'))
+    finally:
+      bulk.read_size = original_size
+    self.assertEqual(records, [{'fullname': 'John Doe', 'phone': '3015558899'}, {'fullname': 'Jane Doe'}, None])
+
+  def test_read_invalid_body(self):
+    '''Test that an unterminated JSON array ends with an invalid record, and invalid UTF-8 raises an error'''
+    records = list(bulk.readRecords(io.BytesIO(b'[{"fullname": "John Doe"}'), 'application/json'))
+    self.assertEqual(records[0], {'fullname': 'John Doe'})
+    self.assertEqual(records[1].error, "JSON array in request body is not terminated.")
+    with self.assertRaises(ValueError):
+      list(bulk.readRecords(io.BytesIO(b'{"fullname": "John Doe"}\n\xff\xfe\xfd\xfc{}'), 'application/x-ndjson'))
+
+  def test_read_invalid_records(self):
+    '''Test that lines and elements that are not valid JSON are returned as invalid records, and reading carries on'''
+    records = list(bulk.readRecords(io.BytesIO(b'{"fullname": "A"}\n{"fullname": \n{"fullname": "B"}\n'), 'application/x-ndjson'))
+    self.assertEqual([record if isinstance(record, dict) else record.error for record in records],
+      [{'fullname': 'A'}, bulk.invalid_record, {'fullname': 'B'}])
+    original_size = bulk.read_size
+    bulk.read_size = 4
+    try:
+      body = b'[{"fullname": "A"}, {"fullname": "x, ]" oops}, {"fullname": "C" "phone": [1]}, {"fullname": "B"}]'
+      records = list(bulk.readRecords(io.BytesIO(body), 'application/json'))
+    finally:
+      bulk.read_size = original_size
+    self.assertEqual([record if isinstance(record, dict) else record.error for record in records],
+      [{'fullname': 'A'}, bulk.invalid_record, bulk.invalid_record, {'fullname': 'B'}])
+
+  def test_validate_record(self):
+    '''Test that records are validated with the single contact rules'''
+    self.assertIsNone(bulk.validateRecord({'fullname': 'John Doe', 'phone': '3015558899', 'email': 'JohnDoe@gmail.com'}))
+    self.assertEqual(bulk.validateRecord(None), "Each record must be a JSON object.")
+    self.assertEqual(bulk.validateRecord({'phone': '3015558899', 'email': 'JohnDoe@gmail.com'}),
+      "Please provide a unique name for the new Contact.")
+    self.assertTrue(bulk.validateRecord({'fullname': 'John Doe', 'phone': '301555', 'email': 'JohnDoe@gmail.com'}).startswith("Phone number"))
+    self.assertTrue(bulk.validateRecord({'fullname': 'John Doe', 'phone': '3015558899', 'email': 'JohnDoe'}).startswith("Email address"))
+
+  def test_bulk_create(self):
+    '''Test that every record gets its own result, in order, and failed records do not stop the others'''
+    store = storage.MemoryStore([contact.toDict('Jane Doe', 'Jane', 'Doe', '3015558800', 'jane@example.com')])
+    records = [{'fullname': 'A B', 'phone': '3015558801', 'email': 'ab@example.com'}, bulk.InvalidRecord(bulk.invalid_record),
+      {'fullname': 'A B', 'phone': '3015558802', 'email': 'ab2@example.com'}, {'fullname': 'C D', 'phone': '3015558800', 'email': 'cd@example.com'},
+      {'fullname': 'E F', 'phone': '3015558803'}, {'fullname': 'G H', 'phone': '3015558804', 'email': 'gh@example.com'}]
+    result = bulk.bulkCreateContacts(records, store, chunk_size=2)
+    self.assertEqual((result['created'], result['failed']), (2, 4))
+    self.assertEqual([item['status'] for item in result['items']], [201, 400, 400, 400, 400, 201])
+    self.assertEqual(result['items'][1], {'fullname': '', 'status': 400, 'error': bulk.invalid_record})
+    self.assertEqual(result['items'][3]['error'], "Entered phone number is already in use. Please enter a different phone number")
+    self.assertIsNotNone(store.get('G H'))
+
+  def test_bulk_unreadable_body(self):
+    '''Test that records read before the body became unreadable are reported, followed by the error'''
+    def records():
+      yield {'fullname': 'A B', 'phone': '3015558801', 'email': 'ab@example.com'}
+      raise ValueError("Request body is not valid UTF-8.")
+    result = bulk.bulkCreateContacts(records(), storage.MemoryStore(), chunk_size=1)
+    self.assertEqual(result['items'], [{'fullname': 'A B', 'status': 201, 'result': 'Contact for A B has been successfully created.'},
+      {'fullname': '', 'status': 400, 'error': "Request body is not valid UTF-8."}])
+
+  def test_bulk_request(self):
+    '''Test that a line that is not valid JSON only fails its own record'''
+    from Address_Book import create_app
+    client = create_app(storage='memory').test_client()
+    body = '{"fullname": "A B", "phone": "3015558801", "email": "ab@example.com"}\nnot json\n{"fullname": "C D", "phone": "3015558802", "email": "cd@example.com"}\n'
+    response = client.post('/contact/_bulk?chunkSize=1', data=body, content_type='application/x-ndjson')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual([item['status'] for item in response.get_json()['items']], [201, 400, 201])
+    self.assertEqual(client.get('/contact/C D').status_code, 200)
+
+  def test_parse_chunk_size(self):
+    '''Test that requested chunk sizes are clamped to the allowed range'''
+    self.assertEqual(bulk.parseChunkSize(None), bulk.default_chunk_size)
+    self.assertEqual(bulk.parseChunkSize(-5), 1)
+    self.assertEqual(bulk.parseChunkSize(10**6), bulk.max_chunk_size)
+
+if __name__=='__main__':
+  unittest.main()
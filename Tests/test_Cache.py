@@ -0,0 +1,199 @@
+'''Testing for methods in cache.py
+
+This file contains unit tests for the contact cache used by getContact, and the search cache used by getAllContacts
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import threading
+import time
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files.cache import LRUCache, MemoryBackend, ContactCache, SearchCache
+
+class Clock:
+  '''Clock that only moves when advanced by a test'''
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+class TestCacheMethods(unittest.TestCase):
+  def test_lru_eviction(self):
+    '''Test that the least recently used entry is evicted when the cache is full'''
+    lru = LRUCache(max_size=2, ttl=60)
+    lru.set('John Doe', 1)
+    lru.set('Jane Doe', 2)
+    lru.get('John Doe')
+    lru.set('Tom Smith', 3)
+    self.assertEqual(lru.get('John Doe'), 1)
+    self.assertIsNone(lru.get('Jane Doe'))
+    self.assertEqual(lru.evictions, 1)
+
+  def test_ttl_expiration(self):
+    '''Test that entries are no longer served after their time to live'''
+    clock = Clock()
+    lru = LRUCache(max_size=10, ttl=5, clock=clock)
+    lru.set('John Doe', 1)
+    clock.now = 4
+    self.assertEqual(lru.get('John Doe'), 1)
+    clock.now = 5
+    self.assertIsNone(lru.get('John Doe'))
+    self.assertEqual((lru.hits, lru.misses, lru.expirations), (1, 1, 1))
+
+  def test_read_through(self):
+    '''Test that the loader is only called on a miss, and not called again until the contact is invalidated'''
+    calls = []
+    def loader():
+      calls.append(1)
+      return {'fullname': 'John Doe'}
+    contact_cache = ContactCache(max_size=10, ttl=60)
+    self.assertEqual(contact_cache.get('John Doe', loader), {'fullname': 'John Doe'})
+    self.assertEqual(contact_cache.get('John Doe', loader), {'fullname': 'John Doe'})
+    self.assertEqual(len(calls), 1)
+    contact_cache.invalidate('John Doe')
+    contact_cache.get('John Doe', loader)
+    self.assertEqual(len(calls), 2)
+    self.assertIsNone(contact_cache.get('Jane Doe', lambda: None))
+    self.assertEqual(contact_cache.stats()['misses'], 3)
+
+  def test_shared_backend(self):
+    '''Test that a contact cached by one process is served to another through the shared backend'''
+    shared = MemoryBackend()
+    first = ContactCache(max_size=10, ttl=60, shared=shared)
+    second = ContactCache(max_size=10, ttl=60, shared=shared)
+    first.get('John Doe', lambda: {'fullname': 'John Doe'})
+    self.assertEqual(second.get('John Doe', lambda: None), {'fullname': 'John Doe'})
+    self.assertEqual(second.stats()['shared_hits'], 1)
+    first.invalidate('John Doe')
+    second.local.clear()
+    self.assertIsNone(second.get('John Doe'))
+
+  def test_invalidate_during_load(self):
+    '''Test that a contact invalidated while it is read is returned but not cached'''
+    contact_cache = ContactCache(max_size=10, ttl=60)
+    def loader():
+      contact_cache.invalidate('John Doe')
+      return {'fullname': 'John Doe', 'phone': 'old'}
+    self.assertEqual(contact_cache.get('John Doe', loader)['phone'], 'old')
+    self.assertEqual(contact_cache.get('John Doe', lambda: {'fullname': 'John Doe', 'phone': 'new'})['phone'], 'new')
+    self.assertEqual(contact_cache.get('John Doe')['phone'], 'new')
+
+  def test_local_ttl(self):
+    '''Test that with a shared backend, contacts are only kept locally for a short time, so writes by other processes are seen'''
+    clock, shared = Clock(), MemoryBackend()
+    first = ContactCache(max_size=10, ttl=60, shared=shared, clock=clock)
+    second = ContactCache(max_size=10, ttl=60, shared=shared, clock=clock)
+    self.assertEqual(first.stats()['local_ttl'], 1)
+    second.get('John Doe', lambda: {'fullname': 'John Doe', 'phone': 'old'})
+    first.invalidate('John Doe')
+    first.get('John Doe', lambda: {'fullname': 'John Doe', 'phone': 'new'})
+    self.assertEqual(second.get('John Doe')['phone'], 'old')
+    clock.now = 1
+    self.assertEqual(second.get('John Doe')['phone'], 'new')
+
+  def test_search_generation(self):
+    '''Test that search pages are served from the cache until their address book is written'''
+    calls = []
+    def loader():
+      calls.append(1)
+      return {'hits': [len(calls)]}
+    search_cache = SearchCache(max_bytes=1024, ttl=60)
+    self.assertEqual(search_cache.get('default', ('doe', 10, 1), loader), {'hits': [1]})
+    self.assertEqual(search_cache.get('default', ('doe', 10, 1), loader), {'hits': [1]})
+    search_cache.bump('acme')
+    self.assertEqual(search_cache.get('default', ('doe', 10, 1), loader), {'hits': [1]})
+    search_cache.bump('default')
+    self.assertEqual(search_cache.get('default', ('doe', 10, 1), loader), {'hits': [2]})
+    self.assertEqual((search_cache.stats()['hits'], search_cache.stats()['misses']), (2, 2))
+
+  def test_search_memory_bound(self):
+    '''Test that the least recently used pages are evicted once the results take more than max_bytes'''
+    search_cache = SearchCache(max_bytes=60, ttl=60)
+    for page in (1, 2, 3):
+      search_cache.get('default', ('*', 10, page), lambda: {'hits': ['x' * 10]})
+    stats = search_cache.stats()
+    self.assertLessEqual(stats['bytes'], 60)
+    self.assertEqual(stats['evictions'], 1)
+    self.assertEqual(search_cache.get('default', ('*', 10, 1), lambda: {'hits': []}), {'hits': []})
+
+  def test_single_flight(self):
+    '''Test that concurrent misses for the same page run the search once'''
+    search_cache = SearchCache(max_bytes=1024, ttl=60)
+    started, release, calls, results = threading.Event(), threading.Event(), [], []
+    def loader():
+      calls.append(1)
+      started.set()
+      release.wait()
+      return {'hits': ['John Doe']}
+    threads = [threading.Thread(target=lambda: results.append(search_cache.get('default', ('doe',), loader))) for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+      thread.start()
+    while search_cache.stats()['collapsed'] < 3:
+      time.sleep(0.001)
+    release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(results, [{'hits': ['John Doe']}] * 4)
+
+  def test_single_flight_written(self):
+    '''Test that requests waiting for a search run their own when the book is written during it'''
+    search_cache = SearchCache(max_bytes=1024, ttl=60)
+    started, release, calls, results = threading.Event(), threading.Event(), [], []
+    def loader():
+      calls.append(1)
+      if len(calls) == 1:
+        started.set()
+        release.wait()
+        return {'hits': ['old']}
+      return {'hits': ['new']}
+    threads = [threading.Thread(target=lambda: results.append(search_cache.get('default', ('doe',), loader))) for _ in range(3)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+      thread.start()
+    while search_cache.stats()['collapsed'] < 2:
+      time.sleep(0.001)
+    search_cache.bump('default')
+    release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(calls), 3)
+    self.assertEqual(sorted(result['hits'][0] for result in results), ['new', 'new', 'old'])
+
+  def test_search_invalidation(self):
+    '''Test that getAllContacts serves cached pages until a contact is created, updated, or deleted'''
+    from API_Files import api_methods, storage
+    store = storage.MemoryStore()
+    api_methods.createContact('John Doe', 'John', 'Doe', '1234567890', 'john@example.com', store)
+    self.assertEqual(api_methods.getAllContacts(10, 1, ' doe ', store, slim=True)['total'], 1)
+    hits = api_methods.search_cache.stats()['hits']
+    self.assertEqual(api_methods.getAllContacts(10, 1, 'doe', store, slim=True)['total'], 1)
+    self.assertEqual(api_methods.search_cache.stats()['hits'], hits + 1)
+    api_methods.createContact('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com', store)
+    self.assertEqual(api_methods.getAllContacts(10, 1, 'doe', store, slim=True)['total'], 2)
+    api_methods.deleteContact('John Doe', store)
+    self.assertEqual(api_methods.getAllContacts(10, 1, 'doe', store, slim=True)['total'], 1)
+
+  def test_search_tag(self):
+    '''Test that the ETag of a page is cached with it, so a cached page does not read the write marker of the store'''
+    from API_Files import api_methods, storage
+    store = storage.MemoryStore()
+    api_methods.createContact('John Doe', 'John', 'Doe', '1234567890', 'john@example.com', store)
+    generation, calls = store.generation, []
+    store.generation = lambda: calls.append(1) or generation()
+    page, tag = api_methods.getTaggedContacts(10, 1, 'doe', store, slim=True)
+    self.assertEqual((page['total'], api_methods.getTaggedContacts(10, 1, ' doe', store, slim=True)), (1, (page, tag)))
+    self.assertEqual(len(calls), 1)
+    api_methods.createContact('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com', store)
+    self.assertNotEqual(api_methods.getTaggedContacts(10, 1, 'doe', store)[1], tag)
+    self.assertEqual(len(calls), 2)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+'''Testing for methods in compression.py
+
+This file contains unit tests for choosing the response encoding and compressing responses
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import gzip
+import sys
+sys.path.append('..')
+
+from flask import Response
+from API_Files import compression
+
+class TestCompressionMethods(unittest.TestCase):
+  def test_choose_encoding(self):
+    '''Test that the encoding follows the Accept-Encoding weights and the installed packages'''
+    self.assertIsNone(compression.chooseEncoding(None))
+    self.assertIsNone(compression.chooseEncoding('identity'))
+    self.assertIsNone(compression.chooseEncoding('gzip;q=0'))
+    self.assertEqual(compression.chooseEncoding('deflate, gzip'), 'gzip')
+    self.assertEqual(compression.chooseEncoding('*'), 'br' if compression.brotli is not None else 'gzip')
+    self.assertEqual(compression.chooseEncoding('br;q=0.5, gzip'), 'gzip')
+
+  def test_compress_response(self):
+    '''Test that large JSON responses are compressed, and small or streamed responses are not'''
+    body = b'{"contacts":[' + b','.join(b'{"fullname":"Contact %d"}' % number for number in range(100)) + b']}'
+    response = compression.compressResponse(Response(body, mimetype='application/json'), 'gzip', 1024)
+    self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+    self.assertEqual(gzip.decompress(response.get_data()), body)
+    self.assertIn('Accept-Encoding', response.headers['Vary'])
+    small = compression.compressResponse(Response(b'{}', mimetype='application/json'), 'gzip', 1024)
+    self.assertNotIn('Content-Encoding', small.headers)
+    streamed = compression.compressResponse(Response(iter([body]), mimetype='application/x-ndjson'), 'gzip', 1024)
+    self.assertNotIn('Content-Encoding', streamed.headers)
+
+
+class TestCompressedETags(unittest.TestCase):
+  def setUp(self):
+    from Address_Book import create_app
+    self.client = create_app(storage='memory', compress_min_bytes=1).test_client()
+    self.client.post('/contact?fullname=John%20Doe&firstname=John&phone=1234567890&email=john@example.com')
+    self.identity = self.client.get('/contact/John Doe').headers['ETag']
+
+  def checkEncoding(self, encoding):
+    response = self.client.get('/contact/John Doe', headers={'Accept-Encoding': encoding})
+    tag = response.headers['ETag']
+    self.assertEqual((response.headers['Content-Encoding'], tag), (encoding, self.identity[:-1]+'-'+encoding+'"'))
+    response = self.client.get('/contact/John Doe', headers={'Accept-Encoding': encoding, 'If-None-Match': tag})
+    self.assertEqual((response.status_code, response.headers['ETag']), (304, tag))
+    self.assertEqual(self.client.get('/contact/John Doe', headers={'If-None-Match': tag}).status_code, 304)
+    self.assertEqual(self.client.put('/contact/John Doe?firstname=Johnny', headers={'If-Match': tag}).status_code, 200)
+    self.assertEqual(self.client.get('/contact/John Doe', headers={'If-None-Match': tag}).status_code, 200)
+
+  def test_gzip(self):
+    '''Test that a gzip body has its own strong ETag, which is matched by If-None-Match and If-Match'''
+    self.checkEncoding('gzip')
+
+  @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+  def test_brotli(self):
+    '''Test that a brotli body has its own strong ETag, which is matched by If-None-Match and If-Match'''
+    self.checkEncoding('br')
+
+if __name__=='__main__':
+  unittest.main()
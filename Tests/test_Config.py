@@ -0,0 +1,64 @@
+'''Testing for methods in config.py
+
+This file contains unit tests for reading the app settings and building the Elasticsearch client options from them
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import json
+import os
+import sys
+import tempfile
+sys.path.append('..')
+
+from API_Files import config
+from API_Files.storage import ElasticStore
+
+class TestConfigMethods(unittest.TestCase):
+  def test_defaults(self):
+    '''Test that every setting has its default when nothing is configured'''
+    self.assertEqual(config.loadConfig(environ={}), config.defaults)
+
+  def test_precedence(self):
+    '''Test that the file replaces the defaults, the environment replaces the file, and overrides replace both'''
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'addressbook.json')
+      with open(path, 'w') as file:
+        json.dump({'hosts': ['es1:9200', 'es2:9200'], 'request_timeout': 5, 'cache_size': 10}, file)
+      environ = {'ADDRESSBOOK_CONFIG': path, 'ADDRESSBOOK_REQUEST_TIMEOUT': '2.5', 'ADDRESSBOOK_HTTP_COMPRESS': 'true'}
+      settings = config.loadConfig(environ=environ, cache_size=20)
+    self.assertEqual(settings['hosts'], 'es1:9200,es2:9200')
+    self.assertEqual(settings['request_timeout'], 2.5)
+    self.assertIs(settings['http_compress'], True)
+    self.assertEqual(settings['cache_size'], 20)
+
+  def test_invalid_settings(self):
+    '''Test that unknown settings and values of the wrong type are rejected'''
+    with self.assertRaises(ValueError):
+      config.loadConfig(environ={}, port=9200)
+    with self.assertRaises(ValueError):
+      config.loadConfig(environ={'ADDRESSBOOK_MAX_RETRIES': 'many'})
+
+  def test_client_options(self):
+    '''Test that the settings are turned into Elasticsearch client options'''
+    settings = config.loadConfig(environ={'ADDRESSBOOK_HOSTS': 'es1:9200, https://es2:9243', 'ADDRESSBOOK_RETRY_ON_STATUS': '429,503'})
+    options = config.clientOptions(settings)
+    self.assertEqual(options['hosts'], ['es1:9200', 'https://es2:9243'])
+    self.assertEqual(options['retry_on_status'], (429, 503))
+    self.assertEqual((options['timeout'].connect_timeout, options['timeout'].read_timeout), (2.0, 10.0))
+    self.assertNotIn('sniffer_timeout', options)
+    self.assertEqual(config.clientOptions(settings, async_client=True)['timeout'], 10.0)
+
+  def test_client_per_process(self):
+    '''Test that a store created with a client factory creates its client on first use, and again in a new process'''
+    clients = []
+    store = ElasticStore(client_factory=lambda: clients.append(object()) or clients[-1])
+    self.assertEqual(clients, [])
+    self.assertIs(store.es, store.es)
+    store._pid = -1
+    self.assertIsNot(store.es, clients[0])
+    self.assertEqual(len(clients), 2)
+
+if __name__=='__main__':
+  unittest.main()
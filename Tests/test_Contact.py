@@ -10,7 +10,7 @@ import json
 import sys
 sys.path.append('..')
 
-from API_Files.contact import toJSON, updateJSON, formatPhone, formatEmail
+from API_Files.contact import Contact, dumps, loads, toJSON, updateJSON, formatPhone, formatEmail
 
 class TestContactMethods(unittest.TestCase):
   def test_to_json(self):
@@ -56,5 +56,26 @@ class TestContactMethods(unittest.TestCase):
     self.assertFalse(formatEmail("bademail.com"))
     self.assertFalse(formatEmail("alsobad@email"))
 
+  def test_contact_type(self):
+    '''Test that Contact converts to and from the stored dictionary, and serializes to the same JSON as toJSON'''
+    source = {'fullname': 'John Doe', 'firstname': 'John', 'lastname': 'Doe', 'phone': '3015558899', 'email': 'JohnDoe@gmail.com'}
+    record = Contact.fromDict(source)
+    self.assertEqual(record.toDict(), source)
+    self.assertIsInstance(record.toBytes(), bytes)
+    self.assertEqual(loads(record.toBytes()), json.loads(toJSON(**source)))
+    self.assertEqual(record.replace({'phone': '5557569967'}).phone, '5557569967')
+    self.assertEqual(record.phone, '3015558899')
+    self.assertFalse(hasattr(record, '__dict__'))
+
+  def test_contact_validation(self):
+    '''Test that Contact.validate reports missing and badly formatted fields'''
+    self.assertIsNone(Contact('John Doe', '', '', '3015558899', 'JohnDoe@gmail.com').validate())
+    self.assertIn("phone number", Contact('John Doe').validate())
+    self.assertIn("Email address not properly formatted", Contact('John Doe', '', '', '3015558899', 'bademail.com').validate())
+
+  def test_dumps(self):
+    '''Test that dumps returns compact UTF-8 JSON bytes'''
+    self.assertEqual(dumps({'name': 'Zoë', 'page': [1, None]}), '{"name":"Zoë","page":[1,null]}'.encode('utf-8'))
+
 if __name__=='__main__':
   unittest.main()
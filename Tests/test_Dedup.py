@@ -0,0 +1,90 @@
+'''Testing for methods in dedup.py
+
+This file contains unit tests for the blocking keys, scoring, and clustering used to find duplicate contacts
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import contact, dedup, storage
+
+class TestDedupMethods(unittest.TestCase):
+  def test_soundex(self):
+    '''Test Soundex codes, including letters separated by h or w'''
+    self.assertEqual([dedup.soundex(name) for name in ('Robert', 'Rupert', 'Ashcraft', 'Tymczak', 'Pfister', 'Jon', 'John')],
+      ['R163', 'R163', 'A261', 'T522', 'P236', 'J500', 'J500'])
+    self.assertEqual(dedup.soundex('-'), '')
+
+  def test_blocking_keys(self):
+    '''Test that emails, phones, and names are normalized into blocking keys'''
+    record = dedup.matchRecord({'fullname': 'Jon Smith', 'firstname': 'Jon', 'lastname': 'Smith', 'phone': '+1 (301) 555-1234', 'email': ' Jon@Example.com'})
+    self.assertEqual(dedup.blockingKeys(record), ('email:jon@example.com', 'phone:3015551234', 'name:J500S530'))
+
+  def test_pairs_compared_once(self):
+    '''Test that a pair sharing several blocks is only compared in one of them'''
+    first = dedup.matchRecord(contact.toDict('John Smith', 'John', 'Smith', '3015551234', 'john@example.com'))
+    second = dedup.matchRecord(contact.toDict('Jon Smith', 'Jon', 'Smith', '3015551234', 'john@example.com'))
+    keys = (dedup.blockingKeys(first), dedup.blockingKeys(second))
+    blocks = [(key, [(0, first, keys[0]), (1, second, keys[1])], None) for key in keys[0]]
+    pairs, compared = dedup.scoreBlocks(blocks, dedup.default_threshold)
+    self.assertEqual(compared, 1)
+    self.assertEqual([pair[:2] for pair in pairs], [(0, 1)])
+    self.assertEqual(pairs[0][3], ['name', 'email', 'phone'])
+
+  def test_clusters(self):
+    '''Test that pairs are joined into clusters, keeping the most complete contact'''
+    records = [('Jon Smith', 'jon smith', '', '3015551234'), ('John Smith', 'john smith', 'john@example.com', '3015551234'),
+      ('J Smith', 'j smith', 'john@example.com', ''), ('Jane Roe', 'jane roe', 'jane@example.com', '')]
+    clusters = dedup.buildClusters([(0, 1, 0.9, ['phone']), (1, 2, 0.8, ['email'])], records)
+    self.assertEqual(len(clusters), 1)
+    self.assertEqual((clusters[0]['keep'], clusters[0]['merge'], clusters[0]['score']), ('John Smith', ['J Smith', 'Jon Smith'], 0.9))
+
+
+class TestFindDuplicates(unittest.TestCase):
+  def setUp(self):
+    self.store = storage.MemoryStore([
+      contact.toDict('John Smith', 'John', 'Smith', '3015551234', 'john.smith@example.com'),
+      contact.toDict('Jon Smith', 'Jon', 'Smith', '3015551235', 'jsmith@example.com'),
+      contact.toDict('Jane Roe', 'Jane', 'Roe', '3015551236', 'jane@example.com'),
+      contact.toDict('John Smyth', 'John', 'Smyth', '3015551237', 'smyth@example.org')])
+
+  def test_find_duplicates(self):
+    '''Test that only contacts with similar names and emails are reported, in the current process or a pool'''
+    report = dedup.findDuplicates(self.store, processes=0)
+    self.assertEqual([(cluster['keep'], cluster['merge']) for cluster in report['clusters']], [('John Smith', ['Jon Smith'])])
+    self.assertEqual(report['clusters'][0]['contacts'][1]['email'], 'jsmith@example.com')
+    self.assertEqual(dedup.findDuplicates(self.store, processes=2)['clusters'], report['clusters'])
+
+  def test_oversized_blocks(self):
+    '''Test that blocks larger than max_block_size are compared within a window'''
+    store = storage.MemoryStore([contact.toDict('John Smith '+str(number), 'John', 'Smith', str(3015550000 + number), 'smith'+str(number)+'@example.com')
+      for number in range(30)])
+    size, dedup.max_block_size = dedup.max_block_size, 10
+    try:
+      report = dedup.findDuplicates(store, processes=0, window=2)
+    finally:
+      dedup.max_block_size = size
+    self.assertEqual(report['comparisons'], 29 + 28)
+
+
+class TestDuplicatesRequests(unittest.TestCase):
+  def test_requests(self):
+    '''Test that the report is served for small address books, and larger ones are sent to Find_Duplicates.py'''
+    from Address_Book import create_app
+    client = create_app(storage='memory').test_client()
+    client.post('/contact?fullname=John%20Smith&firstname=John&lastname=Smith&phone=3015551234&email=john.smith@example.com')
+    client.post('/contact?fullname=Jon%20Smith&firstname=Jon&lastname=Smith&phone=3015551235&email=jsmith@example.com')
+    self.assertEqual(client.get('/contact/_duplicates').get_json()['total'], 1)
+    size, dedup.max_endpoint_contacts = dedup.max_endpoint_contacts, 1
+    try:
+      response = client.get('/contact/_duplicates')
+    finally:
+      dedup.max_endpoint_contacts = size
+    self.assertEqual(response.status_code, 413)
+    self.assertIn('Find_Duplicates.py', response.get_json()['message'])
+
+if __name__=='__main__':
+  unittest.main()
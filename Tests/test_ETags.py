@@ -0,0 +1,88 @@
+'''Testing for methods in etags.py
+
+This file contains unit tests for contact and search ETags, conditional GETs, and If-Match on PUT and DELETE
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import etags
+
+class TestETagMethods(unittest.TestCase):
+  def test_contact_tag(self):
+    '''Test that contact tags are made of the primary term and sequence number'''
+    self.assertEqual(etags.contactTag({'_seq_no': 42, '_primary_term': 3}), '"3-42"')
+    self.assertIsNone(etags.contactTag({'_source': {}}))
+    self.assertIsNone(etags.contactTag(None))
+
+  def test_matches(self):
+    '''Test weak comparison for If-None-Match and strong comparison for If-Match'''
+    self.assertTrue(etags.matches('"1-1", "1-2"', '"1-2"'))
+    self.assertTrue(etags.matches('W/"1-2"', '"1-2"'))
+    self.assertFalse(etags.matches('W/"1-2"', '"1-2"', weak=False))
+    self.assertFalse(etags.matches('"abc"', 'W/"abc"', weak=False))
+    self.assertTrue(etags.matches('*', '"1-2"', weak=False))
+    self.assertFalse(etags.matches('*', None))
+    self.assertFalse(etags.matches(None, '"1-2"'))
+
+  def test_encoded_tag(self):
+    '''Test that compressed bodies have the encoding in their strong tags, and are matched in any encoding'''
+    self.assertEqual(etags.encodedTag('"1-2"', 'gzip'), '"1-2-gzip"')
+    self.assertEqual(etags.encodedTag('W/"abc"', 'br'), 'W/"abc"')
+    self.assertIsNone(etags.encodedTag(None, 'gzip'))
+    self.assertEqual(etags.listedTag('"1-1", "1-2-br"', '"1-2"'), '"1-2-br"')
+    self.assertTrue(etags.matches('"1-2-gzip"', '"1-2"', weak=False))
+    self.assertFalse(etags.matches('W/"1-2-gzip"', '"1-2"', weak=False))
+    self.assertFalse(etags.matches('"1-3-gzip"', '"1-2"'))
+
+  def test_search_tag(self):
+    '''Test that search tags are weak and change with the generation and parameters'''
+    tag = etags.searchTag('5', 'doe', 10, 1)
+    self.assertTrue(tag.startswith('W/"'))
+    self.assertEqual(tag, etags.searchTag('5', 'doe', 10, 1))
+    self.assertNotEqual(tag, etags.searchTag('6', 'doe', 10, 1))
+    self.assertNotEqual(tag, etags.searchTag('5', 'doe', 10, 2))
+    self.assertIsNone(etags.searchTag(None, 'doe', 10, 1))
+
+
+class TestConditionalRequests(unittest.TestCase):
+  def setUp(self):
+    from Address_Book import create_app
+    self.client = create_app(storage='memory').test_client()
+    self.client.post('/contact?fullname=John%20Doe&firstname=John&phone=1234567890&email=john@example.com')
+
+  def test_conditional_get(self):
+    '''Test that an unchanged contact is answered with 304, and a changed one with its new ETag'''
+    response = self.client.get('/contact/John Doe')
+    tag = response.headers['ETag']
+    response = self.client.get('/contact/John Doe', headers={'If-None-Match': tag})
+    self.assertEqual((response.status_code, response.get_data(), response.headers['ETag']), (304, b'', tag))
+    self.client.put('/contact/John Doe?firstname=Johnny')
+    response = self.client.get('/contact/John Doe', headers={'If-None-Match': tag})
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response.headers['ETag'], tag)
+
+  def test_conditional_search(self):
+    '''Test that search results are answered with 304 until any contact is written'''
+    tag = self.client.get('/contact?query=doe').headers['ETag']
+    self.assertEqual(self.client.get('/contact?query=doe', headers={'If-None-Match': tag}).status_code, 304)
+    self.assertEqual(self.client.get('/contact?query=doe&page=2', headers={'If-None-Match': tag}).status_code, 200)
+    self.client.post('/contact?fullname=Jane%20Doe&phone=1234567891&email=jane@example.com')
+    self.assertEqual(self.client.get('/contact?query=doe', headers={'If-None-Match': tag}).status_code, 200)
+
+  def test_if_match(self):
+    '''Test that PUT and DELETE with a stale If-Match are rejected with 412, and made with a current one'''
+    tag = self.client.get('/contact/John Doe').headers['ETag']
+    self.assertEqual(self.client.put('/contact/John Doe?firstname=Johnny', headers={'If-Match': tag}).status_code, 200)
+    self.assertEqual(self.client.put('/contact/John Doe?firstname=Jack', headers={'If-Match': tag}).status_code, 412)
+    self.assertEqual(self.client.delete('/contact/John Doe', headers={'If-Match': tag}).status_code, 412)
+    self.assertEqual(self.client.get('/contact/John Doe').get_json()['firstname'], 'Johnny')
+    tag = self.client.get('/contact/John Doe').headers['ETag']
+    self.assertEqual(self.client.delete('/contact/John Doe', headers={'If-Match': tag}).status_code, 200)
+    self.assertEqual(self.client.delete('/contact/John Doe', headers={'If-Match': tag}).status_code, 400)
+
+if __name__=='__main__':
+  unittest.main()
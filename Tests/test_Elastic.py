@@ -45,7 +45,7 @@ class TestElasticMethods(unittest.TestCase):
     test_json = json.dumps({'fullname': 'Tom Smith', 'firstname': 'Tom', 'lastname': 'Smith', 'phone': '4435567789', 'email': 'TomSmith2@example.com'})
     result = api_methods.updateContact(fullname, firstname, lastname, phone, email, es)
     self.assertEqual(result, "Contact "+fullname+" has been successfully updated.")
-    result_json = json.dumps(es.get(index="addressbook", doc_type="contact", id=fullname)["_source"])
+    result_json = json.dumps(es.get(index="addressbook", id=fullname)["_source"])
     self.assertEqual(result_json, test_json)
 
   def test_remove_contact(self):
@@ -0,0 +1,54 @@
+'''Testing for methods in export.py
+
+This file contains unit tests for exporting contacts as NDJSON and CSV, using the in-memory contact store
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import json
+import sys
+sys.path.append('..')
+
+from API_Files import export
+from API_Files.contact import toDict
+from API_Files.storage import MemoryStore
+
+class TestExportMethods(unittest.TestCase):
+  def setUp(self):
+    self.store = MemoryStore([
+      toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com'),
+      toDict('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com'),
+      toDict('Tom Smith', 'Tom', 'Smith, Jr', '1234567892', 'tom@example.com')
+    ])
+
+  def test_ndjson(self):
+    '''Test that every contact is exported as one JSON object per line'''
+    body = b''.join(export.exportContacts(self.store, 'ndjson'))
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    self.assertEqual(sorted(record['fullname'] for record in records), ['Jane Doe', 'John Doe', 'Tom Smith'])
+    self.assertEqual(records[0], self.store.get(records[0]['fullname'])['_source'])
+
+  def test_csv_fields_and_query(self):
+    '''Test that CSV exports start with a header, quote values, and only include the selected fields and matching contacts'''
+    fields = export.parseFields('fullname, lastname')
+    body = b''.join(export.exportContacts(self.store, 'csv', 'smith', fields)).decode('utf-8')
+    self.assertEqual(body.splitlines(), ['fullname,lastname', 'Tom Smith,"Smith, Jr"'])
+    body = b''.join(export.exportContacts(self.store, 'csv', 'nobody', fields)).decode('utf-8')
+    self.assertEqual(body.splitlines(), ['fullname,lastname'])
+
+  def test_first_chunk(self):
+    '''Test that the first contact is sent on its own, and the rest are grouped into chunks'''
+    chunks = list(export.exportContacts(self.store, 'ndjson'))
+    self.assertEqual(len(chunks), 2)
+    self.assertEqual(chunks[0].count(b'\n'), 1)
+
+  def test_invalid_options(self):
+    '''Test that unknown formats and fields are rejected before the export starts'''
+    with self.assertRaises(ValueError):
+      export.exportContacts(self.store, 'xml')
+    with self.assertRaises(ValueError):
+      export.parseFields('fullname,address')
+
+if __name__=='__main__':
+  unittest.main()
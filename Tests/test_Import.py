@@ -0,0 +1,75 @@
+'''Testing for methods in importer.py
+
+This file contains unit tests for reading, validating, and importing CSV and vCard contact files, using the in-memory contact store
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import io
+import os
+import sys
+import tempfile
+sys.path.append('..')
+
+from API_Files import importer
+from API_Files.storage import MemoryStore
+
+class TestImportMethods(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def writeFile(self, name, text):
+    path = os.path.join(self.directory.name, name)
+    with open(path, 'w', encoding='utf-8') as file:
+      file.write(text)
+    return path
+
+  def test_read_csv(self):
+    '''Test that CSV columns are matched by name and a missing fullname is formed from the first and last names'''
+    path = self.writeFile('contacts.csv', 'First Name,Last Name,Phone,Email_Address,Notes\nJohn,Doe,3015558899,john@example.com,x\n\nJane,Doe,3015558890,jane@example.com,y\n')
+    records = list(importer.readRecords(path))
+    self.assertEqual(records[0], (2, {'firstname': 'John', 'lastname': 'Doe', 'phone': '3015558899', 'email': 'john@example.com', 'fullname': 'John Doe'}))
+    self.assertEqual(records[1][0], 4)
+
+  def test_read_vcard(self):
+    '''Test that vCard properties, parameters, folded lines, and formatted phone numbers are read'''
+    path = self.writeFile('contacts.vcf', 'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:John Doe\r\nN:Doe;John;;;\r\nTEL;TYPE=CELL:+1 (301) 555-8899\r\n'
+      'TEL;TYPE=HOME:3015550000\r\nEMAIL;TYPE=INTERNET:john@exa\r\n mple.com\r\nEND:VCARD\r\nBEGIN:VCARD\r\nN:Smith;Tom\r\nEND:VCARD\r\n')
+    records = list(importer.readRecords(path))
+    self.assertEqual(records[0], (1, {'fullname': 'John Doe', 'lastname': 'Doe', 'firstname': 'John', 'phone': '3015558899', 'email': 'john@example.com'}))
+    self.assertEqual(records[1][1]['fullname'], 'Tom Smith')
+
+  def test_validate_batch(self):
+    '''Test that batches are split into valid contacts and rejected rows with the API error messages'''
+    valid, rejected = importer.validateBatch([(2, {'fullname': 'John Doe', 'phone': '3015558899', 'email': 'john@example.com'}),
+      (3, {'fullname': 'Jane Doe', 'phone': '301555', 'email': 'jane@example.com'})])
+    self.assertEqual(valid, [(2, {'fullname': 'John Doe', 'firstname': '', 'lastname': '', 'phone': '3015558899', 'email': 'john@example.com'})])
+    self.assertEqual(rejected[0][0], 3)
+    self.assertIn("Phone number not properly formatted", rejected[0][2])
+
+  def test_import_contacts(self):
+    '''Test that valid rows are created, and invalid or duplicate rows are written to the reject file'''
+    records = [(line, {'fullname': 'Contact '+str(line), 'phone': '30155588'+str(line).zfill(2), 'email': str(line)+'@example.com'}) for line in range(2, 12)]
+    records.append((12, {'fullname': 'Contact 2', 'phone': '3015550000', 'email': 'other@example.com'}))
+    records.append((13, {'fullname': 'Bad Email', 'phone': '3015550001', 'email': 'bad'}))
+    store, rejects, progress = MemoryStore(), io.StringIO(), []
+    counts = importer.importContacts(records, store, batch_size=3, processes=0, threads=2, rejects=rejects, progress=progress.append)
+    self.assertEqual((counts['rows'], counts['created'], counts['rejected']), (12, 10, 2))
+    self.assertEqual(store.count(), 10)
+    self.assertEqual(len(progress), 4)
+    lines = rejects.getvalue().splitlines()
+    self.assertEqual(lines[0], 'line,reason,fullname,firstname,lastname,phone,email')
+    self.assertEqual(sorted(line.split(',')[0] for line in lines[1:]), ['12', '13'])
+
+  def test_process_pool(self):
+    '''Test that validation in worker processes gives the same result'''
+    records = [(line, {'fullname': 'Contact '+str(line), 'phone': '30155588'+str(line).zfill(2), 'email': str(line)+'@example.com'}) for line in range(20)]
+    counts = importer.importContacts(records, MemoryStore(), batch_size=4, processes=2)
+    self.assertEqual(counts['created'], 20)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+'''Testing for methods in mappings.py
+
+This file contains unit tests for creating indices and migrating them to a new mapping version, including writes made while they are copied
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from elasticsearch.exceptions import AuthorizationException
+from API_Files import contact, mappings
+from fake_elasticsearch import FakeElasticsearch
+
+john = contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')
+jane = contact.toDict('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com')
+jim = contact.toDict('Jim Doe', 'Jim', 'Doe', '1234567892', 'jim@example.com')
+
+class TestMigrate(unittest.TestCase):
+  def setUp(self):
+    self.es = FakeElasticsearch()
+    self.es.indices.create(index='addressbook-v1')
+    self.es.indices.put_alias(index='addressbook-v1', name='addressbook')
+    for source in (john, jane):
+      self.es.index(index='addressbook', id=source['fullname'], body=source)
+    self.passes = 0
+
+  def test_writes_during_copy(self):
+    '''Test that updates, creates, and deletes made while the documents are copied reach the new index, and writes are blocked for the last copy'''
+    def writes(client):
+      self.passes += 1
+      if self.passes == 1:
+        client.index(index='addressbook', id='John Doe', body=dict(john, phone='1111111111'))
+        client.delete(index='addressbook', id='Jane Doe')
+        client.index(index='addressbook', id='Jim Doe', body=jim)
+      elif self.passes == 2:
+        client.index(index='addressbook', id='John Doe', body=dict(john, phone='2222222222'))
+        client.delete(index='addressbook', id='Jim Doe')
+      else:
+        with self.assertRaises(AuthorizationException):
+          client.index(index='addressbook', id='John Doe', body=dict(john, phone='3333333333'))
+    self.es.after_reindex = writes
+
+    self.assertEqual(mappings.migrate('addressbook', self.es, poll_interval=0), 'addressbook-v2')
+    self.assertEqual(self.passes, 3)
+    self.assertEqual(mappings.currentIndex('addressbook', self.es), 'addressbook-v2')
+    docs = self.es.data['addressbook-v2']['docs']
+    self.assertEqual(sorted(docs), ['John Doe'])
+    self.assertEqual(docs['John Doe']['_source']['phone'], '2222222222')
+    self.assertTrue(self.es.data['addressbook-v1']['blocked'])
+
+  def test_failed_copy(self):
+    '''Test that a failed copy raises, leaving the alias on the old index with its writes allowed'''
+    def failure(client):
+      self.passes += 1
+      client.fail_tasks = self.passes == 3
+    self.es.after_reindex = failure
+    with self.assertRaises(RuntimeError):
+      mappings.migrate('addressbook', self.es, poll_interval=0)
+    self.assertEqual(mappings.currentIndex('addressbook', self.es), 'addressbook-v1')
+    self.assertFalse(self.es.data['addressbook-v1']['blocked'])
+
+  def test_index_without_alias(self):
+    '''Test that an index created before aliases were used is only migrated when migrate is run'''
+    es = FakeElasticsearch()
+    es.indices.create(index='addressbook')
+    es.index(index='addressbook', id='John Doe', body=john)
+    self.assertEqual(mappings.ensureIndices(es)['addressbook'], 'addressbook')
+    self.assertNotIn('addressbook-v2', es.data)
+    self.assertEqual(mappings.migrate('addressbook', es, poll_interval=0), 'addressbook-v2')
+    self.assertEqual(mappings.currentIndex('addressbook', es), 'addressbook-v2')
+    self.assertEqual(list(es.data['addressbook-v2']['docs']), ['John Doe'])
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+'''Testing for methods in metrics.py
+
+This file contains unit tests for the request, Elasticsearch, and error metrics, and for the GET /metrics endpoint
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from elasticsearch import Elasticsearch, ConnectionError
+from API_Files import metrics
+
+class TestMetricsMethods(unittest.TestCase):
+  def setUp(self):
+    metrics.registry = metrics.Metrics()
+
+  def test_backend_operation(self):
+    '''Test the operation names given to Elasticsearch calls'''
+    self.assertEqual(metrics.backendOperation('GET', '/addressbook/_doc/John%20Doe'), 'get')
+    self.assertEqual(metrics.backendOperation('PUT', '/addressbook-reservations/_create/phone%3A1'), 'create')
+    self.assertEqual(metrics.backendOperation('POST', '/addressbook/_update/John%20Doe'), 'update')
+    self.assertEqual(metrics.backendOperation('POST', '/_bulk'), 'bulk')
+    self.assertEqual(metrics.backendOperation('POST', '/addressbook/_pit?keep_alive=1m'), 'open_pit')
+    self.assertEqual(metrics.backendOperation('DELETE', '/_pit'), 'close_pit')
+    self.assertEqual(metrics.backendOperation('PUT', '/addressbook-v2'), 'indices')
+
+  def test_request_backend_calls(self):
+    '''Test that Elasticsearch calls are counted for the request that made them, and rendered in the Prometheus format'''
+    registry = metrics.registry
+    registry.startRequest()
+    registry.observeBackend('get', '200', 0.002)
+    registry.observeBackend('index', '200', 0.003)
+    calls, seconds = registry.observeRequest('POST', '/contact', 200, 0.01)
+    self.assertEqual(calls, 2)
+    self.assertAlmostEqual(seconds, 0.005)
+    text = registry.render([('addressbook_cache_hits', "Contact cache hits.", 3)])
+    self.assertIn('addressbook_requests_total{method="POST",route="/contact",status="200"} 1', text)
+    self.assertIn('addressbook_request_backend_calls_total{method="POST",route="/contact"} 2', text)
+    self.assertIn('addressbook_request_duration_seconds_bucket{method="POST",route="/contact",le="0.01"} 1', text)
+    self.assertIn('addressbook_request_duration_seconds_bucket{method="POST",route="/contact",le="0.005"} 0', text)
+    self.assertIn('addressbook_backend_duration_seconds_count{operation="get"} 1', text)
+    self.assertIn('addressbook_cache_hits 3', text)
+
+  def test_instrumented_transport(self):
+    '''Test that failed Elasticsearch calls are recorded with the error status'''
+    es = Elasticsearch(['localhost:1'], transport_class=metrics.InstrumentedTransport, max_retries=0)
+    with self.assertRaises(ConnectionError):
+      es.get(index='addressbook', id='John Doe')
+    self.assertEqual(metrics.registry.backend_calls, {('get', 'error'): 1})
+
+  def test_metrics_endpoint(self):
+    '''Test that routes and error responses are counted, and served by GET /metrics'''
+    from Address_Book import create_app
+    client = create_app(storage='memory').test_client()
+    client.get('/contact/Nobody')
+    client.post('/contact?fullname=John%20Doe&phone=1234567890&email=john@example.com')
+    text = client.get('/metrics').get_data(as_text=True)
+    self.assertIn('addressbook_requests_total{method="GET",route="/contact/<contact_name>",status="400"} 1', text)
+    self.assertIn('addressbook_requests_total{method="POST",route="/contact",status="200"} 1', text)
+    self.assertIn('addressbook_errors_total{status="400"} 1', text)
+    self.assertIn('addressbook_cache_misses', text)
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,42 @@
+'''Testing for methods in pagination.py
+
+This file contains unit tests for the cursors used to page through search results
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import pagination
+
+class TestPaginationMethods(unittest.TestCase):
+  def test_cursor_round_trip(self):
+    '''Test that a cursor returns the state it was built from'''
+    cursor = pagination.encodeCursor('Jim', 10, [1.0, 'Jim Smith'], 'pit-id')
+    state = pagination.decodeCursor(cursor)
+    self.assertEqual(state, {'query': 'Jim', 'page_size': 10, 'search_after': [1.0, 'Jim Smith'], 'pit_id': 'pit-id', 'use_pit': True})
+    self.assertNotIn('=', cursor)
+
+  def test_cursor_without_pit(self):
+    '''Test that cursors remember when points in time are unavailable'''
+    state = pagination.decodeCursor(pagination.encodeCursor('*', 30, [1.0, 'Tom Smith'], use_pit=False))
+    self.assertIsNone(state['pit_id'])
+    self.assertFalse(state['use_pit'])
+
+  def test_invalid_cursor(self):
+    '''Test that cursors not built by encodeCursor are rejected'''
+    with self.assertRaises(ValueError):
+      pagination.decodeCursor('not-a-cursor')
+    with self.assertRaises(ValueError):
+      pagination.decodeCursor('e30')
+
+  def test_search_after(self):
+    '''Test that offset sort values get a tiebreaker when continued inside a point in time'''
+    self.assertEqual(pagination.searchAfter([1.0, 'Tom Smith'], None), [1.0, 'Tom Smith'])
+    self.assertEqual(len(pagination.searchAfter([1.0, 'Tom Smith'], 'pit-id')), 3)
+    self.assertEqual(pagination.searchAfter([1.0, 'Tom Smith', 4], 'pit-id'), [1.0, 'Tom Smith', 4])
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,42 @@
+'''Testing for methods in projection.py
+
+This file contains unit tests for the fields parameter and slim shape of search results
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import projection
+from API_Files.contact import toDict
+from API_Files.storage import MemoryStore
+
+class TestProjectionMethods(unittest.TestCase):
+  def test_parse_projection(self):
+    '''Test reading included and excluded fields, and rejecting unknown fields'''
+    self.assertIsNone(projection.parseProjection(''))
+    self.assertEqual(projection.parseProjection('fullname, phone'), (('fullname', 'phone'), ()))
+    self.assertEqual(projection.parseProjection('-email'), ((), ('email',)))
+    with self.assertRaises(ValueError):
+      projection.parseProjection('fullname,address')
+
+  def test_source_filter(self):
+    '''Test the Elasticsearch _source value of each projection'''
+    self.assertIs(projection.sourceFilter(None), True)
+    self.assertEqual(projection.sourceFilter((('fullname',), ())), ['fullname'])
+    self.assertEqual(projection.sourceFilter(((), ('email',))), {'includes': [], 'excludes': ['email']})
+
+  def test_slim_search(self):
+    '''Test that slim results hold only the selected fields, with the fullname first, the total, and the next cursor'''
+    store = MemoryStore([toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    hits, _ = store.search('doe', 10, fields=((), ('email', 'phone')), metadata=False)
+    self.assertEqual(hits['hits'], [{'_id': 'John Doe', '_source': {'fullname': 'John Doe', 'firstname': 'John', 'lastname': 'Doe'},
+      'sort': hits['hits'][0]['sort']}])
+    hits['next'] = None
+    hits['hits'][0]['_source'] = {'phone': '1234567890'}
+    self.assertEqual(projection.slim(hits), {'total': 1, 'contacts': [{'fullname': 'John Doe', 'phone': '1234567890'}], 'next': None})
+
+if __name__=='__main__':
+  unittest.main()
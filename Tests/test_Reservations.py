@@ -0,0 +1,76 @@
+'''Testing for methods in reservations.py
+
+This file contains unit tests for creating contacts with their reservations, including conflicts, rollbacks, and takeovers
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import contact, mappings, reservations, storage
+from fake_elasticsearch import FakeElasticsearch
+
+john = contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')
+jane = contact.toDict('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com')
+
+class TestCreateContacts(unittest.TestCase):
+  def setUp(self):
+    self.es = FakeElasticsearch()
+    mappings.ensureIndices(self.es)
+    self.assertEqual(reservations.createContacts([john], self.es), [(201, None)])
+
+  def reservation(self, field, value):
+    docs = self.es.data[mappings.currentIndex(reservations.reservation_index, self.es)]['docs']
+    doc = docs.get(reservations.reservationId(field, value))
+    return doc and doc['_source']['fullname']
+
+  def test_conflict(self):
+    '''Test that a contact using a phone number already in use is rejected, without keeping its other reservations'''
+    self.assertEqual(reservations.createContacts([dict(jane, phone=john['phone'])], self.es), [(409, 'phone')])
+    self.assertNotIn('Jane Doe', self.es.data[mappings.currentIndex('addressbook', self.es)]['docs'])
+    self.assertIsNone(self.reservation('email', jane['email']))
+    self.assertEqual(self.reservation('phone', john['phone']), 'John Doe')
+
+  def test_rollback(self):
+    '''Test that the reservations of a contact whose name is already used are removed again'''
+    self.assertEqual(reservations.createContacts([dict(jane, fullname='John Doe')], self.es), [(409, 'fullname')])
+    self.assertIsNone(self.reservation('phone', jane['phone']))
+    self.assertIsNone(self.reservation('email', jane['email']))
+    self.assertEqual(self.es.get(index='addressbook', id='John Doe')['_source'], john)
+
+  def test_takeover(self):
+    '''Test that a reservation whose contact no longer holds the value is taken over'''
+    self.es.index(index='addressbook', id='John Doe', body=dict(john, phone='1111111111'))
+    self.assertEqual(reservations.createContacts([dict(jane, phone=john['phone'])], self.es), [(201, None)])
+    self.assertEqual(self.reservation('phone', john['phone']), 'Jane Doe')
+
+  def test_rollback_after_takeover(self):
+    '''Test that rolling back a contact keeps a reservation another contact in the same request took over from it'''
+    results = reservations.createContacts([dict(john, phone='1111111111', email='new@example.com'), dict(jane, email='new@example.com')], self.es)
+    self.assertEqual(results, [(409, 'fullname'), (201, None)])
+    self.assertEqual(self.reservation('email', 'new@example.com'), 'Jane Doe')
+    self.assertIsNone(self.reservation('phone', '1111111111'))
+
+  def test_release(self):
+    '''Test that releasing values only removes the reservations the contact still holds'''
+    self.assertEqual(reservations.createContacts([jane], self.es), [(201, None)])
+    reservations.release({'phone': jane['phone'], 'email': jane['email']}, self.es, fullname='John Doe')
+    self.assertEqual(self.reservation('phone', jane['phone']), 'Jane Doe')
+    reservations.release(john, self.es)
+    self.assertIsNone(self.reservation('phone', john['phone']))
+    self.assertIsNone(self.reservation('email', john['email']))
+
+  def test_delete(self):
+    '''Test that deleting a contact releases its reservations, so its phone number and email address can be reused straight away'''
+    store = storage.ElasticStore(self.es)
+    self.assertEqual(store.delete('John Doe'), (200, None))
+    self.assertIsNone(self.reservation('phone', john['phone']))
+    self.assertIsNone(self.reservation('email', john['email']))
+    self.assertEqual(store.create([dict(jane, phone=john['phone'], email=john['email'])]), [(201, None)])
+    self.assertEqual(self.reservation('phone', john['phone']), 'Jane Doe')
+    self.assertEqual(store.delete('John Doe'), (404, None))
+
+if __name__=='__main__':
+  unittest.main()
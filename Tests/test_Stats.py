@@ -0,0 +1,77 @@
+'''Testing for methods in stats.py
+
+This file contains unit tests for the facet values of a contact, the statistics counters, and their reconciliation with the store
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import contact, stats, storage
+
+class TestFacetMethods(unittest.TestCase):
+  def test_facet_values(self):
+    '''Test the email domain and last name initial of contacts'''
+    self.assertEqual(stats.facetValues({'email': 'John@Example.COM', 'lastname': 'doe'}), {'domains': 'example.com', 'initials': 'D'})
+    self.assertEqual(stats.facetValues({'email': 'john', 'lastname': "'t Hooft"}), {'domains': None, 'initials': '#'})
+    self.assertEqual(stats.facetValues({'email': 'a@b@example.com', 'lastname': ''}), {'domains': 'example.com', 'initials': None})
+
+  def test_count_facets(self):
+    '''Test that the store counts every contact, leaving out empty last names'''
+    store = storage.MemoryStore([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com'),
+      contact.toDict('Jane Roe', 'Jane', 'Roe', '1234567891', 'jane@example.org'), contact.toDict('Jim', 'Jim', '', '1234567892', 'jim@example.com')])
+    self.assertEqual(store.facets(), {'total': 3, 'domains': {'example.com': 2, 'example.org': 1}, 'initials': {'D': 1, 'R': 1}})
+
+
+class TestContactStats(unittest.TestCase):
+  def setUp(self):
+    self.now = 0.0
+    self.store = storage.MemoryStore([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    self.stats = stats.ContactStats(reconcile_interval=60, clock=lambda: self.now)
+
+  def test_counters(self):
+    '''Test that changes are counted without reading the store again'''
+    self.stats.created(self.store, {'email': 'ignored@example.org', 'lastname': 'Roe'})
+    self.assertEqual(self.stats.summary(self.store)['total'], 1)
+    self.stats.created(self.store, {'email': 'jane@example.org', 'lastname': 'Roe'})
+    self.stats.updated(self.store, {'email': 'john@example.com', 'lastname': 'Doe'}, {'email': 'john@example.org', 'lastname': 'Doe'})
+    self.stats.deleted(self.store, {'email': 'jane@example.org', 'lastname': 'Roe'})
+    summary = self.stats.summary(self.store, limit=1)
+    self.assertEqual((summary['total'], summary['domains'], summary['other_domains']), (1, [{'domain': 'example.org', 'count': 1}], 0))
+    self.assertEqual(summary['initials'], [{'initial': 'D', 'count': 1}])
+    self.assertEqual(self.stats.stats(), {'books': 1, 'reconciles': 1, 'drift': 0})
+
+  def test_reconcile(self):
+    '''Test that writes the counters missed are counted once the counters are due'''
+    self.assertEqual(self.stats.summary(self.store)['total'], 1)
+    self.store.create([contact.toDict('Jane Roe', 'Jane', 'Roe', '1234567891', 'jane@example.com')])
+    self.now = 30.0
+    self.assertEqual(self.stats.summary(self.store)['total'], 1)
+    self.assertEqual(self.stats.summary(self.store, exact=True)['total'], 2)
+    self.store.delete('John Doe')
+    self.now = 120.0
+    summary = self.stats.summary(self.store)
+    self.assertEqual((summary['total'], summary['domains'], summary['reconciled']), (1, [{'domain': 'example.com', 'count': 1}], 0.0))
+    self.assertEqual(self.stats.stats(), {'books': 1, 'reconciles': 3, 'drift': 6})
+
+
+class TestStatsRequests(unittest.TestCase):
+  def test_requests(self):
+    '''Test that the statistics of each book follow its creates, updates, and deletes'''
+    from Address_Book import create_app
+    client = create_app(storage='memory').test_client()
+    client.post('/contact?fullname=John%20Doe&firstname=John&lastname=Doe&phone=1234567890&email=john@example.com')
+    self.assertEqual(client.get('/contact/_stats').get_json()['total'], 1)
+    client.post('/contact?fullname=Jane%20Roe&firstname=Jane&lastname=Roe&phone=1234567891&email=jane@example.org')
+    client.put('/contact/John Doe?lastname=Smith')
+    client.delete('/contact/Jane Roe')
+    client.post('/books/acme/contact?fullname=Jane%20Roe&lastname=Roe&phone=1234567891&email=jane@example.org')
+    summary = client.get('/contact/_stats').get_json()
+    self.assertLess(summary.pop('reconciled'), 60)
+    self.assertEqual(summary, {'total': 1, 'domains': [{'domain': 'example.com', 'count': 1}], 'other_domains': 0, 'initials': [{'initial': 'S', 'count': 1}]})
+    self.assertEqual(client.get('/books/acme/contact/_stats?exact=true').get_json()['domains'], [{'domain': 'example.org', 'count': 1}])
+
+if __name__=='__main__':
+  unittest.main()
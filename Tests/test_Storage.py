@@ -0,0 +1,135 @@
+'''Testing for methods in storage.py
+
+This file contains unit tests for the in-memory contact store, and for the API methods running on top of it
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from flask import Flask
+from API_Files import api_methods, cache, suggest
+from API_Files.contact import toDict
+from API_Files.storage import MemoryStore
+
+class TestMemoryStore(unittest.TestCase):
+  def setUp(self):
+    self.store = MemoryStore([
+      toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com'),
+      toDict('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com'),
+      toDict('Tom Smith', 'Tom', 'Smith', '1234567892', 'tom@example.com')
+    ])
+
+  def test_create_uniqueness(self):
+    '''Test that fullname, phone, and email must be unique, with email compared without case'''
+    results = self.store.create([
+      toDict('John Doe', '', '', '1234567899', 'new@example.com'),
+      toDict('New One', '', '', '1234567890', 'new@example.com'),
+      toDict('New Two', '', '', '1234567898', 'JANE@example.com'),
+      toDict('New Three', '', '', '1234567897', 'three@example.com'),
+      toDict('New Four', '', '', '1234567897', 'four@example.com')
+    ])
+    self.assertEqual(results, [(409, 'fullname'), (409, 'phone'), (409, 'email'), (201, None), (409, 'phone')])
+    self.assertEqual(self.store.count(), 4)
+
+  def test_exists_by_field(self):
+    '''Test hash index lookups on fullname, phone, and email'''
+    self.assertTrue(self.store.existsByField('fullname', 'John Doe'))
+    self.assertTrue(self.store.existsByField('email', 'John@Example.com'))
+    self.assertFalse(self.store.existsByField('phone', '1234567890', exclude='John Doe'))
+    self.assertFalse(self.store.existsByField('phone', '0000000000'))
+
+  def test_update_versions(self):
+    '''Test that updates are rejected when the contact changed since it was read, and that replaced values are freed'''
+    current = self.store.get('John Doe')
+    self.assertEqual(self.store.update(current, {'phone': '1234567891'}), (409, 'phone'))
+    self.assertEqual(self.store.update(current, {'phone': '5555555555'}), (200, None))
+    self.assertEqual(self.store.update(current, {'firstname': 'Johnny'}), (409, 'version'))
+    self.assertFalse(self.store.existsByField('phone', '1234567890'))
+    self.assertEqual(self.store.get('John Doe')['_source']['phone'], '5555555555')
+
+  def test_search(self):
+    '''Test that the inverted index ranks name matches first, and supports prefixes and search_after'''
+    hits, pit_id = self.store.search('doe', 10)
+    self.assertIsNone(pit_id)
+    self.assertEqual([hit['_id'] for hit in hits['hits']], ['Jane Doe', 'John Doe'])
+    hits, _ = self.store.search('smith OR jo*', 10)
+    self.assertEqual({hit['_id'] for hit in hits['hits']}, {'Tom Smith', 'John Doe'})
+    hits, _ = self.store.search('*', 2)
+    self.assertEqual(hits['total']['value'], 3)
+    after, _ = self.store.search('*', 2, search_after=hits['hits'][-1]['sort'])
+    self.assertEqual([hit['_id'] for hit in after['hits']], ['Tom Smith'])
+
+  def test_delete(self):
+    '''Test that deleted contacts are removed from every index'''
+    self.assertEqual(self.store.delete('Tom Smith'), (200, None))
+    self.assertEqual(self.store.delete('Tom Smith'), (404, None))
+    self.assertIsNone(self.store.get('Tom Smith'))
+    self.assertFalse(self.store.existsByField('email', 'tom@example.com'))
+    self.assertEqual(self.store.search('smith', 10)[0]['hits'], [])
+    self.assertEqual(self.store.suggest('to', 10), [])
+
+
+class TestMemoryAPI(unittest.TestCase):
+  def setUp(self):
+    self.context = Flask(__name__).app_context()
+    self.context.push()
+    self.store = MemoryStore()
+    api_methods.contact_cache = cache.ContactCache()
+    api_methods.name_index = suggest.PrefixIndex()
+
+  def tearDown(self):
+    self.context.pop()
+
+  def test_contact_lifecycle(self):
+    '''Test creating, updating, retrieving, searching, and deleting a contact without Elasticsearch'''
+    result = api_methods.createContact('John Doe', 'John', 'Doe', '1234567890', 'john@example.com', self.store)
+    self.assertEqual(result, 'Contact for John Doe has been successfully created.')
+    result = api_methods.createContact('Jane Doe', 'Jane', 'Doe', '1234567890', 'jane@example.com', self.store)
+    self.assertEqual(result.status_code, 400)
+
+    result = api_methods.updateContact('John Doe', 'Johnny', '', '', 'johnny@example.com', self.store)
+    self.assertEqual(result, 'Contact John Doe has been successfully updated.')
+    self.assertEqual(api_methods.getContact('John Doe', self.store)['email'], 'johnny@example.com')
+    self.assertEqual(api_methods.getAllContacts(10, 1, 'johnny', self.store)['hits'][0]['_id'], 'John Doe')
+    self.assertEqual(api_methods.suggestContacts('joh', 10, self.store)['suggestions'][0]['firstname'], 'Johnny')
+
+    result = api_methods.deleteContact('John Doe', self.store)
+    self.assertEqual(result, 'Contact information for John Doe has successfully been deleted.')
+    self.assertEqual(api_methods.getContact('John Doe', self.store).status_code, 400)
+    self.assertEqual(api_methods.deleteContact('John Doe', self.store).status_code, 400)
+
+  def test_get_many(self):
+    '''Test that several contacts are read in one store call, with cached contacts skipped and missing names reported per item'''
+    for number in range(3):
+      api_methods.createContact('Contact '+str(number), '', '', '123456789'+str(number), str(number)+'@example.com', self.store)
+    api_methods.getContact('Contact 0', self.store)
+    calls = []
+    getMany = self.store.getMany
+    self.store.getMany = lambda fullnames, fields=None: calls.append(list(fullnames)) or getMany(fullnames, fields)
+    result = api_methods.getContacts(['Contact 0', 'Contact 1', 'Nobody', 'Contact 1'], None, self.store)
+    self.assertEqual(calls, [['Contact 1', 'Nobody']])
+    self.assertEqual([doc['found'] for doc in result['docs']], [True, True, False, True])
+    self.assertEqual((result['found'], result['missing']), (3, 1))
+    result = api_methods.getContacts(['Contact 2'], ['phone'], self.store)
+    self.assertEqual(result['docs'][0]['contact'], {'phone': '1234567892'})
+    self.assertEqual(api_methods.getContacts([], None, self.store).status_code, 400)
+
+  def test_cursor_pages(self):
+    '''Test that cursors page through every contact in the memory store'''
+    for number in range(5):
+      api_methods.createContact('Contact '+str(number), '', '', '123456789'+str(number), str(number)+'@example.com', self.store)
+    names = []
+    page = api_methods.getAllContacts(2, 1, '*', self.store)
+    while True:
+      names.extend(hit['_id'] for hit in page['hits'])
+      if not page['next']:
+        break
+      page = api_methods.getAllContacts(2, 1, '*', self.store, page['next'])
+    self.assertEqual(names, ['Contact '+str(number) for number in range(5)])
+
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,49 @@
+'''Testing for methods in suggest.py
+
+This file contains unit tests for the in-memory name index used to complete contact names
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files.suggest import PrefixIndex
+
+class TestSuggestMethods(unittest.TestCase):
+  def setUp(self):
+    self.index = PrefixIndex()
+    self.index.reset([
+      {'fullname': 'John Doe', 'firstname': 'John', 'lastname': 'Doe'},
+      {'fullname': 'Jane Doe', 'firstname': 'Jane', 'lastname': 'Doe'},
+      {'fullname': 'Tom Smith', 'firstname': 'Tom', 'lastname': 'Smith'},
+      {'fullname': 'Doctor Jones', 'firstname': '', 'lastname': 'Jones'}
+    ])
+
+  def test_fullname_prefix(self):
+    '''Test that fullname matches are returned before matches on other words'''
+    names = [result['fullname'] for result in self.index.search('Do', 10)]
+    self.assertEqual(names, ['Doctor Jones', 'Jane Doe', 'John Doe'])
+
+  def test_word_prefixes(self):
+    '''Test that each word of the prefix must start a word of the contacts names'''
+    self.assertEqual([result['fullname'] for result in self.index.search('doe ja', 10)], ['Jane Doe'])
+    self.assertEqual([result['fullname'] for result in self.index.search('smi', 10)], ['Tom Smith'])
+    self.assertEqual(self.index.search('x', 10), [])
+
+  def test_limit_and_fields(self):
+    '''Test that only names and ids are returned, up to the limit'''
+    results = self.index.search('j', 2)
+    self.assertEqual(len(results), 2)
+    self.assertEqual(set(results[0]), {'id', 'fullname', 'firstname', 'lastname'})
+
+  def test_add_and_remove(self):
+    '''Test that changes to contacts are reflected in suggestions'''
+    self.index.add({'fullname': 'Tom Smith', 'firstname': 'Thomas', 'lastname': 'Smith'})
+    self.assertEqual(self.index.search('thom', 10)[0]['firstname'], 'Thomas')
+    self.index.remove('Tom Smith')
+    self.assertEqual(self.index.search('smith', 10), [])
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,133 @@
+'''Testing for methods in write_behind.py
+
+This file contains unit tests for journaled writes, coalescing, reads of pending writes, flushes, and replay of the journal
+This file can be run independently from Address_Book.py and Elastic Search instances
+
+'''
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import sys
+sys.path.append('..')
+
+from API_Files import contact, storage, write_behind
+
+class TestWriteBehindStore(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.journal = os.path.join(self.directory, 'addressbook.journal')
+    self.backend = storage.MemoryStore([contact.toDict('Jane Doe', 'Jane', 'Doe', '1234567891', 'jane@example.com')])
+    self.store = self.openStore()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def openStore(self):
+    # A long interval keeps the background thread from flushing while a test runs
+    return write_behind.WriteBehindStore(self.backend, self.journal, flush_interval=3600, fsync=False)
+
+  def test_read_your_writes(self):
+    '''Test that pending writes are read back before they reach the store'''
+    self.assertEqual(self.store.create([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')]), [(201, None)])
+    self.assertIsNone(self.backend.get('John Doe'))
+    self.assertEqual(self.store.get('John Doe')['_source']['phone'], '1234567890')
+    self.store.delete('Jane Doe')
+    self.assertIsNone(self.store.get('Jane Doe'))
+    self.assertEqual([hit['_id'] for hit in self.store.search('doe', 10)[0]['hits']], [])
+    self.assertEqual(self.store.count(), 1)
+
+  def test_coalesce_and_flush(self):
+    '''Test that several writes to a contact are flushed as its latest state'''
+    self.store.create([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    for firstname in ('Johnny', 'Jack'):
+      current = self.store.get('John Doe')
+      self.assertEqual(self.store.update(current, {'firstname': firstname}), (200, None))
+    self.assertEqual(self.store.update(self.backend.get('Jane Doe'), {'lastname': 'Roe'}), (200, None))
+    self.assertEqual(self.store.stats()['pending'], 2)
+    self.assertEqual(self.store.flush(), 2)
+    self.assertEqual(self.backend.get('John Doe')['_source']['firstname'], 'Jack')
+    self.assertEqual(self.backend.get('Jane Doe')['_source']['lastname'], 'Roe')
+    self.assertEqual(self.store.stats(), {'pending': 0, 'flushing': 0, 'flushed': 2, 'failed': 0})
+
+  def test_uniqueness(self):
+    '''Test that values held by pending contacts are in use, and values they released are free'''
+    self.store.create([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    self.assertEqual(self.store.create([contact.toDict('John Roe', 'John', 'Roe', '1234567890', 'roe@example.com')]), [(409, 'phone')])
+    self.assertEqual(self.store.create([contact.toDict('Jim Doe', 'Jim', 'Doe', '1234567892', 'jane@example.com')]), [(409, 'email')])
+    self.store.update(self.store.get('Jane Doe'), {'email': 'jane.doe@example.com'})
+    self.assertEqual(self.store.create([contact.toDict('Jim Doe', 'Jim', 'Doe', '1234567892', 'jane@example.com')]), [(201, None)])
+    self.store.flush()
+    self.assertEqual(self.backend.get('Jim Doe')['_source']['email'], 'jane@example.com')
+    self.assertEqual(self.store.stats()['failed'], 0)
+
+  def test_write_by_another_process(self):
+    '''Test that a journaled update or delete is not flushed over a newer write made by another process'''
+    self.backend.create([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    self.assertEqual(self.store.update(self.store.get('Jane Doe'), {'lastname': 'Roe'}), (200, None))
+    self.assertEqual(self.store.update(self.store.get('Jane Doe'), {'firstname': 'Janet'}), (200, None))
+    self.assertEqual(self.store.delete('John Doe', self.store.get('John Doe')), (200, None))
+    self.assertEqual(self.backend.update(self.backend.get('Jane Doe'), {'lastname': 'Smith'}), (200, None))
+    self.assertEqual(self.backend.update(self.backend.get('John Doe'), {'firstname': 'Johnny'}), (200, None))
+    self.store.flush()
+    self.assertEqual(self.backend.get('Jane Doe')['_source']['firstname'], 'Jane')
+    self.assertEqual(self.backend.get('Jane Doe')['_source']['lastname'], 'Smith')
+    self.assertEqual(self.backend.get('John Doe')['_source']['firstname'], 'Johnny')
+    self.assertEqual(sorted(self.store.failures), [('Jane Doe', 409, 'version'), ('John Doe', 409, 'version')])
+
+  def test_replay(self):
+    '''Test that writes left in the journal are flushed by the next store'''
+    self.store.create([contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')])
+    self.store.delete('Jane Doe')
+    replayed = self.openStore()
+    self.assertEqual(replayed.stats()['pending'], 2)
+    self.assertEqual(replayed.get('John Doe')['_source']['email'], 'john@example.com')
+    replayed.flush()
+    self.assertIsNotNone(self.backend.get('John Doe'))
+    self.assertIsNone(self.backend.get('Jane Doe'))
+    self.assertFalse(os.path.exists(replayed.journal_path+'.flushing'))
+
+  def test_stopped_process(self):
+    '''Test that the journals of stopped processes are flushed by the next store, and those of running processes are left alone'''
+    stopped = subprocess.Popen([sys.executable, '-c', 'pass'])
+    stopped.wait()
+    john = contact.toDict('John Doe', 'John', 'Doe', '1234567890', 'john@example.com')
+    jane = self.backend.get('Jane Doe')['_source']
+    for pid, record in ((stopped.pid, {'fullname': 'John Doe', 'source': john, 'changes': None, 'base': None}),
+        (os.getppid(), {'fullname': 'Jane Doe', 'source': None, 'changes': None, 'base': jane})):
+      with open(self.journal+'-'+str(pid), 'w', encoding='utf-8') as journal:
+        journal.write(json.dumps(record)+'\n')
+    replayed = self.openStore()
+    self.assertEqual(replayed.stats()['pending'], 1)
+    self.assertEqual(replayed.get('John Doe')['_source']['email'], 'john@example.com')
+    self.assertEqual(sorted(os.listdir(self.directory)), sorted(os.path.basename(path) for path in (replayed.journal_path, self.journal+'-'+str(os.getppid()))))
+    replayed.flush()
+    self.assertIsNotNone(self.backend.get('John Doe'))
+    self.assertIsNotNone(self.backend.get('Jane Doe'))
+
+
+class TestWriteBehindRequests(unittest.TestCase):
+  def test_requests(self):
+    '''Test that the app acknowledges writes before they are flushed and serves them back'''
+    from Address_Book import create_app
+    directory = tempfile.mkdtemp()
+    try:
+      app = create_app(storage='memory', write_behind=True, journal_path=os.path.join(directory, 'journal'), flush_interval=3600,
+        journal_fsync=False)
+      client = app.test_client()
+      client.post('/contact?fullname=John%20Doe&firstname=John&phone=1234567890&email=john@example.com')
+      client.put('/contact/John Doe?firstname=Johnny')
+      self.assertEqual(client.get('/contact/John Doe').get_json()['firstname'], 'Johnny')
+      store = app.extensions['addressbook'].get()
+      self.assertIsNone(store.store.get('John Doe'))
+      store.flush()
+      self.assertEqual(store.store.get('John Doe')['_source']['firstname'], 'Johnny')
+      self.assertIn('addressbook_write_behind_flushed 1', client.get('/metrics').get_data(as_text=True))
+    finally:
+      shutil.rmtree(directory)
+
+if __name__=='__main__':
+  unittest.main()